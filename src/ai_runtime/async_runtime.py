@@ -0,0 +1,105 @@
+import asyncio
+import time
+import weakref
+from typing import Any, Optional
+from python_runtime.probe import Probed
+from ai_runtime.runtime import UNKNOWN_RESPONSE_FORMAT, AIRuntime, EventContent
+import martian
+
+
+class AsyncAIRuntime(AIRuntime):
+    """
+    AIRuntime for probed objects living inside asyncio programs.
+
+    Awaited probed coroutine functions use the async model clients, so the
+    event loop keeps running other tasks while a decision is pending. At most
+    `max_concurrency` model calls are in flight at once. Synchronous probed
+    calls still work and behave exactly like AIRuntime.
+    """
+
+    def __init__(self, *args: Any, max_concurrency: int = 8, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.max_concurrency = max_concurrency
+        self._semaphores: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, asyncio.Semaphore
+        ] = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Semaphores belong to one event loop, keep one per running loop.
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def _use_martian(
+        self, probed: "Probed", prompt: str, prompt_type: str
+    ) -> str:
+        calls = []
+        model_output = ""
+        async with self._semaphore():
+            start = time.perf_counter()
+            try:
+                model_output = await martian.use_martian_async(
+                    prompt,
+                    "",
+                    "",
+                    prompt_type=prompt_type,
+                    on_usage=lambda *usage: calls.append(usage),
+                )
+            finally:
+                self._record_usage(
+                    probed, prompt, model_output, calls, time.perf_counter() - start
+                )
+        return model_output
+
+    async def adecide_and_respond(
+        self, probed: "Probed", event_content: EventContent, result_schema: str
+    ) -> tuple[bool, bool, bool, Any]:
+        # The lookup reads user_query.md and may read a persistent decision
+        # store, keep that file I/O off the event loop.
+        early, user_additional_query, cache_key = await asyncio.to_thread(
+            self._lookup_decision, probed, event_content
+        )
+        if early is not None:
+            return early
+        history = self.probed_objects[probed]
+        slot = history.reserve()
+        try:
+            prompt, prompt_type = self._decision_prompt(
+                probed,
+                event_content,
+                user_additional_query,
+                (result_schema or UNKNOWN_RESPONSE_FORMAT) if self.fused else None,
+            )
+            model_output = await self._use_martian(probed, prompt, prompt_type)
+            return self._apply_decision(
+                probed, event_content, cache_key, model_output, slot
+            )
+        finally:
+            history.commit(slot)
+
+    async def alisten_event(
+        self, probed: "Probed", event_content: EventContent, result: str
+    ) -> None:
+        if self.observer is not None:
+            self.listen_event(probed, event_content, result)
+            return
+        prompt = self._listen_prompt(probed, event_content, result)
+        if prompt is not None:
+            await self._use_martian(probed, prompt, "LISTEN_EVENT")
+        self._record_result(probed, result)
+
+    async def arespond_event(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        result_schema: str,
+        result_example: Optional[str],
+    ) -> Any:
+        if not self._can_respond(probed):
+            return result_example
+        prompt = self._respond_prompt(probed, event_content, result_schema)
+        model_output = await self._use_martian(probed, prompt, "RESPOND_EVENT")
+        return self._apply_response(probed, model_output)
@@ -0,0 +1,262 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Hashable, Optional
+
+# What a probed object falls back to once one of its budgets is used up.
+FULL = "full"
+# Only decisions already in the cache are used, other calls pass through.
+CACHED_ONLY = "cached_only"
+# Only `sample_rate` of the calls are still sent to the model.
+SAMPLED = "sampled"
+# No model call and no cache lookup, every call passes through.
+PASS_THROUGH = "pass_through"
+
+DEGRADED_MODES = (CACHED_ONLY, SAMPLED, PASS_THROUGH)
+
+# USD per million prompt and completion tokens.
+MODEL_PRICES = {
+    "gemini-2.5-flash": (0.30, 2.50),
+    "google/gemini-2.5-flash:cheap": (0.30, 2.50),
+    "cohere/command-a": (2.50, 10.00),
+}
+# Used for models missing from the table.
+DEFAULT_PRICE = (0.30, 2.50)
+
+
+def usage_cost(
+    model: Optional[str],
+    prompt_tokens: int,
+    completion_tokens: int,
+    prices: dict[str, tuple[float, float]] = MODEL_PRICES,
+) -> float:
+    prompt_price, completion_price = prices.get(model, DEFAULT_PRICE)
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1e6
+
+
+def _label(probed: Hashable) -> str:
+    # str() of a probed object is itself a probed call, use its prefix.
+    prefix = getattr(probed, "_prefix", None)
+    return prefix if isinstance(prefix, str) else repr(probed)
+
+
+class BudgetLimits:
+    """
+    Limits on the model usage of one scope (a probed object, or the whole
+    runtime). Tokens count prompt and completion tokens, cost is in USD and
+    seconds is the wall time spent waiting on the model. Per minute limits
+    apply to a sliding window of the last minute, per run limits to the
+    lifetime of the runtime. None means unlimited.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: Optional[int] = None,
+        cost_per_minute: Optional[float] = None,
+        seconds_per_minute: Optional[float] = None,
+        tokens_per_run: Optional[int] = None,
+        cost_per_run: Optional[float] = None,
+        seconds_per_run: Optional[float] = None,
+    ):
+        self.tokens_per_minute = tokens_per_minute
+        self.cost_per_minute = cost_per_minute
+        self.seconds_per_minute = seconds_per_minute
+        self.tokens_per_run = tokens_per_run
+        self.cost_per_run = cost_per_run
+        self.seconds_per_run = seconds_per_run
+
+
+class Usage:
+    """Model usage of one scope, in total and over the last `window` seconds."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.seconds = 0.0
+        self._recent: deque[tuple[float, int, float, float]] = deque()
+        self._recent_totals = [0, 0.0, 0.0]
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(
+        self,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cost: float,
+        seconds: float,
+        now: float,
+    ) -> None:
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        self.seconds += seconds
+        tokens = prompt_tokens + completion_tokens
+        self._recent.append((now, tokens, cost, seconds))
+        self._recent_totals[0] += tokens
+        self._recent_totals[1] += cost
+        self._recent_totals[2] += seconds
+
+    def recent(self, now: float) -> tuple[int, float, float]:
+        """Tokens, cost and seconds of the calls made in the last window."""
+        while self._recent and self._recent[0][0] <= now - self.window:
+            _, tokens, cost, seconds = self._recent.popleft()
+            self._recent_totals[0] -= tokens
+            self._recent_totals[1] -= cost
+            self._recent_totals[2] -= seconds
+        if not self._recent:
+            # Avoid drifting float totals once the window is empty.
+            self._recent_totals = [0, 0.0, 0.0]
+        tokens, cost, seconds = self._recent_totals
+        return tokens, cost, seconds
+
+    def exceeded(self, limits: BudgetLimits, now: float) -> Optional[str]:
+        """Name of the first limit that is used up, None while all have room."""
+        run = (
+            ("tokens_per_run", self.tokens),
+            ("cost_per_run", self.cost),
+            ("seconds_per_run", self.seconds),
+        )
+        for name, used in run:
+            limit = getattr(limits, name)
+            if limit is not None and used >= limit:
+                return name
+        tokens, cost, seconds = self.recent(now)
+        minute = (
+            ("tokens_per_minute", tokens),
+            ("cost_per_minute", cost),
+            ("seconds_per_minute", seconds),
+        )
+        for name, used in minute:
+            limit = getattr(limits, name)
+            if limit is not None and used >= limit:
+                return name
+        return None
+
+    def to_dict(self, now: float) -> dict[str, Any]:
+        tokens, cost, seconds = self.recent(now)
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": round(self.cost, 6),
+            "seconds": round(self.seconds, 3),
+            "last_minute": {
+                "tokens": tokens,
+                "cost": round(cost, 6),
+                "seconds": round(seconds, 3),
+            },
+        }
+
+
+class Budget:
+    """
+    Token, cost and latency budgets of an AIRuntime, per probed object and for
+    the runtime as a whole.
+
+    Every model call is recorded with the usage the provider reported (or an
+    estimate when it reported none) and the time it took. Before a call is
+    sent, `mode` checks the limits of the probed object and the global ones;
+    once either is used up the object degrades to `degrade_to`: CACHED_ONLY,
+    SAMPLED or PASS_THROUGH. Per minute limits recover as the window moves
+    on, per run limits stay used up until `reset`.
+    """
+
+    def __init__(
+        self,
+        per_probe: Optional[BudgetLimits] = None,
+        total: Optional[BudgetLimits] = None,
+        degrade_to: str = CACHED_ONLY,
+        sample_rate: float = 0.1,
+        prices: Optional[dict[str, tuple[float, float]]] = None,
+        window: float = 60.0,
+    ):
+        if degrade_to not in DEGRADED_MODES:
+            raise ValueError(
+                f"degrade_to must be one of {', '.join(DEGRADED_MODES)}, got {degrade_to!r}"
+            )
+        self.per_probe = per_probe
+        self.total = total
+        self.degrade_to = degrade_to
+        self.sample_rate = sample_rate
+        self.prices = prices if prices is not None else MODEL_PRICES
+        self.window = window
+        self._lock = threading.Lock()
+        self.total_usage = Usage(window)
+        self.probe_usage: dict[Hashable, Usage] = {}
+        # Why each degraded probed object is degraded, e.g. "cost_per_run".
+        self.exhausted: dict[Hashable, str] = {}
+
+    def record(
+        self,
+        probed: Hashable,
+        model: Optional[str],
+        prompt_tokens: int,
+        completion_tokens: int,
+        seconds: float,
+    ) -> float:
+        """Adds one model call to the usage of probed and returns its cost."""
+        cost = usage_cost(model, prompt_tokens, completion_tokens, self.prices)
+        now = time.monotonic()
+        with self._lock:
+            usage = self.probe_usage.get(probed)
+            if usage is None:
+                usage = self.probe_usage[probed] = Usage(self.window)
+            usage.add(prompt_tokens, completion_tokens, cost, seconds, now)
+            self.total_usage.add(prompt_tokens, completion_tokens, cost, seconds, now)
+        return cost
+
+    def mode(self, probed: Hashable) -> str:
+        """FULL while probed and the runtime have budget left, else degrade_to."""
+        if self.total is None and self.per_probe is None:
+            return FULL
+        now = time.monotonic()
+        with self._lock:
+            reason = None
+            if self.total is not None:
+                reason = self.total_usage.exceeded(self.total, now)
+                if reason is not None:
+                    reason = f"total {reason}"
+            usage = self.probe_usage.get(probed)
+            if reason is None and self.per_probe is not None and usage is not None:
+                reason = usage.exceeded(self.per_probe, now)
+            if reason is None:
+                self.exhausted.pop(probed, None)
+                return FULL
+            self.exhausted[probed] = reason
+        return self.degrade_to
+
+    def admits(self, mode: str) -> bool:
+        """Whether a call in this mode may still be sent to the model."""
+        if mode == FULL:
+            return True
+        if mode == SAMPLED:
+            return random.random() < self.sample_rate
+        return False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.total_usage = Usage(self.window)
+            self.probe_usage.clear()
+            self.exhausted.clear()
+
+    def report(self) -> dict[str, Any]:
+        """Usage so far, globally and per probed object, as plain data."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "total": self.total_usage.to_dict(now),
+                "probes": {
+                    _label(probed): usage.to_dict(now)
+                    for probed, usage in self.probe_usage.items()
+                },
+                "degraded": {
+                    _label(probed): reason for probed, reason in self.exhausted.items()
+                },
+            }
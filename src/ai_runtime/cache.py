@@ -0,0 +1,196 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+Decision = tuple[bool, bool, bool]
+
+
+def event_fingerprint(event_content: Any) -> str:
+    """
+    Normalizes an event payload so that equivalent calls produce the same text,
+    regardless of key order or indentation. Accepts a ProbeEvent or its json.
+    """
+    to_dict = getattr(event_content, "to_dict", None)
+    if to_dict is not None:
+        return json.dumps(
+            to_dict(), sort_keys=True, separators=(",", ":"), default=repr
+        )
+    try:
+        return json.dumps(
+            json.loads(event_content), sort_keys=True, separators=(",", ":")
+        )
+    except (TypeError, ValueError):
+        return " ".join(str(event_content).split())
+
+
+def decision_key(event_content: Any, instructions: str, user_query: str) -> str:
+    digest = hashlib.sha256()
+    for part in (event_fingerprint(event_content), instructions, user_query):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class DecisionStore:
+    """
+    Backing store consulted by a DecisionCache when an entry is not in memory.
+    """
+
+    def load(self, key: str) -> Optional[tuple[Decision, float]]:
+        return None
+
+    def save(self, key: str, decision: Decision, created_at: float) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class SqliteDecisionStore(DecisionStore):
+    """
+    Keeps decisions in a small sqlite file so they survive between runs.
+    """
+
+    def __init__(self, path: str = "decision_cache.sqlite3"):
+        import sqlite3
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS decisions ("
+                "key TEXT PRIMARY KEY, decision TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def load(self, key: str) -> Optional[tuple[Decision, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT decision, created_at FROM decisions WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return tuple(json.loads(row[0])), row[1]
+
+    def save(self, key: str, decision: Decision, created_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?)",
+                (key, json.dumps(list(decision)), created_at),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM decisions")
+            self._conn.commit()
+
+
+class DecisionCache:
+    """
+    Interface for caches consulted before asking the model for a decision.
+    The base class never hits, which disables caching.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Decision]:
+        self.misses += 1
+        return None
+
+    def put(self, key: str, decision: Decision) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class LRUDecisionCache(DecisionCache):
+    """
+    In-memory decision cache bounded by size (least recently used entries are
+    evicted first) and by age (entries older than `ttl` seconds are ignored).
+    An optional DecisionStore backs the memory layer, e.g. SqliteDecisionStore.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl: Optional[float] = 300.0,
+        store: Optional[DecisionStore] = None,
+    ):
+        super().__init__()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.store = store
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[Decision, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.monotonic() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[Decision]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.evictions += 1
+
+        if self.store is not None:
+            stored = self.store.load(key)
+            if stored is not None:
+                decision, created_at = stored
+                # The store keeps wall-clock time, memory keeps monotonic time.
+                age = time.time() - created_at
+                if self.ttl is None or age <= self.ttl:
+                    with self._lock:
+                        self._insert(key, decision, time.monotonic() - age)
+                        self.hits += 1
+                    return decision
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, decision: Decision) -> None:
+        with self._lock:
+            self._insert(key, decision, time.monotonic())
+        if self.store is not None:
+            self.store.save(key, decision, time.time())
+
+    def _insert(self, key: str, decision: Decision, created_at: float) -> None:
+        self._entries[key] = (decision, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
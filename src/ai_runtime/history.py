@@ -0,0 +1,144 @@
+import threading
+from collections import deque
+from typing import Iterable, Optional
+from ai_runtime.prompts import HISTORY_DIGEST_TEMPLATE
+
+DECISION = "decision"
+RESULT = "result"
+RESPONSE = "response"
+
+# Rough conversion used when a budget is given in tokens instead of bytes.
+BYTES_PER_TOKEN = 4
+
+
+class ProbeHistory:
+    """
+    Event log of a single probed object, rendered into the prompts.
+
+    Events are kept verbatim while they fit in `max_bytes`. Once the window is
+    full the oldest events are rolled up into a compact digest (counts of
+    decisions, results and responses plus the latest of each), so the rendered
+    history stays roughly the same size however long the object lives.
+
+    A history may be shared by threads using the same probed object. Its lock
+    is only held while reading or changing it, never while a model is asked.
+    A writer whose entries are only known after a model call takes a slot
+    with `reserve` when its event starts and fills it with `commit`. Commits
+    are applied in slot order, so a slow call delays the entries of later
+    events instead of being overtaken by them, and no update is lost.
+    """
+
+    def __init__(
+        self,
+        header: str,
+        max_bytes: Optional[int] = 16_000,
+        max_tokens: Optional[int] = None,
+    ):
+        self.header = header
+        if max_tokens is not None:
+            max_bytes = max_tokens * BYTES_PER_TOKEN
+        self.max_bytes = max_bytes
+        self.events: deque[tuple[str, str, tuple[bool, ...]]] = deque()
+        self.size = 0
+        self.rolled_up = {DECISION: 0, RESULT: 0, RESPONSE: 0}
+        self.interrupted = 0
+        self.reported = 0
+        self.stopped = 0
+        self.last_result = "None"
+        self.last_response = "None"
+        self._rendered: Optional[str] = None
+        self._lock = threading.Lock()
+        self._next_slot = 0
+        self._applied = 0
+        self._waiting: dict[int, list[tuple[str, str, tuple[bool, ...]]]] = {}
+
+    def append(self, kind: str, text: str, flags: tuple[bool, ...] = ()) -> None:
+        """Adds an entry after those of every slot reserved so far."""
+        with self._lock:
+            if self._next_slot == self._applied:
+                # No slot is pending, nothing has to come before it.
+                self._append(kind, text, flags)
+            else:
+                self._waiting[self._next_slot] = [(kind, text, flags)]
+                self._next_slot += 1
+
+    def reserve(self) -> int:
+        """Takes the next slot; it must be committed, even with no entries."""
+        with self._lock:
+            slot = self._next_slot
+            self._next_slot += 1
+            return slot
+
+    def commit(
+        self, slot: int, entries: Iterable[tuple[str, str, tuple[bool, ...]]] = ()
+    ) -> None:
+        """
+        Fills a reserved slot. The entries are applied once every earlier slot
+        has been committed. Committing a slot again does nothing.
+        """
+        with self._lock:
+            if slot < self._applied or slot in self._waiting:
+                return
+            self._waiting[slot] = list(entries)
+            while self._applied in self._waiting:
+                for entry in self._waiting.pop(self._applied):
+                    self._append(*entry)
+                self._applied += 1
+
+    def _append(self, kind: str, text: str, flags: tuple[bool, ...]) -> None:
+        if self.max_bytes is not None and len(text) > self.max_bytes // 2:
+            text = text[: self.max_bytes // 2] + "\n... (truncated)"
+        self.events.append((kind, text, flags))
+        self.size += len(text) + 1
+        if self.max_bytes is not None:
+            while self.size > self.max_bytes and len(self.events) > 1:
+                self._roll_up(*self.events.popleft())
+        self._rendered = None
+
+    def _roll_up(self, kind: str, text: str, flags: tuple[bool, ...]) -> None:
+        self.size -= len(text) + 1
+        self.rolled_up[kind] += 1
+        if kind == DECISION:
+            interrupted, reported, stopped = flags
+            self.interrupted += interrupted
+            self.reported += reported
+            self.stopped += stopped
+        elif kind == RESULT:
+            self.last_result = text.strip()
+        elif kind == RESPONSE:
+            self.last_response = text.strip()
+
+    def digest(self) -> str:
+        with self._lock:
+            return self._digest()
+
+    def _digest(self) -> str:
+        events = sum(self.rolled_up.values())
+        if not events:
+            return ""
+        return HISTORY_DIGEST_TEMPLATE.format(
+            events=events,
+            decisions=self.rolled_up[DECISION],
+            interrupted=self.interrupted,
+            reported=self.reported,
+            stopped=self.stopped,
+            results=self.rolled_up[RESULT],
+            last_result=self.last_result,
+            responses=self.rolled_up[RESPONSE],
+            last_response=self.last_response,
+        )
+
+    def render(self) -> str:
+        with self._lock:
+            if self._rendered is None:
+                parts = [self.header, self._digest()]
+                parts.extend(text for _, text, _ in self.events)
+                self._rendered = "\n".join(part for part in parts if part)
+            return self._rendered
+
+    def __str__(self) -> str:
+        return self.render()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.events)
@@ -0,0 +1,73 @@
+import atexit
+import logging
+import queue
+import threading
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EventObserver:
+    """
+    Runs model calls on background worker threads so the probed program does
+    not wait for them.
+
+    Work is sharded by probed object: every task submitted for the same key
+    lands on the same worker queue, so events of one object are processed in
+    the order they happened while different objects progress in parallel.
+    """
+
+    def __init__(self, workers: int = 4):
+        self._queues: list[queue.Queue] = []
+        self._threads: list[threading.Thread] = []
+        self._closed = False
+        for index in range(max(1, workers)):
+            tasks: queue.Queue = queue.Queue()
+            thread = threading.Thread(
+                target=self._run,
+                args=(tasks,),
+                name=f"ai-runtime-observer-{index}",
+                daemon=True,
+            )
+            thread.start()
+            self._queues.append(tasks)
+            self._threads.append(thread)
+        atexit.register(self.close)
+
+    def submit(
+        self, key: Hashable, fn: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> None:
+        if self._closed:
+            fn(*args, **kwargs)
+            return
+        self._queues[hash(key) % len(self._queues)].put((fn, args, kwargs))
+
+    def flush(self) -> None:
+        """Blocks until every task submitted so far has been processed."""
+        for tasks in self._queues:
+            tasks.join()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for tasks in self._queues:
+            tasks.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    @staticmethod
+    def _run(tasks: queue.Queue) -> None:
+        while True:
+            item = tasks.get()
+            try:
+                if item is _STOP:
+                    return
+                fn, args, kwargs = item
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception("observed model call failed")
+            finally:
+                tasks.task_done()
@@ -85,3 +85,37 @@ LISTENING_HISTORY_TEMPLATE = """
 The result of the event was:
 {result}
 """
+
+HISTORY_DIGEST_TEMPLATE = """
+Summary of {events} earlier events that are no longer listed in detail:
+- {decisions} decisions: {interrupted} interrupted, {reported} reported, {stopped} stopped.
+- {results} operation results were observed, the last one was:
+{last_result}
+- {responses} responses were provided instead of the real operation, the last one was:
+{last_response}
+"""
+
+DECIDE_AND_RESPOND = """
+What happened so far with this object:
+{history}
+
+User additional query (if any):
+{user_additional_query}
+
+An event is happening that is a method/function call on the object. The event is:
+{event_content}
+Do you want to interrupt this operation?
+Do you think this operation should be reported back to the developer?
+Should we stop the program before this operation happens?
+If you decide to interrupt the operation, also provide the response that will be returned instead of the actual operation result.
+That response should conform to the following schema:
+{response_format}
+The answer json schema is:
+{{
+    "should_interrupt": bool,
+    "should_report": bool,
+    "should_stop": bool,
+    "response": the response described above if should_interrupt is true, otherwise null
+}}
+Your answer should be just a valid json object that conforms to the schema above and nothing else.
+"""
@@ -1,20 +1,122 @@
 import json
-from python_runtime.probe import Probed, Runtime
+import logging
+import time
+from typing import Any, Optional
+from python_runtime.probe import (
+    NO_RESPONSE,
+    ProbeEvent,
+    Probed,
+    Runtime,
+    report_event,
+)
+from python_runtime.policy import ProbePolicy
+from python_runtime.tracing import add, span
+from ai_runtime.budget import FULL, PASS_THROUGH, Budget
+from ai_runtime.cache import DecisionCache, decision_key
+from ai_runtime.history import DECISION, RESPONSE, RESULT, ProbeHistory
+from ai_runtime.observer import EventObserver
 from ai_runtime.prompts import (
     DECISION_HISTORY_TEMPLATE,
     INIT,
     LISTENING_HISTORY_TEMPLATE,
     RESPONDING_HISTORY_TEMPLATE,
     ASK_MODEL_DECISION,
+    DECIDE_AND_RESPOND,
     RESPOND_EVENT,
     LISTEN_EVENT,
 )
+from martian_scheduler import estimate_tokens
 import martian
 
+logger = logging.getLogger(__name__)
+
+POLICY_FILE = "probe_policy.json"
+
+# Probed passes ProbeEvent objects; observed calls receive their json snapshot.
+EventContent = ProbeEvent | str
+
+# Used in fused prompts when the probed callable has no docstring to describe
+# its result. The decision-only path is selected by passing no schema at all.
+UNKNOWN_RESPONSE_FORMAT = "No schema provided, any json value that fits the operation"
+
 
 class AIRuntime(Runtime):
-    def __init__(self):
-        self.probed_objects: dict[Probed, str] = {}
+    """
+    Runtime that lets a model decide how probed objects behave.
+
+    With `observe=True` the acknowledgement sent to the model after a
+    pass-through call is handed to a background EventObserver instead of
+    blocking the probed program. With `observe_decisions=True` decisions that
+    are not cached are made in the background as well: the call is passed
+    through immediately, and once the model answers the decision is recorded,
+    cached and reported as report-only, since interrupting or stopping a call
+    that already ran is no longer possible.
+
+    Decisions are only cached when a `decision_cache` such as LRUDecisionCache
+    is given. The cache key covers the event, the instructions and the user
+    query but not the history, so it suits programs whose decisions do not
+    depend on earlier calls.
+
+    Each probed object keeps a ProbeHistory bounded by `history_max_bytes`;
+    older events are rolled up into a digest once that budget is used.
+
+    With `fused=True` (the default) a probed call costs a single model round
+    trip: one DECIDE_AND_RESPOND request returns the interrupt, report and
+    stop flags together with the replacement response, and results of calls
+    that were not interrupted are only recorded in the history instead of
+    being acknowledged by the model. respond_event is still used when the
+    model interrupts without providing a response, or when the decision came
+    from the cache.
+
+    The `policy` decides which calls reach the model at all. By default it is
+    read from `probe_policy.json` in the working directory and reloaded when
+    that file changes, so probing can be narrowed from the terminal while the
+    program runs.
+
+    The `budget` records the tokens, cost and model time of every call, per
+    probed object and in total (see `budget.report()`), and enforces the
+    limits it was given: a probed object over budget degrades to cached
+    decisions only, sampled decisions or pure pass-through, and interrupted
+    calls that would need a model response return the real result instead.
+
+    A runtime and its probed objects can be used from many threads, including
+    on free-threaded builds. Each probed object has its own history with its
+    own lock, which is never held while waiting on the model, so different
+    objects progress in parallel and calls on the same object are not
+    serialized. Entries of a call are committed to the history in the order
+    the calls started (see ProbeHistory), so concurrent calls cannot lose or
+    reorder each other's events. The caches, budget, policy and scheduler
+    have their own locks.
+    """
+
+    def __init__(
+        self,
+        decision_cache: Optional[DecisionCache] = None,
+        observe: bool = False,
+        observe_decisions: bool = False,
+        observer_workers: int = 4,
+        history_max_bytes: Optional[int] = 16_000,
+        fused: bool = True,
+        policy: Optional[ProbePolicy] = None,
+        budget: Optional[Budget] = None,
+    ):
+        self.fused = fused
+        self.budget = budget if budget is not None else Budget()
+        self.policy = policy if policy is not None else ProbePolicy(path=POLICY_FILE)
+        self.probed_objects: dict[Probed, ProbeHistory] = {}
+        self.history_max_bytes = history_max_bytes
+        self.decision_cache = (
+            decision_cache if decision_cache is not None else DecisionCache()
+        )
+        self.observe_decisions = observe_decisions
+        self.observer = (
+            EventObserver(observer_workers) if observe or observe_decisions else None
+        )
+
+    def flush(self) -> None:
+        """Waits for every observed model call submitted so far."""
+        if self.observer is not None:
+            self.observer.flush()
 
     def get_user_additional_query(self) -> str:
         try:
@@ -24,83 +126,320 @@ class AIRuntime(Runtime):
             return ""
 
     def register_probing(self, probed: Probed) -> None:
-        self.probed_objects[probed] = INIT.format(
-            type=type(probed._obj).__name__,
-            initial_state=str(probed._obj),
-            user_instructions=probed._prompt,
+        self.probed_objects[probed] = ProbeHistory(
+            INIT.format(
+                type=type(probed._obj).__name__,
+                initial_state=str(probed._obj),
+                user_instructions=probed._prompt,
+            ),
+            max_bytes=self.history_max_bytes,
         )
 
     def ask_model_decisions(
-        self, probed: "Probed", event_content: str
+        self, probed: "Probed", event_content: EventContent
     ) -> tuple[bool, bool, bool]:
-        history = self.probed_objects[probed]
-        user_additional_query = self.get_user_additional_query()
-        prompt = ASK_MODEL_DECISION.format(
-            history=history,
-            event_content=event_content,
-            user_additional_query=user_additional_query,
+        return self._decide_event(probed, event_content, None)[:3]
+
+    def decide_and_respond(
+        self, probed: "Probed", event_content: EventContent, result_schema: str
+    ) -> tuple[bool, bool, bool, Any]:
+        if not self.fused:
+            return super().decide_and_respond(probed, event_content, result_schema)
+        return self._decide_event(
+            probed, event_content, result_schema or UNKNOWN_RESPONSE_FORMAT
         )
-        output = json.loads(martian.use_martian(prompt, "", ""))
+
+    def _decide_event(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        result_schema: Optional[str],
+    ) -> tuple[bool, bool, bool, Any]:
+        early, user_additional_query, cache_key = self._lookup_decision(
+            probed, event_content
+        )
+        if early is not None:
+            return early
+        return self._decide(
+            probed, event_content, user_additional_query, cache_key, result_schema
+        )
+
+    def _lookup_decision(
+        self, probed: "Probed", event_content: EventContent
+    ) -> tuple[Optional[tuple[bool, bool, bool, Any]], str, str]:
+        """
+        Returns the decision if it can be made without waiting on the model
+        (cache hit, or decision handed to the observer), along with the user
+        query and cache key needed to ask the model otherwise.
+        """
+        mode = self.budget.mode(probed)
+        if mode == PASS_THROUGH:
+            add("budget.degraded", mode=mode)
+            return (False, False, False, NO_RESPONSE), "", ""
+        user_additional_query = self.get_user_additional_query()
+        cache_key = decision_key(event_content, probed._prompt, user_additional_query)
+        result = self.decision_cache.get(cache_key)
+        add("runtime.decision_cache", hit=result is not None)
+        if result is not None:
+            self._record_decision(probed, event_content, result)
+            return (*result, NO_RESPONSE), user_additional_query, cache_key
+        if not self.budget.admits(mode):
+            add("budget.degraded", mode=mode)
+            return (False, False, False, NO_RESPONSE), user_additional_query, cache_key
+        if self.observe_decisions:
+            self.observer.submit(
+                probed,
+                self._observe_decision,
+                probed,
+                str(event_content),
+                user_additional_query,
+                cache_key,
+            )
+            return (False, False, False, NO_RESPONSE), user_additional_query, cache_key
+        return None, user_additional_query, cache_key
+
+    def _decide(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        user_additional_query: str,
+        cache_key: str,
+        result_schema: Optional[str] = None,
+        report_only: bool = False,
+    ) -> tuple[bool, bool, bool, Any]:
+        history = self.probed_objects[probed]
+        # Keeps the place of this event in the history while the model is asked.
+        slot = history.reserve()
+        try:
+            prompt, prompt_type = self._decision_prompt(
+                probed, event_content, user_additional_query, result_schema
+            )
+            model_output = self._call_model(probed, prompt, prompt_type)
+            return self._apply_decision(
+                probed, event_content, cache_key, model_output, slot, report_only
+            )
+        finally:
+            # Frees the slot if the call failed before committing it.
+            history.commit(slot)
+
+    def _call_model(self, probed: "Probed", prompt: str, prompt_type: str) -> str:
+        calls = []
+        start = time.perf_counter()
+        model_output = ""
+        try:
+            model_output = martian.use_martian(
+                prompt,
+                "",
+                "",
+                prompt_type=prompt_type,
+                on_usage=lambda *usage: calls.append(usage),
+            )
+        finally:
+            self._record_usage(
+                probed, prompt, model_output, calls, time.perf_counter() - start
+            )
+        return model_output
+
+    def _record_usage(
+        self,
+        probed: "Probed",
+        prompt: str,
+        model_output: str,
+        calls: list[tuple[str, Optional[int], Optional[int]]],
+        seconds: float,
+    ) -> None:
+        """Charges the completions made for one prompt to the budget of probed."""
+        # Counts the provider did not report are estimated from the text.
+        calls = calls or [(None, None, None)]
+        for model, prompt_tokens, completion_tokens in calls:
+            self.budget.record(
+                probed,
+                model,
+                prompt_tokens if prompt_tokens is not None else estimate_tokens(prompt),
+                (
+                    completion_tokens
+                    if completion_tokens is not None
+                    else estimate_tokens(model_output or "")
+                ),
+                seconds / len(calls),
+            )
+
+    def _decision_prompt(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        user_additional_query: str,
+        result_schema: Optional[str],
+    ) -> tuple[str, str]:
+        history = self.probed_objects[probed]
+        with span("runtime.prompt", history_events=len(history)) as prompt_span:
+            if result_schema is None:
+                prompt = ASK_MODEL_DECISION.format(
+                    history=history.render(),
+                    event_content=event_content,
+                    user_additional_query=user_additional_query,
+                )
+                prompt_type = "ASK_MODEL_DECISION"
+            else:
+                prompt = DECIDE_AND_RESPOND.format(
+                    history=history.render(),
+                    event_content=event_content,
+                    response_format=result_schema,
+                    user_additional_query=user_additional_query,
+                )
+                prompt_type = "DECIDE_AND_RESPOND"
+            prompt_span.set_attributes(
+                prompt_type=prompt_type, prompt_bytes=len(prompt)
+            )
+        return prompt, prompt_type
+
+    def _apply_decision(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        cache_key: str,
+        model_output: str,
+        slot: Optional[int] = None,
+        report_only: bool = False,
+    ) -> tuple[bool, bool, bool, Any]:
+        with span("runtime.parse"):
+            output = json.loads(model_output)
         result = (
             output.get("should_interrupt", False),
             output.get("should_report", False),
             output.get("should_stop", False),
         )
-        history += "\n" + DECISION_HISTORY_TEMPLATE.format(
-            event_content=event_content,
-            interrupted="interrupt" if result[0] else "not interrupt",
-            reported="reported" if result[1] else "not reported",
-            stopped="stopped" if result[2] else "not stopped",
+        if report_only:
+            # The call was passed through before the model answered. Recording
+            # or caching an interrupt would make the next identical call block
+            # on the model, so only the report is kept.
+            result = (False, result[1], False)
+        self.decision_cache.put(cache_key, result)
+        entries = [self._decision_entry(event_content, result)]
+        response = NO_RESPONSE
+        if result[0] and output.get("response") is not None:
+            response = output["response"]
+            entries.append(
+                (RESPONSE, RESPONDING_HISTORY_TEMPLATE.format(response=response), ())
+            )
+        history = self.probed_objects[probed]
+        history.commit(history.reserve() if slot is None else slot, entries)
+        return (*result, response)
+
+    def _observe_decision(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        user_additional_query: str,
+        cache_key: str,
+    ) -> None:
+        # The call has already run by now, so only reporting can still be honored.
+        _, should_report, _, _ = self._decide(
+            probed, event_content, user_additional_query, cache_key, report_only=True
         )
-        self.probed_objects[probed] = history
-        return result
+        if should_report:
+            report_event(event_content)
 
-    def listen_event(self, probed: "Probed", event_content: str, result: str) -> None:
-        history = self.probed_objects[probed]
-        user_additional_query = self.get_user_additional_query()
-        prompt = LISTEN_EVENT.format(
-            history=history,
+    def _record_decision(
+        self,
+        probed: "Probed",
+        event_content: EventContent,
+        result: tuple[bool, bool, bool],
+    ) -> None:
+        self.probed_objects[probed].append(*self._decision_entry(event_content, result))
+
+    @staticmethod
+    def _decision_entry(
+        event_content: EventContent, result: tuple[bool, bool, bool]
+    ) -> tuple[str, str, tuple[bool, bool, bool]]:
+        return (
+            DECISION,
+            DECISION_HISTORY_TEMPLATE.format(
+                event_content=event_content,
+                interrupted="interrupt" if result[0] else "not interrupt",
+                reported="reported" if result[1] else "not reported",
+                stopped="stopped" if result[2] else "not stopped",
+            ),
+            result,
+        )
+
+    def listen_event(
+        self, probed: "Probed", event_content: EventContent, result: str
+    ) -> None:
+        if self.observer is not None:
+            # Snapshot the event and result now, the program may mutate them
+            # before the worker gets to it.
+            self.observer.submit(
+                probed, self._listen_event, probed, str(event_content), str(result)
+            )
+        else:
+            self._listen_event(probed, event_content, result)
+
+    def _listen_event(
+        self, probed: "Probed", event_content: EventContent, result: str
+    ) -> None:
+        with span("runtime.listen"):
+            prompt = self._listen_prompt(probed, event_content, result)
+            if prompt is not None:
+                self._call_model(probed, prompt, "LISTEN_EVENT")
+            self._record_result(probed, result)
+
+    def _listen_prompt(
+        self, probed: "Probed", event_content: EventContent, result: str
+    ) -> Optional[str]:
+        """Returns the acknowledgement prompt, or None when it is not sent."""
+        if self.fused or not self.budget.admits(self.budget.mode(probed)):
+            return None
+        return LISTEN_EVENT.format(
+            history=self.probed_objects[probed].render(),
             event_content=event_content,
             result=result,
-            user_additional_query=user_additional_query,
+            user_additional_query=self.get_user_additional_query(),
         )
-        martian.use_martian(prompt, "", "")
-        history += "\n" + LISTENING_HISTORY_TEMPLATE.format(
-            result=result,
+
+    def _record_result(self, probed: "Probed", result: str) -> None:
+        self.probed_objects[probed].append(
+            RESULT, LISTENING_HISTORY_TEMPLATE.format(result=result)
         )
-        self.probed_objects[probed] = history
 
     def respond_event(
         self,
         probed: "Probed",
-        event_content: str,
+        event_content: EventContent,
         result_schema: str,
         result_example: str,
     ) -> str:
-        history = self.probed_objects[probed]
-        user_additional_query = self.get_user_additional_query()
-        print("the schema is :", result_schema)
-        prompt = RESPOND_EVENT.format(
-            history=history,
+        if not self._can_respond(probed):
+            return result_example
+        prompt = self._respond_prompt(probed, event_content, result_schema)
+        model_output = self._call_model(probed, prompt, "RESPOND_EVENT")
+        return self._apply_response(probed, model_output)
+
+    def _can_respond(self, probed: "Probed") -> bool:
+        mode = self.budget.mode(probed)
+        if mode == FULL:
+            return True
+        # Over budget: the real result stands in for the model's response.
+        add("budget.degraded", mode=mode)
+        return False
+
+    def _respond_prompt(
+        self, probed: "Probed", event_content: EventContent, result_schema: str
+    ) -> str:
+        logger.debug("the schema is: %s", result_schema)
+        return RESPOND_EVENT.format(
+            history=self.probed_objects[probed].render(),
             event_content=event_content,
             response_format=result_schema,
             response_example="No example provided",
-            user_additional_query=user_additional_query,
-        )
-        model_output = martian.use_martian(prompt, "", "")
-        print(
-            "--------------------------------------------------------------------------"
+            user_additional_query=self.get_user_additional_query(),
         )
-        print("--------------model output-----------")
-        print(model_output)
-        print("--------------end model output-----------")
-        output = json.loads(model_output)
-        print("parsed output:", output)
-        print(
-            "--------------------------------------------------------------------------"
-        )
-        history += "\n" + RESPONDING_HISTORY_TEMPLATE.format(
-            response=output,
+
+    def _apply_response(self, probed: "Probed", model_output: str) -> Any:
+        logger.debug("model output: %s", model_output)
+        with span("runtime.parse"):
+            output = json.loads(model_output)
+        self.probed_objects[probed].append(
+            RESPONSE, RESPONDING_HISTORY_TEMPLATE.format(response=output)
         )
-        self.probed_objects[probed] = history
         return output
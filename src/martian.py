@@ -1,77 +1,155 @@
-import openai
 import os
-import json
-import uuid
-import tempfile
-from datetime import datetime
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
-from PIL import Image
-from io import BytesIO
+import functools
+import logging
+import threading
+import weakref
+from python_runtime.tracing import add, span
 from martian_prompt import IMAGE_GENERATION, MODEL_SELECTION
-import base64
+from martian_images import ImageCache
+from martian_router import COHERE_MODEL, router
+from martian_scheduler import (
+    DECISION,
+    IMAGE,
+    PRIORITIES,
+    RESPONSE,
+    estimate_tokens,
+    scheduler,
+)
 import re
+import time
+from typing import Any, Callable, Optional
 
-load_dotenv()
-MARTIAN_ENV = os.getenv("MARTIAN_ENV")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+logger = logging.getLogger(__name__)
 
-if not GEMINI_API_KEY:
-    raise ValueError(
-        "GEMINI_API_KEY environment variable not set. Please add it to your .env file."
-    )
+# Called with the model and the prompt and completion token counts of a call.
+UsageCallback = Callable[[str, Optional[int], Optional[int]], None]
 
-if not MARTIAN_ENV:
-    raise ValueError(
-        "MARTIAN_ENV environment variable not set. Please add it to your .env file."
-    )
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+MARTIAN_BASE_URL = "https://api.withmartian.com/v1"
+
+
+# openai and google.genai take longer to import than the rest of the runtime, so
+# they are imported, and the clients built, the first time a model is called.
+# Missing keys are reported at that point rather than when martian is imported.
+@functools.cache
+def _settings() -> tuple[str, str]:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    martian_env = os.getenv("MARTIAN_ENV")
+
+    if not gemini_api_key:
+        raise ValueError(
+            "GEMINI_API_KEY environment variable not set. Please add it to your .env file."
+        )
+
+    if not martian_env:
+        raise ValueError(
+            "MARTIAN_ENV environment variable not set. Please add it to your .env file."
+        )
+    return gemini_api_key, martian_env
 
-# Gemini client for direct Gemini API calls
-gemini_client = openai.OpenAI(
-    api_key=GEMINI_API_KEY,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
+
+def _client_settings(provider: str) -> tuple[str, str]:
+    gemini_api_key, martian_env = _settings()
+    if provider == "martian":
+        return martian_env, MARTIAN_BASE_URL
+    return gemini_api_key, GEMINI_BASE_URL
+
+
+@functools.cache
+def _sync_openai_client(provider: str):
+    import openai
+
+    api_key, base_url = _client_settings(provider)
+    # Retries are left to the scheduler, which backs off across all callers.
+    return openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+
+# The connection pool of an async client belongs to the event loop that first
+# used it, so async clients are kept per running loop, like the semaphores of
+# AsyncAIRuntime, and go away with their loop.
+_async_clients: "weakref.WeakKeyDictionary[Any, dict[str, Any]]" = (
+    weakref.WeakKeyDictionary()
 )
+_async_clients_lock = threading.Lock()
+
+
+def _async_openai_client(provider: str):
+    import asyncio
+    import openai
+
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+    client = clients.get(provider)
+    if client is None:
+        api_key, base_url = _client_settings(provider)
+        client = clients[provider] = openai.AsyncOpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0
+        )
+    return client
+
+
+def _openai_client(provider: str, asynchronous: bool):
+    # Gemini client for direct Gemini API calls, Martian client for routing to
+    # different models. The async ones are used by AsyncAIRuntime so that
+    # awaiting a model call yields to the event loop instead of blocking it.
+    if asynchronous:
+        return _async_openai_client(provider)
+    return _sync_openai_client(provider)
+
+
+@functools.cache
+def _genai_client():
+    # Google Genai client for image generation
+    from google import genai
 
-# Martian client for routing to different models
-martian_client = openai.OpenAI(
-    api_key=MARTIAN_ENV, 
-    base_url="https://api.withmartian.com/v1"
+    return genai.Client(api_key=_settings()[0])
+
+
+# Generated images, reused for repeated descriptions. IMAGE_CACHE_MAX_BYTES
+# bounds the store on disk.
+image_cache = ImageCache(
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", "0")) or None,
 )
 
-# Initialize Google Genai client for image generation
-genai_client = genai.Client(api_key=GEMINI_API_KEY)
+
+def _generate_image(image_description: str) -> Optional[tuple[bytes, str]]:
+    with span("martian.image", model="gemini-2.5-flash-image-preview"):
+        response = scheduler.call(
+            "genai",
+            lambda: _genai_client().models.generate_content(
+                model="gemini-2.5-flash-image-preview",
+                contents=[image_description],
+            ),
+            priority=IMAGE,
+            tokens=estimate_tokens(image_description),
+        )
+    add("model.calls", model="gemini-2.5-flash-image-preview")
+    for part in response.candidates[0].content.parts:
+        if part.inline_data is not None:
+            return part.inline_data.data, part.inline_data.mime_type or "image/png"
+    return None
 
 
 def image_generator_tool(image_description: str) -> str:
     """
     Generates an image based on the provided description using Google Genai
     """
-    response = genai_client.models.generate_content(
-        model="gemini-2.5-flash-image-preview",
-        contents=[image_description],
-    )
-
-    print("I am here!")
-    for part in response.candidates[0].content.parts:
-        if part.inline_data is not None:
-            # Generate unique filename in temp directory within current directory
-            temp_dir = os.path.join(os.getcwd(), "temp")
-            os.makedirs(temp_dir, exist_ok=True)
-            filename = f"generated_image_{uuid.uuid4().hex[:8]}.png"
-            filepath = os.path.join(temp_dir, filename)
-            image = Image.open(BytesIO(part.inline_data.data))
-            image.save(filepath)
-            print("I am returning the filename:", filepath)
-            return os.path.abspath(filepath)
+    path = image_cache.get(image_description, _generate_image)
+    if path is None:
+        return "No image generated"
+    logger.debug("image for %r: %s", image_description, path)
+    return path
 
-    return "No image generated"
 
-
-def decide_model(prompt: str) -> str:
+def decide_model(prompt: str, on_usage: Optional[UsageCallback] = None) -> str:
     """
     Decides which model to use by asking Martian's google/gemini-2.5-flash:cheap to analyze the prompt.
     Returns 'cohere/command-a' for ASK_MODEL_DECISION prompts, 'gemini-2.5-flash' for others.
+    Only used when the local router cannot classify the prompt and MARTIAN_LLM_ROUTER=1.
     """
     print("🤖 [ROUTER] Asking Martian's google/gemini-2.5-flash:cheap to decide model selection...")
     
@@ -79,10 +157,19 @@ def decide_model(prompt: str) -> str:
 
     try:
         # Make API call to Martian with google/gemini-2.5-flash:cheap to decide
-        decision_response = martian_client.chat.completions.create(
-            model="google/gemini-2.5-flash:cheap",
-            messages=[{"role": "user", "content": decision_prompt}],
-        )
+        with span("martian.decide_model") as decide_span:
+            decision_response = scheduler.call(
+                "martian",
+                lambda: _openai_client("martian", False).chat.completions.create(
+                    model="google/gemini-2.5-flash:cheap",
+                    messages=[{"role": "user", "content": decision_prompt}],
+                ),
+                priority=DECISION,
+                tokens=estimate_tokens(decision_prompt),
+            )
+            _record_usage(
+                decide_span, "google/gemini-2.5-flash:cheap", decision_response, on_usage
+            )
         
         decision = decision_response.choices[0].message.content.strip()
         print(f"🔍 [ROUTER] Martian decision: {decision}")
@@ -102,43 +189,200 @@ def decide_model(prompt: str) -> str:
         return "gemini-2.5-flash"
 
 
-def use_martian(message, instructions, context):
-    # Decide which model to use based on the message content
-    selected_model = decide_model(message)
-    
+def _client_for(selected_model: str, asynchronous: bool = False):
+    # Route to the appropriate client based on the selected model: cohere goes
+    # through Martian, gemini goes to the Gemini API directly.
+    if selected_model == COHERE_MODEL:
+        client = _openai_client("martian", asynchronous)
+        return client, selected_model, "Martian", "martian"
+    client = _openai_client("gemini", asynchronous)
+    return client, "gemini-2.5-flash", "Gemini", "gemini"
+
+
+def _record_usage(
+    call_span, model: str, response, on_usage: Optional[UsageCallback] = None
+) -> None:
+    # Token counts as reported by the provider, when it reports them.
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if on_usage is not None:
+        on_usage(model, prompt_tokens, completion_tokens)
+    call_span.set_attributes(
+        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+    )
+    add("model.calls", model=model)
+    if prompt_tokens:
+        add("model.tokens", prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        add("model.tokens", completion_tokens, model=model, kind="completion")
+
+
+def _complete_span(model: str, provider: str, messages: list, prompt_type):
+    return span(
+        "martian.complete",
+        model=model,
+        provider=provider,
+        prompt_type=prompt_type,
+        estimated_tokens=estimate_tokens(messages[0]["content"]),
+    )
+
+
+def _complete(selected_model: str, messages: list, prompt_type=None, on_usage=None):
+    client, model, label, provider = _client_for(selected_model)
+    logger.debug("calling %s via %s", selected_model, label)
+    with _complete_span(model, provider, messages, prompt_type) as call_span:
+        response = scheduler.call(
+            provider,
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"},
+            ),
+            priority=PRIORITIES.get(prompt_type, RESPONSE),
+            tokens=estimate_tokens(messages[0]["content"]),
+        )
+        _record_usage(call_span, model, response, on_usage)
+    logger.debug("received response from %s", label)
+    return response
+
+
+async def _acomplete(
+    selected_model: str, messages: list, prompt_type=None, on_usage=None
+):
+    client, model, label, provider = _client_for(selected_model, asynchronous=True)
+    logger.debug("calling %s via %s (async)", selected_model, label)
+    with _complete_span(model, provider, messages, prompt_type) as call_span:
+        response = await scheduler.acall(
+            provider,
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_format={"type": "json_object"},
+            ),
+            priority=PRIORITIES.get(prompt_type, RESPONSE),
+            tokens=estimate_tokens(messages[0]["content"]),
+        )
+        _record_usage(call_span, model, response, on_usage)
+    logger.debug("received response from %s", label)
+    return response
+
+
+def _timed_complete(
+    selected_model: str, messages: list, prompt_type=None, on_usage=None
+):
+    start = time.perf_counter()
+    try:
+        response = _complete(selected_model, messages, prompt_type, on_usage)
+    except Exception:
+        router.record(selected_model, time.perf_counter() - start, ok=False)
+        raise
+    router.record(selected_model, time.perf_counter() - start, ok=True)
+    return response
+
+
+async def _timed_acomplete(
+    selected_model: str, messages: list, prompt_type=None, on_usage=None
+):
+    start = time.perf_counter()
+    try:
+        response = await _acomplete(selected_model, messages, prompt_type, on_usage)
+    except Exception:
+        router.record(selected_model, time.perf_counter() - start, ok=False)
+        raise
+    router.record(selected_model, time.perf_counter() - start, ok=True)
+    return response
+
+
+def _build_messages(message: str) -> list:
     messages = []
     messages.append({"role": "user", "content": message})
     messages.append({"role": "system", "content": IMAGE_GENERATION})
+    return messages
 
-    # Route to the appropriate client based on the selected model
-    if selected_model == "cohere/command-a":
-        # Use Martian client for Cohere model
-        print(f"🚀 [ROUTER] Making API call to {selected_model} via Martian...")
-        response = martian_client.chat.completions.create(
-            model=selected_model,
-            messages=messages,
-            response_format={"type": "json_object"},
-        )
-        print("✨ [ROUTER] Received response from Martian API")
-    else:
-        # Use direct Gemini client for Gemini model
-        print(f"🚀 [ROUTER] Making API call to {selected_model} via direct Gemini...")
-        response = gemini_client.chat.completions.create(
-            model="gemini-2.5-flash",
-            messages=messages,
-            response_format={"type": "json_object"},
-        )
-        print("✨ [ROUTER] Received response from Gemini API")
 
-    message = response.choices[0].message
-    content = message.content
+IMAGE_URL_PATTERN = r"IMAGE_URL\(([^)]+)\)"
+
 
-    image_url_pattern = r"IMAGE_URL\(([^)]+)\)"
-    matches = re.findall(image_url_pattern, content)
+def _replace_image_markers(content: str) -> str:
+    matches = re.findall(IMAGE_URL_PATTERN, content)
+    if not matches:
+        return content
 
+    # Every image of the response is generated at the same time.
+    with span("martian.images", count=len(matches)):
+        paths = image_cache.get_many(
+            [description.strip("\"'") for description in matches], _generate_image
+        )
     for description in matches:
-        clean_description = description.strip("\"'")
-        image_path = image_generator_tool(clean_description)
+        image_path = paths[description.strip("\"'")] or "No image generated"
         content = content.replace(f"IMAGE_URL({description})", image_path, 1)
 
     return content
+
+
+def use_martian(message, instructions, context, prompt_type=None, on_usage=None):
+    """
+    Answers message with the model the router picks. `on_usage(model,
+    prompt_tokens, completion_tokens)` is called for every completion made on
+    the way, with None for counts the provider did not report.
+    """
+    with span("martian.use", prompt_type=prompt_type) as use_span:
+        # Decide locally which model to use, the LLM router is only asked when the
+        # prompt type is unknown and the fallback is enabled.
+        selected_model = router.choose(message, prompt_type)
+        if selected_model is None:
+            selected_model = decide_model(message, on_usage)
+        use_span.set_attribute("model", selected_model)
+
+        messages = _build_messages(message)
+
+        try:
+            response = _timed_complete(selected_model, messages, prompt_type, on_usage)
+        except Exception as e:
+            fallback_model = router.alternative(selected_model)
+            logger.warning(
+                "%s failed (%s), retrying with %s", selected_model, e, fallback_model
+            )
+            use_span.set_attribute("fallback_model", fallback_model)
+            response = _timed_complete(fallback_model, messages, prompt_type, on_usage)
+
+        message = response.choices[0].message
+        return _replace_image_markers(message.content)
+
+
+async def use_martian_async(
+    message, instructions, context, prompt_type=None, on_usage=None
+):
+    """
+    Async version of use_martian. Blocking work that has no async client (the
+    LLM router fallback and image generation) runs in a worker thread.
+    """
+    import asyncio
+
+    with span("martian.use", prompt_type=prompt_type) as use_span:
+        selected_model = router.choose(message, prompt_type)
+        if selected_model is None:
+            selected_model = await asyncio.to_thread(decide_model, message, on_usage)
+        use_span.set_attribute("model", selected_model)
+
+        messages = _build_messages(message)
+
+        try:
+            response = await _timed_acomplete(
+                selected_model, messages, prompt_type, on_usage
+            )
+        except Exception as e:
+            fallback_model = router.alternative(selected_model)
+            logger.warning(
+                "%s failed (%s), retrying with %s", selected_model, e, fallback_model
+            )
+            use_span.set_attribute("fallback_model", fallback_model)
+            response = await _timed_acomplete(
+                fallback_model, messages, prompt_type, on_usage
+            )
+
+        content = response.choices[0].message.content
+        if re.search(IMAGE_URL_PATTERN, content):
+            content = await asyncio.to_thread(_replace_image_markers, content)
+        return content
@@ -0,0 +1,172 @@
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DIR = os.path.join("temp", "images")
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+}
+
+GenerateImage = Callable[[str], Optional[tuple[bytes, str]]]
+
+
+def normalize_description(description: str) -> str:
+    """Descriptions differing only by quotes, case or spacing share one image."""
+    return " ".join(description.strip().strip("\"'").lower().split())
+
+
+def description_key(description: str) -> str:
+    return hashlib.sha256(
+        normalize_description(description).encode("utf-8")
+    ).hexdigest()
+
+
+class ImageCache:
+    """
+    On-disk store of generated images addressed by the hash of their normalized
+    description, so a description that was already rendered costs nothing.
+
+    Images are written exactly as returned by the model, in their own format.
+    Concurrent requests for the same description share one generation. When
+    `max_bytes` is set, the least recently used images are evicted once the
+    store grows past it.
+    """
+
+    def __init__(
+        self,
+        directory: str = IMAGE_DIR,
+        max_bytes: Optional[int] = None,
+        workers: int = 4,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _find(self, key: str) -> Optional[str]:
+        for extension in EXTENSIONS.values():
+            path = os.path.join(self.directory, key[:32] + extension)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def lookup(self, description: str) -> Optional[str]:
+        path = self._find(description_key(description))
+        if path is not None:
+            # Mark as recently used for eviction.
+            os.utime(path)
+            return os.path.abspath(path)
+        return None
+
+    def store(self, description: str, data: bytes, mime_type: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        extension = EXTENSIONS.get(mime_type, ".png")
+        path = os.path.join(
+            self.directory, description_key(description)[:32] + extension
+        )
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, path)
+        if self.max_bytes is not None:
+            self.evict(keep=path)
+        return os.path.abspath(path)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Removes least recently used images until the store fits in max_bytes."""
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Evicted by another process since the scan started.
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if self.max_bytes is None or total <= self.max_bytes:
+                break
+            try:
+                if keep is not None and os.path.samefile(path, keep):
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                # Another process evicting at the same time got there first.
+                total -= size
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def get(self, description: str, generate: GenerateImage) -> Optional[str]:
+        """Path of the image for description, generating it at most once."""
+        cached = self.lookup(description)
+        if cached is not None:
+            return cached
+        key = description_key(description)
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            generated = generate(description)
+            path = None
+            if generated is not None:
+                path = self.store(description, *generated)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def get_many(
+        self, descriptions: Iterable[str], generate: GenerateImage
+    ) -> dict[str, Optional[str]]:
+        """Generates every missing image concurrently; failures map to None."""
+        unique = list(dict.fromkeys(descriptions))
+        if len(unique) <= 1:
+            return {
+                description: self._get_or_none(description, generate)
+                for description in unique
+            }
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="martian-images"
+                )
+        # Each generation runs in a copy of the caller's context, so its
+        # tracing spans nest under the caller's.
+        futures = {
+            description: self._executor.submit(
+                contextvars.copy_context().run, self._get_or_none, description, generate
+            )
+            for description in unique
+        }
+        return {description: future.result() for description, future in futures.items()}
+
+    def _get_or_none(self, description: str, generate: GenerateImage) -> Optional[str]:
+        try:
+            return self.get(description, generate)
+        except Exception:
+            logger.warning("generating image for %r failed", description, exc_info=True)
+            return None
@@ -3,4 +3,17 @@ If you are looking for a url for an image, instead of providing the actual url,
 IMAGE_URL(write image description here)
 Then another tool is going to take care of the images.
 DO NOT COME UP WITH URL IMAGES JUST USE THE FORMAT ABOVE.
-"""
\ No newline at end of file
+"""
+
+MODEL_SELECTION = """
+You are routing a prompt sent by an AI runtime that controls an object in a Python program.
+The runtime sends three kinds of prompts:
+- ASK_MODEL_DECISION: asks whether to interrupt, report or stop an operation.
+- RESPOND_EVENT: asks for a json response that replaces the result of an interrupted operation.
+- LISTEN_EVENT: reports the result of an operation that was not interrupted.
+
+Answer with only the name of the kind of the prompt below.
+
+The prompt is:
+{prompt}
+"""
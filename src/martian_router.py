@@ -0,0 +1,140 @@
+import os
+import threading
+from typing import Optional
+
+COHERE_MODEL = "cohere/command-a"
+GEMINI_MODEL = "gemini-2.5-flash"
+
+ASK_MODEL_DECISION = "ASK_MODEL_DECISION"
+RESPOND_EVENT = "RESPOND_EVENT"
+LISTEN_EVENT = "LISTEN_EVENT"
+DECIDE_AND_RESPOND = "DECIDE_AND_RESPOND"
+
+# Markers that identify each runtime prompt when the caller does not say
+# which one it is sending.
+PROMPT_MARKERS = (
+    ("also provide the response that will be returned", DECIDE_AND_RESPOND),
+    ("Do you want to interrupt this operation?", ASK_MODEL_DECISION),
+    ("You decided to interrupt the operation.", RESPOND_EVENT),
+    ("You decided NOT to interrupt the operation.", LISTEN_EVENT),
+)
+
+# Preferred backends per prompt type, best first. Decisions are short json
+# answers that cohere handles quickly, the rest (including fused decisions
+# that may carry a full response) go to gemini.
+PREFERENCES = {
+    ASK_MODEL_DECISION: (COHERE_MODEL, GEMINI_MODEL),
+    DECIDE_AND_RESPOND: (GEMINI_MODEL, COHERE_MODEL),
+    RESPOND_EVENT: (GEMINI_MODEL, COHERE_MODEL),
+    LISTEN_EVENT: (GEMINI_MODEL, COHERE_MODEL),
+}
+
+
+class BackendStats:
+    """Exponentially weighted latency and error rate of one backend."""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.calls += 1
+        if ok:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+
+class LocalRouter:
+    """
+    Picks a model for a prompt without any network call.
+
+    The choice starts from the preference order of the prompt type; very large
+    prompts go to gemini for its larger context. The preferred backend is then
+    skipped if its error rate is above `max_error_rate` or its EWMA latency is
+    more than `latency_ratio` times the alternative's. Every `explore_every`
+    calls the alternative is used once so that its statistics stay fresh.
+    """
+
+    def __init__(
+        self,
+        large_prompt_chars: int = 48_000,
+        max_error_rate: float = 0.5,
+        latency_ratio: float = 1.5,
+        explore_every: int = 20,
+        llm_fallback: bool = False,
+    ):
+        self.large_prompt_chars = large_prompt_chars
+        self.max_error_rate = max_error_rate
+        self.latency_ratio = latency_ratio
+        self.explore_every = explore_every
+        self.llm_fallback = llm_fallback
+        self.stats = {COHERE_MODEL: BackendStats(), GEMINI_MODEL: BackendStats()}
+        self._decisions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def classify(prompt: str) -> Optional[str]:
+        for marker, prompt_type in PROMPT_MARKERS:
+            if marker in prompt:
+                return prompt_type
+        return None
+
+    def choose(self, prompt: str, prompt_type: Optional[str] = None) -> Optional[str]:
+        """
+        Returns the model to use, or None when the prompt type is unknown and
+        the LLM-based router should decide instead.
+        """
+        prompt_type = prompt_type or self.classify(prompt)
+        if prompt_type not in PREFERENCES:
+            return None if self.llm_fallback else GEMINI_MODEL
+
+        preferred, alternative = PREFERENCES[prompt_type]
+        if len(prompt) > self.large_prompt_chars:
+            preferred, alternative = GEMINI_MODEL, COHERE_MODEL
+
+        with self._lock:
+            self._decisions += 1
+            if self.explore_every and self._decisions % self.explore_every == 0:
+                return alternative
+            first, second = self.stats[preferred], self.stats[alternative]
+            if first.error_rate > self.max_error_rate and (
+                second.error_rate < first.error_rate
+            ):
+                return alternative
+            if (
+                first.latency is not None
+                and second.latency is not None
+                and second.error_rate <= self.max_error_rate
+                and first.latency > self.latency_ratio * second.latency
+            ):
+                return alternative
+        return preferred
+
+    def alternative(self, model: str) -> str:
+        return GEMINI_MODEL if model == COHERE_MODEL else COHERE_MODEL
+
+    def record(self, model: str, latency: float, ok: bool) -> None:
+        stats = self.stats.get(model)
+        if stats is None:
+            return
+        with self._lock:
+            stats.record(latency, ok)
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                model: {
+                    "latency": stats.latency or 0.0,
+                    "error_rate": stats.error_rate,
+                    "calls": stats.calls,
+                }
+                for model, stats in self.stats.items()
+            }
+
+
+router = LocalRouter(llm_fallback=os.getenv("MARTIAN_LLM_ROUTER") == "1")
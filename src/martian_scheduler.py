@@ -0,0 +1,307 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+# Priority classes, lower runs first when a provider is saturated.
+DECISION = 0
+RESPONSE = 1
+LISTEN = 2
+IMAGE = 3
+
+PRIORITIES = {
+    "ASK_MODEL_DECISION": DECISION,
+    "DECIDE_AND_RESPOND": DECISION,
+    "RESPOND_EVENT": RESPONSE,
+    "LISTEN_EVENT": LISTEN,
+}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Client errors raised before any status is known, e.g. by openai.
+RETRYABLE_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    """Classic token bucket, refilled continuously up to `capacity`."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available, 0 if they already are."""
+        self._refill(now)
+        # Requests larger than the bucket are let through once it is full.
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderLimits:
+    def __init__(
+        self,
+        requests_per_minute: float = 600,
+        tokens_per_minute: float = 1_000_000,
+        max_in_flight: int = 16,
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_in_flight = max_in_flight
+
+
+class _Provider:
+    def __init__(self, limits: ProviderLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.requests_per_minute)
+        self.tokens = TokenBucket(limits.tokens_per_minute)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.waiting: list[tuple[int, int]] = []
+
+
+class Scheduler:
+    """
+    Shared admission control in front of the model clients.
+
+    Every call names a provider, a priority class and an estimated token
+    count. A call starts only when it is the most urgent one waiting for that
+    provider, fewer than `max_in_flight` calls are running, and both the
+    request and token buckets have room. Calls that fail with a rate limit or
+    transient server error are retried with jittered exponential backoff,
+    honoring `Retry-After` when the provider sends it.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[dict[str, ProviderLimits]] = None,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._providers: dict[str, _Provider] = {}
+        self._condition = threading.Condition()
+        # Async waiters, woken through their own loop when the condition is.
+        self._wakeups: dict[tuple[int, int], tuple[Any, Any]] = {}
+        self._tickets = itertools.count()
+        for name, provider_limits in (limits or {}).items():
+            self.configure(name, provider_limits)
+
+    def configure(self, provider: str, limits: ProviderLimits) -> None:
+        with self._condition:
+            self._providers[provider] = _Provider(limits)
+            self._notify()
+
+    def _provider(self, name: str) -> _Provider:
+        provider = self._providers.get(name)
+        if provider is None:
+            provider = self._providers[name] = _Provider(ProviderLimits())
+        return provider
+
+    def _enqueue(self, name: str, priority: int) -> tuple[int, int]:
+        ticket = (priority, next(self._tickets))
+        with self._condition:
+            heapq.heappush(self._provider(name).waiting, ticket)
+        return ticket
+
+    def _notify(self) -> None:
+        """Must hold the condition. Wakes every waiter, sync or async."""
+        closed = []
+        for ticket, (loop, wakeup) in self._wakeups.items():
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # The loop was closed with the waiter still queued, it will
+                # never run again and must not block the calls behind it.
+                closed.append(ticket)
+        for ticket in closed:
+            del self._wakeups[ticket]
+            for provider in self._providers.values():
+                self._remove_ticket(provider, ticket)
+        self._condition.notify_all()
+
+    def _try_acquire(
+        self, name: str, ticket: tuple[int, int], tokens: int
+    ) -> Optional[float]:
+        """
+        Must hold the condition. Returns 0 once admitted, None while another
+        call has to start or finish first, else seconds until the buckets or
+        the cooldown let it through.
+        """
+        provider = self._provider(name)
+        now = time.monotonic()
+        if provider.waiting[0] != ticket:
+            return None
+        if provider.in_flight >= provider.limits.max_in_flight:
+            return None
+        wait = max(
+            provider.cooldown_until - now,
+            provider.requests.wait_time(1, now),
+            provider.tokens.wait_time(tokens, now),
+        )
+        if wait > 0:
+            return wait
+        heapq.heappop(provider.waiting)
+        provider.requests.take(1)
+        provider.tokens.take(tokens)
+        provider.in_flight += 1
+        # The next ticket may be admissible right away.
+        self._notify()
+        return 0.0
+
+    def _acquire(self, name: str, priority: int, tokens: int) -> None:
+        ticket = self._enqueue(name, priority)
+        try:
+            with self._condition:
+                while True:
+                    wait = self._try_acquire(name, ticket, tokens)
+                    if wait == 0:
+                        return
+                    self._condition.wait(timeout=wait)
+        except BaseException:
+            # E.g. KeyboardInterrupt while waiting, the ticket would otherwise
+            # stay at the head of the queue for good.
+            self._abandon(name, ticket)
+            raise
+
+    async def _aacquire(self, name: str, priority: int, tokens: int) -> None:
+        # asyncio is only imported by callers that are already running a loop.
+        import asyncio
+
+        ticket = self._enqueue(name, priority)
+        wakeup = asyncio.Event()
+        with self._condition:
+            self._wakeups[ticket] = (asyncio.get_running_loop(), wakeup)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_acquire(name, ticket, tokens)
+                    if wait == 0:
+                        return
+                    wakeup.clear()
+                try:
+                    # Until the buckets refill, or until another call changes
+                    # the state, whichever comes first.
+                    await asyncio.wait_for(wakeup.wait(), wait)
+                except TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(name, ticket)
+            raise
+        finally:
+            with self._condition:
+                self._wakeups.pop(ticket, None)
+
+    def _abandon(self, name: str, ticket: tuple[int, int]) -> None:
+        with self._condition:
+            if self._remove_ticket(self._provider(name), ticket):
+                self._notify()
+
+    @staticmethod
+    def _remove_ticket(provider: _Provider, ticket: tuple[int, int]) -> bool:
+        if ticket not in provider.waiting:
+            return False
+        provider.waiting.remove(ticket)
+        heapq.heapify(provider.waiting)
+        return True
+
+    def _release(self, name: str) -> None:
+        with self._condition:
+            self._provider(name).in_flight -= 1
+            self._notify()
+
+    def _backoff(self, name: str, error: Exception, attempt: int) -> Optional[float]:
+        """Returns the delay before retrying, or None if the error is final."""
+        status = getattr(error, "status_code", None) or getattr(error, "code", None)
+        retryable = (
+            status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS
+        )
+        if not retryable or attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        response = getattr(error, "response", None)
+        retry_after = getattr(response, "headers", {}).get("retry-after")
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        if status == 429:
+            # Hold every call to this provider, not only the one that failed.
+            with self._condition:
+                provider = self._provider(name)
+                provider.cooldown_until = max(
+                    provider.cooldown_until, time.monotonic() + delay
+                )
+        return delay
+
+    def call(
+        self,
+        provider: str,
+        fn: Callable[[], Any],
+        priority: int = RESPONSE,
+        tokens: int = 1,
+    ) -> Any:
+        attempt = 0
+        while True:
+            self._acquire(provider, priority, tokens)
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._backoff(provider, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._release(provider)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(
+        self,
+        provider: str,
+        fn: Callable[[], Awaitable[Any]],
+        priority: int = RESPONSE,
+        tokens: int = 1,
+    ) -> Any:
+        import asyncio
+
+        attempt = 0
+        while True:
+            await self._aacquire(provider, priority, tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._backoff(provider, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self._release(provider)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+scheduler = Scheduler(
+    {
+        "martian": ProviderLimits(requests_per_minute=600, max_in_flight=16),
+        "gemini": ProviderLimits(requests_per_minute=1000, max_in_flight=16),
+        "genai": ProviderLimits(requests_per_minute=60, max_in_flight=4),
+    }
+)
@@ -0,0 +1,170 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+from fnmatch import translate
+from typing import Any, Iterable, Optional
+
+POLICY_FIELDS = (
+    "enabled",
+    "allow",
+    "deny",
+    "always_ask",
+    "pass_through",
+    "sample",
+    "default_rate",
+)
+
+
+def _compile(patterns: Iterable[str]) -> Optional[re.Pattern]:
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{translate(pattern)})" for pattern in patterns))
+
+
+class ProbePolicy:
+    """
+    Decides which probed calls are sent to the runtime.
+
+    Rules are matched against the method name (the last part of the probe
+    prefix, e.g. `append` or `__len__`) using glob patterns, in this order:
+    the global `enabled` kill switch, `always_ask`, `pass_through`, `deny`,
+    `allow` (when given, anything else passes through), `sample` (pattern to
+    rate, the first match wins) and finally `default_rate`. A rate is the
+    probability that a call is asked about; the rest pass straight through.
+
+    Rules are compiled lazily into a table keyed by method name, so a call
+    that is not probed costs a dict lookup. When `path` is given the policy
+    is reloaded from that json file whenever it changes, checked at most every
+    `reload_interval` seconds, which lets a running program be narrowed down
+    without restarting it (see the `/policy` command of the terminal).
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        allow: Iterable[str] = (),
+        deny: Iterable[str] = (),
+        always_ask: Iterable[str] = (),
+        pass_through: Iterable[str] = (),
+        sample: Optional[dict[str, float]] = None,
+        default_rate: float = 1.0,
+        path: Optional[str] = None,
+        reload_interval: float = 1.0,
+    ):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self.update(
+            enabled=enabled,
+            allow=allow,
+            deny=deny,
+            always_ask=always_ask,
+            pass_through=pass_through,
+            sample=sample or {},
+            default_rate=default_rate,
+        )
+
+    @classmethod
+    def from_file(cls, path: str, reload_interval: float = 1.0) -> "ProbePolicy":
+        policy = cls(path=path, reload_interval=reload_interval)
+        policy.reload()
+        return policy
+
+    def update(self, **config: Any) -> None:
+        """Replaces the given rules and recompiles the dispatch table."""
+        unknown = set(config) - set(POLICY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown policy fields: {', '.join(sorted(unknown))}")
+        with self._lock:
+            for field in POLICY_FIELDS:
+                if field in config:
+                    value = config[field]
+                    if field in ("allow", "deny", "always_ask", "pass_through"):
+                        value = list(value)
+                    elif field == "sample":
+                        value = dict(value)
+                    setattr(self, field, value)
+            self._always_ask = _compile(self.always_ask)
+            self._pass_through = _compile(self.pass_through)
+            self._deny = _compile(self.deny)
+            self._allow = _compile(self.allow)
+            self._sample = [
+                (re.compile(translate(pattern)), rate)
+                for pattern, rate in self.sample.items()
+            ]
+            self._table: dict[str, float] = {}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {field: getattr(self, field) for field in POLICY_FIELDS}
+
+    def reload(self) -> bool:
+        """Reloads the rules from `path` if the file changed since last time."""
+        if self.path is None:
+            return False
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        if mtime is None:
+            self.update(**ProbePolicy().to_dict())
+            return True
+        try:
+            with open(self.path, "r") as file:
+                config = json.load(file)
+            # The file holds the whole policy, fields it leaves out are reset.
+            rules = ProbePolicy().to_dict()
+            rules.update((k, v) for k, v in config.items() if k in POLICY_FIELDS)
+            self.update(**rules)
+        except (OSError, ValueError):
+            # Keep the current rules while the file is being written or broken,
+            # and read it again next time; no real file has this mtime.
+            self._mtime = -1.0
+            return False
+        return True
+
+    def rate(self, prefix: str) -> float:
+        if self.path is not None:
+            now = time.monotonic()
+            if now >= self._next_check:
+                self._next_check = now + self.reload_interval
+                self.reload()
+        # Keyed by method name rather than the whole prefix, which names the
+        # object, so the table stays as small as the set of probed methods.
+        name = prefix.rpartition(".")[2]
+        rate = self._table.get(name)
+        if rate is None:
+            rate = self._table[name] = self._compile_rate(name)
+        return rate
+
+    def _compile_rate(self, name: str) -> float:
+        if not self.enabled:
+            return 0.0
+        if self._always_ask is not None and self._always_ask.match(name):
+            return 1.0
+        if self._pass_through is not None and self._pass_through.match(name):
+            return 0.0
+        if self._deny is not None and self._deny.match(name):
+            return 0.0
+        if self._allow is not None and not self._allow.match(name):
+            return 0.0
+        for pattern, rate in self._sample:
+            if pattern.match(name):
+                return rate
+        return self.default_rate
+
+    def should_probe(self, prefix: str) -> bool:
+        rate = self.rate(prefix)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        return random.random() < rate
@@ -1,45 +1,212 @@
+import copy
 import json
-import uuid
+import logging
+import os
+import types
+import weakref
+from collections.abc import Awaitable
 from typing import TypeVar, Generic, Any, Optional
-import yaml
-import datetime
+from python_runtime.policy import ProbePolicy
+from python_runtime.report import report_event
+from python_runtime.tracing import Span, span, tracing_enabled
 
 T = TypeVar("T")
 
+logger = logging.getLogger(__name__)
+
+# Returned by Runtime.decide_and_respond when no replacement response was
+# produced together with the decisions.
+NO_RESPONSE = object()
+
 RESERVED_FIELDS = {
     "_obj",
     "_prompt",
     "_prefix",
     "_entry",
     "_runtime",
+    "_policy",
+    "_children",
     "_getattr_impl",
+    "_event",
+    "_call",
+    "_acall",
+    "_listen_when_done",
     "RESERVED_FIELDS",
 }
 
 
+class ProbeEvent:
+    """
+    A call on a probed object. Creating one only stores references; the json
+    text sent to the model is built the first time `str()` is called on it,
+    so runtimes that never need text (cache hits, bypassed calls) never pay
+    for serialization.
+    """
+
+    __slots__ = ("function", "args", "kwargs", "_text")
+
+    def __init__(self, function: str, args: tuple, kwargs: dict) -> None:
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self._text: Optional[str] = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return {"function": self.function, "args": self.args, "kwargs": self.kwargs}
+
+    def __str__(self) -> str:
+        if self._text is None:
+            self._text = json.dumps(self.to_dict(), indent=2, default=repr)
+        return self._text
+
+    def __repr__(self) -> str:
+        return f"<ProbeEvent {self.function}>"
+
+
 class Runtime:
+    # Policy applied to objects probed with this runtime unless probe() is
+    # given one.
+    policy: Optional[ProbePolicy] = None
+
     def register_probing(self, probed: "Probed"):
         pass
 
-    def listen_event(self, probed: "Probed", event_content: str, result: str) -> None:
+    def listen_event(
+        self, probed: "Probed", event_content: "ProbeEvent", result: str
+    ) -> None:
         pass
 
     def ask_model_decisions(
-        self, probed: "Probed", event_content: str
+        self, probed: "Probed", event_content: "ProbeEvent"
     ) -> tuple[bool, bool, bool]:
         pass
 
     def respond_event(
         self,
         probed: "Probed",
-        event_content: str,
+        event_content: "ProbeEvent",
         result_schema: str,
         result_example: str,
     ) -> str:
         pass
 
+    def decide_and_respond(
+        self, probed: "Probed", event_content: "ProbeEvent", result_schema: str
+    ) -> tuple[bool, bool, bool, Any]:
+        """
+        Decides about an event and, when interrupting, may already provide the
+        replacement response. Runtimes that cannot do both in one step return
+        NO_RESPONSE and respond_event is called afterwards.
+        """
+        should_interrupt, should_report, should_stop = self.ask_model_decisions(
+            probed, event_content
+        )
+        return should_interrupt, should_report, should_stop, NO_RESPONSE
+
+    # Async counterparts awaited by probed coroutine functions. By default they
+    # run the synchronous methods in a worker thread so the event loop is never
+    # blocked; runtimes with async clients override them.
+
+    async def adecide_and_respond(
+        self, probed: "Probed", event_content: "ProbeEvent", result_schema: str
+    ) -> tuple[bool, bool, bool, Any]:
+        import asyncio
+
+        return await asyncio.to_thread(
+            self.decide_and_respond, probed, event_content, result_schema
+        )
+
+    async def alisten_event(
+        self, probed: "Probed", event_content: "ProbeEvent", result: str
+    ) -> None:
+        import asyncio
+
+        await asyncio.to_thread(self.listen_event, probed, event_content, result)
+
+    async def arespond_event(
+        self,
+        probed: "Probed",
+        event_content: "ProbeEvent",
+        result_schema: str,
+        result_example: str,
+    ) -> str:
+        import asyncio
+
+        return await asyncio.to_thread(
+            self.respond_event, probed, event_content, result_schema, result_example
+        )
+
+
+_set_slot = object.__setattr__
+
+# Callables implemented in C can never be coroutine functions.
+_BUILTIN_CALLABLES = (
+    types.BuiltinFunctionType,
+    types.MethodWrapperType,
+    types.WrapperDescriptorType,
+    types.MethodDescriptorType,
+)
+
+
+# Code flags from inspect, which is only imported when the shortcuts below
+# do not apply.
+_CO_COROUTINE = 0x0080
+_CO_ITERABLE_COROUTINE = 0x0100
+
+
+def _is_coroutine_function(obj: Any) -> bool:
+    # inspect.iscoroutinefunction unwraps partials and decorators, which costs
+    # more than the rest of a probed call; take the shortcuts first.
+    if isinstance(obj, _BUILTIN_CALLABLES):
+        return False
+    func = getattr(obj, "__func__", obj)
+    code = getattr(func, "__code__", None)
+    if (
+        code is None
+        or hasattr(func, "__wrapped__")
+        or hasattr(func, "_is_coroutine_marker")
+    ):
+        import inspect
+
+        return inspect.iscoroutinefunction(obj)
+    return bool(code.co_flags & _CO_COROUTINE)
+
+
+def _is_awaitable(obj: Any) -> bool:
+    # Same answer as inspect.isawaitable.
+    return isinstance(obj, (types.CoroutineType, Awaitable)) or (
+        isinstance(obj, types.GeneratorType)
+        and bool(obj.gi_code.co_flags & _CO_ITERABLE_COROUTINE)
+    )
+
 
 class Probed(Generic[T]):
+    """
+    Proxy that routes every call on the wrapped object through a Runtime.
+
+    `Probed(obj, ...)` actually builds an instance of a proxy class generated
+    for `type(obj)` (see proxy_class), which adds the special methods of the
+    wrapped type, so operators, iteration, `in`, context managers and the like
+    are probed as well. `__repr__`, `__hash__` and `__eq__` stay local since
+    runtimes use them to keep track of probed objects.
+    """
+
+    __slots__ = (
+        "_obj",
+        "_prompt",
+        "_prefix",
+        "_entry",
+        "_runtime",
+        "_policy",
+        "_children",
+        "__weakref__",
+    )
+
+    def __new__(cls, obj: T, *args: Any, **kwargs: Any) -> "Probed[T]":
+        if cls is Probed:
+            cls = proxy_class(type(obj))
+        return object.__new__(cls)
+
     def __init__(
         self,
         obj: T,
@@ -47,74 +214,153 @@ class Probed(Generic[T]):
         prefix: str = "",
         runtime: Optional[Runtime] = None,
         entry: Optional["Probed[Any]"] = None,
+        policy: Optional[ProbePolicy] = None,
     ) -> None:
-        self._obj = obj
-        self._prompt = prompt
-        self._prefix = prefix
+        # Slots are set directly, bypassing the forwarding __setattr__.
+        _set_slot(self, "_obj", obj)
+        _set_slot(self, "_prompt", prompt)
+        _set_slot(self, "_children", None)
         if entry is not None:
-            self._entry = entry
-            self._runtime = entry._runtime
+            _set_slot(self, "_prefix", prefix)
+            _set_slot(self, "_entry", entry)
+            _set_slot(self, "_runtime", entry._runtime)
+            _set_slot(self, "_policy", entry._policy)
         else:
-            self._prefix = f"{obj.__class__.__name__}_{str(uuid.uuid4())[:8]}"
-            self._entry = self
-            self._runtime = runtime
+            _set_slot(
+                self, "_prefix", f"{obj.__class__.__name__}_{os.urandom(4).hex()}"
+            )
+            _set_slot(self, "_entry", self)
+            _set_slot(self, "_runtime", runtime)
+            _set_slot(self, "_policy", policy if policy is not None else runtime.policy)
             runtime.register_probing(self)
 
+    def _event(self, args: tuple, kwargs: dict) -> ProbeEvent:
+        return ProbeEvent(self._prefix, args, kwargs)
+
     def __call__(self, *args: Any, **kwargs: Any) -> Any:
-        data = json.dumps(
-            {
-                "function": self._prefix,
-                "args": args,
-                "kwargs": kwargs,
-            },
-            indent=2,
-        )
-        print("asking model...")
-        should_be_interrupted, should_be_reported, should_be_stopped = (
-            self._runtime.ask_model_decisions(self._entry, data)
+        policy = self._policy
+        if policy is not None and not policy.should_probe(self._prefix):
+            return self._obj(*args, **kwargs)
+        if _is_coroutine_function(self._obj):
+            return self._acall(args, kwargs)
+        if not tracing_enabled():
+            return self._call(args, kwargs, None)
+        with span("probe.call", prefix=self._prefix) as call_span:
+            return self._call(args, kwargs, call_span)
+
+    def _call(self, args: tuple, kwargs: dict, call_span: Optional[Span]) -> Any:
+        data = self._event(args, kwargs)
+        result_schema = self._obj.__doc__
+        should_be_interrupted, should_be_reported, should_be_stopped, response = (
+            self._runtime.decide_and_respond(self._entry, data, result_schema)
         )
-        print(f"should be interrupted? {should_be_interrupted}")
-        print(f"should be reported? {should_be_reported}")
-        print(f"should be stopped? {should_be_stopped}")
+        if call_span is not None:
+            call_span.set_attributes(
+                interrupted=should_be_interrupted,
+                reported=should_be_reported,
+                stopped=should_be_stopped,
+            )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "%s: interrupt=%s report=%s stop=%s",
+                self._prefix,
+                should_be_interrupted,
+                should_be_reported,
+                should_be_stopped,
+            )
         if should_be_reported:
-            report_data = {
-                "timestamp": datetime.datetime.now().isoformat(),
-                "event_data": json.loads(data),
-            }
-            with open("report.md", "a") as f:
-                f.write(yaml.dump(report_data) + "\n---\n")
+            report_event(data)
         if should_be_stopped:
             import ipdb
 
             ipdb.set_trace()
         if should_be_interrupted:
-            result_schema = self._obj.__doc__
-            print("the schema is :", result_schema)
+            if response is not NO_RESPONSE:
+                return response
             result_example = None
             try:
                 result_example = self._obj(*args, **kwargs)
-            except Exception as e:
+            except Exception:
                 pass
             return self._runtime.respond_event(
                 self._entry, data, result_schema, result_example
             )
         else:
             result = self._obj(*args, **kwargs)
+            if _is_awaitable(result):
+                return self._listen_when_done(data, result)
             self._runtime.listen_event(self._entry, data, result)
             return result
 
+    async def _listen_when_done(self, data: ProbeEvent, awaitable: Any) -> Any:
+        result = await awaitable
+        await self._runtime.alisten_event(self._entry, data, result)
+        return result
+
+    async def _acall(self, args: tuple, kwargs: dict) -> Any:
+        with span("probe.call", prefix=self._prefix) as call_span:
+            data = self._event(args, kwargs)
+            result_schema = self._obj.__doc__
+            should_be_interrupted, should_be_reported, should_be_stopped, response = (
+                await self._runtime.adecide_and_respond(
+                    self._entry, data, result_schema
+                )
+            )
+            call_span.set_attributes(
+                interrupted=should_be_interrupted,
+                reported=should_be_reported,
+                stopped=should_be_stopped,
+            )
+            if should_be_reported:
+                report_event(data)
+            if should_be_stopped:
+                import ipdb
+
+                ipdb.set_trace()
+            if should_be_interrupted:
+                if response is not NO_RESPONSE:
+                    return response
+                result_example = None
+                try:
+                    result_example = await self._obj(*args, **kwargs)
+                except Exception:
+                    pass
+                return await self._runtime.arespond_event(
+                    self._entry, data, result_schema, result_example
+                )
+            result = await self._obj(*args, **kwargs)
+            await self._runtime.alisten_event(self._entry, data, result)
+            return result
+
     def _getattr_impl(self, name: str) -> "Probed[Any]":
-        print(f"__getattr__ called for {name}")
         if name in RESERVED_FIELDS:
             return super().__getattribute__(name)
 
+        children = self._children
+        if children is not None:
+            child = children.get(name)
+            if child is not None:
+                return child
+
         attr = getattr(self._obj, name)
-        return Probed(
+        child = Probed(
             attr,
             prompt=self._prompt,
             prefix=f"{self._prefix}.{name}",
             entry=self._entry,
         )
+        # Methods bound to the wrapped object are stable, so their proxies are
+        # reused; other attributes may change between accesses. The cache holds
+        # them strongly: `probed.method(...)` drops its proxy right after the
+        # call, so weak references would be gone before the next one. A cached
+        # proxy only keeps a bound method of the wrapped object alive, which the
+        # parent keeps anyway, and there is at most one per method name.
+        if getattr(attr, "__self__", None) is self._obj:
+            if children is None:
+                children = {}
+                _set_slot(self, "_children", children)
+            children[name] = child
+        return child
 
     def __getattr__(self, name: str) -> "Probed[Any]":
         return self._getattr_impl(name)
@@ -124,24 +370,18 @@ class Probed(Generic[T]):
             super().__setattr__(name, value)
             return
 
+        if self._children is not None:
+            self._children.pop(name, None)
         setattr(self._obj, name, value)
 
-    def __getitem__(self, key: Any) -> Any:
-        result = self._obj[key]
-        return result
-
-    def __setitem__(self, key: Any, value: Any) -> None:
-        self._obj[key] = value
-
-    def __len__(self) -> Any:
-        return self._getattr_impl("__len__")()
+    def __delattr__(self, name: str) -> None:
+        if self._children is not None:
+            self._children.pop(name, None)
+        delattr(self._obj, name)
 
     def __repr__(self) -> str:
         return f"<Probe wrapping {repr(self._obj)}>"
 
-    def __str__(self) -> Any:
-        return self._getattr_impl("__str__")()
-
     def __hash__(self) -> int:
         return hash(self._prefix)
 
@@ -150,6 +390,191 @@ class Probed(Generic[T]):
             return self._obj == other._obj
         return self._obj == other
 
+    def __reduce__(self) -> tuple:
+        # Generated proxy classes cannot be found by name, so rebuild through
+        # Probed. A top level probe registers again under a new prefix.
+        entry = None if self._entry is self else self._entry
+        return (
+            Probed,
+            (self._obj, self._prompt, self._prefix, self._runtime, entry, self._policy),
+        )
+
+    def __copy__(self) -> "Probed[T]":
+        rebuild, args = self.__reduce__()
+        return rebuild(copy.copy(self._obj), *args[1:])
+
+    def __deepcopy__(self, memo: dict) -> "Probed[T]":
+        rebuild, args = self.__reduce__()
+        return rebuild(copy.deepcopy(self._obj, memo), *args[1:])
+
+
+# Special methods routed through the runtime when the wrapped type has them,
+# grouped by how their result is adapted to what the data model expects.
+_PROBED_SPECIAL_METHODS = {
+    "call": (
+        "__len__",
+        "__length_hint__",
+        "__contains__",
+        "__getitem__",
+        "__setitem__",
+        "__delitem__",
+        "__next__",
+        "__lt__",
+        "__le__",
+        "__gt__",
+        "__ge__",
+        "__int__",
+        "__float__",
+        "__complex__",
+        "__index__",
+        "__round__",
+        "__trunc__",
+        "__floor__",
+        "__ceil__",
+        "__abs__",
+        "__neg__",
+        "__pos__",
+        "__invert__",
+        "__exit__",
+        "__aiter__",
+        "__anext__",
+        "__aexit__",
+    )
+    + tuple(
+        f"__{prefix}{op}__"
+        for op in (
+            "add",
+            "sub",
+            "mul",
+            "matmul",
+            "truediv",
+            "floordiv",
+            "mod",
+            "divmod",
+            "pow",
+            "lshift",
+            "rshift",
+            "and",
+            "xor",
+            "or",
+        )
+        for prefix in ("", "r")
+    ),
+    "self": ("__enter__",)
+    + tuple(
+        f"__i{op}__"
+        for op in (
+            "add",
+            "sub",
+            "mul",
+            "matmul",
+            "truediv",
+            "floordiv",
+            "mod",
+            "pow",
+            "lshift",
+            "rshift",
+            "and",
+            "xor",
+            "or",
+        )
+    ),
+    "aself": ("__aenter__",),
+    "iter": ("__iter__", "__reversed__"),
+    "bool": ("__bool__",),
+    "str": ("__str__", "__format__"),
+    "bytes": ("__bytes__",),
+}
+
+_ADAPTERS = {
+    "call": lambda proxy, result: result,
+    # In-place operators and __enter__ usually return the object itself, keep
+    # handing out the proxy in that case.
+    "self": lambda proxy, result: proxy if result is proxy._obj else result,
+    "aself": lambda proxy, result: (
+        _await_self(proxy, result)
+        if _is_awaitable(result)
+        else _ADAPTERS["self"](proxy, result)
+    ),
+    # An interrupted call may answer with a plain list instead of an iterator.
+    "iter": lambda proxy, result: (
+        result if hasattr(result, "__next__") else iter(result)
+    ),
+    "bool": lambda proxy, result: bool(result),
+    "str": lambda proxy, result: result if isinstance(result, str) else str(result),
+    "bytes": lambda proxy, result: (
+        result if isinstance(result, bytes) else bytes(result)
+    ),
+}
+
+
+async def _await_self(proxy: Probed, awaitable: Any) -> Any:
+    result = await awaitable
+    return proxy if result is proxy._obj else result
+
+
+def _unwrap(value: Any) -> Any:
+    return value._obj if isinstance(value, Probed) else value
+
+
+def _special_method(name: str, adapt: Any) -> Any:
+    def method(self: Probed, *args: Any) -> Any:
+        if args:
+            args = tuple(_unwrap(arg) for arg in args)
+        return adapt(self, self._getattr_impl(name)(*args))
+
+    method.__name__ = name
+    method.__qualname__ = f"Probed.{name}"
+    return method
+
+
+_SPECIAL_METHOD_TABLE = {
+    name: _special_method(name, _ADAPTERS[kind])
+    for kind, names in _PROBED_SPECIAL_METHODS.items()
+    for name in names
+}
+
+# Inherited object defaults that still have to reach the wrapped object rather
+# than the proxy's own, e.g. so that str() does not show the proxy repr.
+_LOCAL_DEFAULTS = {
+    "__str__": lambda self: str(self._obj),
+    "__format__": lambda self, format_spec: format(self._obj, format_spec),
+}
+
+_PROXY_CLASSES: "weakref.WeakKeyDictionary[type, type]" = weakref.WeakKeyDictionary()
+
+
+def proxy_class(wrapped_type: type) -> type:
+    """
+    Returns the Probed subclass for `wrapped_type`, generating it on first use.
+    The class only defines the special methods the wrapped type implements,
+    so `iter(probed)` still fails for objects that are not iterable. Methods
+    inherited unchanged from `object` are not probed.
+    """
+    cls = _PROXY_CLASSES.get(wrapped_type)
+    if cls is None:
+        namespace: dict[str, Any] = {"__slots__": ()}
+        for name, method in _SPECIAL_METHOD_TABLE.items():
+            implementation = getattr(wrapped_type, name, None)
+            if implementation is None:
+                continue
+            if implementation is getattr(object, name, None):
+                # Defaults every object inherits are not worth a model decision.
+                local = _LOCAL_DEFAULTS.get(name)
+                if local is not None:
+                    namespace[name] = local
+                continue
+            namespace[name] = method
+        cls = type(f"Probed[{wrapped_type.__name__}]", (Probed,), namespace)
+        try:
+            _PROXY_CLASSES[wrapped_type] = cls
+        except TypeError:
+            # Some extension types cannot be weakly referenced.
+            pass
+    return cls
+
 
-def probe(value: T, prompt: str, runtime: Runtime) -> Probed[T]:
-    return Probed(value, prompt, runtime=runtime)
+def probe(
+    value: T, prompt: str, runtime: Runtime, policy: Optional[ProbePolicy] = None
+) -> Probed[T]:
+    return Probed(value, prompt, runtime=runtime, policy=policy)
@@ -0,0 +1,292 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+from python_runtime.tracing import span
+
+logger = logging.getLogger(__name__)
+
+REPORT_FILE = "report.jsonl"
+
+
+def snapshot(event_content: Any) -> tuple[str, bool]:
+    """
+    The text of a reported event, taken on the probed thread so that later
+    mutations of the arguments do not leak in, and whether it already is
+    compact json. An event rendered for the model prompt reuses that text;
+    otherwise it is encoded once, compactly, to be written as is.
+    """
+    # A ProbeEvent keeps the text it rendered for the prompt, if any.
+    text = getattr(event_content, "_text", None)
+    if text is not None:
+        return text, False
+    to_dict = getattr(event_content, "to_dict", None)
+    if to_dict is not None:
+        return json.dumps(to_dict(), default=repr), True
+    return str(event_content), False
+
+
+def format_record(event_text: str, timestamp: float, compact: bool = False) -> str:
+    """
+    One report as a single json line, without the trailing newline. Unless
+    `compact`, event_text is decoded when it is json and kept as a string
+    otherwise.
+    """
+    if not compact:
+        try:
+            event_data = json.loads(event_text)
+        except ValueError:
+            event_data = event_text
+        event_text = json.dumps(event_data, default=repr)
+    stamp = datetime.datetime.fromtimestamp(timestamp).isoformat()
+    return f'{{"timestamp": "{stamp}", "event_data": {event_text}}}'
+
+
+class ReportSink:
+    """
+    Destination of report lines. `write` receives a batch of json lines
+    (without newlines) from the reporter thread, never from the probed call.
+    """
+
+    def write(self, lines: list[str]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class FileSink(ReportSink):
+    """
+    Appends reports to a jsonl file, one record per line. Once the file grows
+    past `max_bytes` it is rotated to `path.1`, `path.2`, ... keeping at most
+    `backups` old files.
+    """
+
+    def __init__(
+        self,
+        path: str = REPORT_FILE,
+        max_bytes: Optional[int] = 10 * 1024 * 1024,
+        backups: int = 3,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _rotate(self) -> None:
+        self.close()
+        if self.backups <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def write(self, lines: list[str]) -> None:
+        file = self._open()
+        # Rotate before writing so the live file always holds the latest batch.
+        if self.max_bytes is not None and file.tell() >= max(self.max_bytes, 1):
+            self._rotate()
+            file = self._open()
+        file.write("\n".join(lines) + "\n")
+        file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SocketSink(ReportSink):
+    """
+    Streams reports as jsonl over TCP, e.g. to a collector on another machine.
+    Reconnects on the next batch when the connection drops; batches written
+    while the peer is unreachable are dropped.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 5.0):
+        self.address = (host, port)
+        self.timeout = timeout
+        self._socket: Optional["socket.socket"] = None
+
+    def write(self, lines: list[str]) -> None:
+        payload = ("\n".join(lines) + "\n").encode("utf-8")
+        try:
+            if self._socket is None:
+                import socket
+
+                self._socket = socket.create_connection(self.address, self.timeout)
+            self._socket.sendall(payload)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            finally:
+                self._socket = None
+
+
+class MemorySink(ReportSink):
+    """Keeps the latest `max_records` reports in memory, decoded."""
+
+    def __init__(self, max_records: Optional[int] = 10_000):
+        self.records: deque[dict[str, Any]] = deque(maxlen=max_records)
+
+    def write(self, lines: list[str]) -> None:
+        self.records.extend(json.loads(line) for line in lines)
+
+
+class Reporter:
+    """
+    Buffers reported events in memory and hands them to a sink in batches
+    from a background thread.
+
+    `report` only appends a snapshot of the event and the time to a list:
+    the text already rendered for the model prompt when there is one, else a
+    compact json encoding that is written without being decoded again (see
+    snapshot), so reporting costs the probed program no file access. A batch is
+    written once `batch_size` events are pending or `flush_interval` seconds
+    after the first one arrived. When more than `max_pending` events are
+    waiting (a slow or broken sink) the oldest ones are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        sink: Optional[ReportSink] = None,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        max_pending: int = 100_000,
+    ):
+        self.sink = sink if sink is not None else FileSink()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self.written = 0
+        self._pending: list[tuple[str, bool, float]] = []
+        self._condition = threading.Condition()
+        self._flushed = threading.Condition(self._condition)
+        self._in_progress = 0
+        self._flush_requested = False
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="python-runtime-reporter", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def report(self, event_content: Any) -> None:
+        entry = (*snapshot(event_content), time.time())
+        if self._closed:
+            self._write([entry])
+            return
+        with self._condition:
+            self._pending.append(entry)
+            excess = len(self._pending) - self.max_pending
+            if excess > 0:
+                del self._pending[:excess]
+                self.dropped += excess
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._condition.notify()
+
+    def flush(self) -> None:
+        """Blocks until every event reported so far has been handed to the sink."""
+        batch: list[tuple[str, bool, float]] = []
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify()
+            while self._pending or self._in_progress:
+                if not self._thread.is_alive():
+                    # The reporter thread is gone, what it left is written here.
+                    batch, self._pending = self._pending, []
+                    self._in_progress = 0
+                    break
+                self._flushed.wait(timeout=0.1)
+        if batch:
+            self._write(batch)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+        self.sink.close()
+
+    def _write(self, batch: list[tuple[str, bool, float]]) -> None:
+        try:
+            with span("report.write", events=len(batch)):
+                self.sink.write(
+                    [format_record(event, at, compact) for event, compact, at in batch]
+                )
+            self.written += len(batch)
+        except Exception:
+            self.dropped += len(batch)
+            logger.exception("writing %d reports failed", len(batch))
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if not self._pending and not self._closed:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.flush_interval
+                while (
+                    len(self._pending) < self.batch_size
+                    and not self._closed
+                    and not self._flush_requested
+                    and (remaining := deadline - time.monotonic()) > 0
+                ):
+                    self._condition.wait(timeout=remaining)
+                batch, self._pending = self._pending, []
+                closed = self._closed
+                self._flush_requested = False
+                self._in_progress = len(batch)
+            if batch:
+                self._write(batch)
+            with self._condition:
+                self._in_progress = 0
+                self._flushed.notify_all()
+            if closed and not batch:
+                return
+
+
+_reporter: Optional[Reporter] = None
+_reporter_lock = threading.Lock()
+
+
+def get_reporter() -> Reporter:
+    """The process wide reporter, writing to report.jsonl unless replaced."""
+    global _reporter
+    if _reporter is None:
+        with _reporter_lock:
+            if _reporter is None:
+                _reporter = Reporter()
+    return _reporter
+
+
+def set_reporter(reporter: Reporter) -> Optional[Reporter]:
+    """Replaces the process wide reporter and returns the previous one."""
+    global _reporter
+    with _reporter_lock:
+        previous, _reporter = _reporter, reporter
+    return previous
+
+
+def report_event(event_content: Any) -> None:
+    get_reporter().report(event_content)
@@ -0,0 +1,548 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# When set, spans and metrics are written to this file (see get_tracer).
+TRACE_FILE_ENV = "PROBE_TRACE_FILE"
+
+SCOPE = {"name": "puppeteer", "version": "0.1.0"}
+
+# Upper bounds, in milliseconds, of the buckets of latency histograms.
+LATENCY_BUCKETS_MS = (
+    1.0,
+    5.0,
+    10.0,
+    25.0,
+    50.0,
+    100.0,
+    250.0,
+    500.0,
+    1000.0,
+    2500.0,
+    5000.0,
+    10000.0,
+    30000.0,
+)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "python_runtime_current_span", default=None
+)
+
+
+def _otel_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otel_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {"key": key, "value": _otel_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class Span:
+    """
+    One timed stage of a probed call. Spans opened while another one is active
+    in the same thread (or task) become its children and share its trace id.
+    Used as a context manager; an exception leaving the block marks it failed.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+        "_tracer",
+        "_token",
+    )
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        attributes: dict[str, Any],
+        parent: Optional["Span"],
+    ) -> None:
+        self.name = name
+        self.trace_id = (
+            parent.trace_id if parent is not None else f"{random.getrandbits(128):032x}"
+        )
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.end_ns: Optional[int] = None
+        self._tracer = tracer
+        self._token: Optional[contextvars.Token] = None
+        self.start_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            self._tracer._finish(self)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        self.end()
+
+    def to_otel(self) -> dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": _otel_attributes(self.attributes),
+            "status": (
+                {"code": 2, "message": self.error}
+                if self.error is not None
+                else {"code": 1}
+            ),
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+    def __repr__(self) -> str:
+        return f"<Span {self.name} {self.duration_ms:.2f}ms>"
+
+
+class _NoopSpan:
+    """Returned while tracing is disabled, so instrumented code costs a call."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, traceback: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Histogram:
+    """Count, sum and bucket counts of recorded values, as OpenTelemetry has them."""
+
+    __slots__ = ("bounds", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, bounds: tuple[float, ...] = LATENCY_BUCKETS_MS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else 0.0,
+            "max": self.max if self.count else 0.0,
+            "bucket_counts": list(self.counts),
+            "bounds": list(self.bounds),
+        }
+
+
+Attributes = tuple[tuple[str, Any], ...]
+
+
+class Metrics:
+    """Counters and histograms keyed by name and attributes."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: dict[str, dict[Attributes, float]] = {}
+        self.histograms: dict[str, dict[Attributes, Histogram]] = {}
+
+    def add(self, name: str, value: float = 1, /, **attributes: Any) -> None:
+        key = tuple(sorted(attributes.items()))
+        with self._lock:
+            points = self.counters.setdefault(name, {})
+            points[key] = points.get(key, 0) + value
+
+    def record(self, name: str, value: float, /, **attributes: Any) -> None:
+        key = tuple(sorted(attributes.items()))
+        with self._lock:
+            points = self.histograms.setdefault(name, {})
+            histogram = points.get(key)
+            if histogram is None:
+                histogram = points[key] = Histogram()
+            histogram.record(value)
+
+    def counter(self, name: str, /, **attributes: Any) -> float:
+        with self._lock:
+            return self.counters.get(name, {}).get(tuple(sorted(attributes.items())), 0)
+
+    def histogram(self, name: str, /, **attributes: Any) -> Optional[Histogram]:
+        with self._lock:
+            return self.histograms.get(name, {}).get(tuple(sorted(attributes.items())))
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": {
+                    name: [
+                        {"attributes": dict(key), "value": value}
+                        for key, value in points.items()
+                    ]
+                    for name, points in self.counters.items()
+                },
+                "histograms": {
+                    name: [
+                        {"attributes": dict(key), **histogram.to_dict()}
+                        for key, histogram in points.items()
+                    ]
+                    for name, points in self.histograms.items()
+                },
+            }
+
+    def to_otel(self, time_ns: int) -> list[dict[str, Any]]:
+        snapshot = self.snapshot()
+        metrics = []
+        for name, points in snapshot["counters"].items():
+            metrics.append(
+                {
+                    "name": name,
+                    "sum": {
+                        "aggregationTemporality": 2,
+                        "isMonotonic": True,
+                        "dataPoints": [
+                            {
+                                "attributes": _otel_attributes(point["attributes"]),
+                                "timeUnixNano": str(time_ns),
+                                "asDouble": float(point["value"]),
+                            }
+                            for point in points
+                        ],
+                    },
+                }
+            )
+        for name, points in snapshot["histograms"].items():
+            metrics.append(
+                {
+                    "name": name,
+                    "unit": "ms",
+                    "histogram": {
+                        "aggregationTemporality": 2,
+                        "dataPoints": [
+                            {
+                                "attributes": _otel_attributes(point["attributes"]),
+                                "timeUnixNano": str(time_ns),
+                                "count": str(point["count"]),
+                                "sum": point["sum"],
+                                "min": point["min"],
+                                "max": point["max"],
+                                "bucketCounts": [
+                                    str(c) for c in point["bucket_counts"]
+                                ],
+                                "explicitBounds": point["bounds"],
+                            }
+                            for point in points
+                        ],
+                    },
+                }
+            )
+        return metrics
+
+
+class SpanExporter:
+    """
+    Destination of finished spans and metric snapshots. `export` receives
+    batches of spans, `export_metrics` the current metrics on every flush.
+    """
+
+    def export(self, spans: list[Span]) -> None:
+        raise NotImplementedError
+
+    def export_metrics(self, metrics: Metrics) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryExporter(SpanExporter):
+    """Keeps finished spans in memory, e.g. to assert on them in tests."""
+
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+        self.metrics: Optional[dict[str, Any]] = None
+
+    def export(self, spans: list[Span]) -> None:
+        self.spans.extend(spans)
+
+    def export_metrics(self, metrics: Metrics) -> None:
+        self.metrics = metrics.snapshot()
+
+    def find(self, name: str) -> list[Span]:
+        return [span for span in self.spans if span.name == name]
+
+    def children(self, parent: Span) -> list[Span]:
+        return [span for span in self.spans if span.parent_id == parent.span_id]
+
+    def clear(self) -> None:
+        self.spans.clear()
+        self.metrics = None
+
+
+class OTelJSONFileExporter(SpanExporter):
+    """
+    Appends OpenTelemetry (OTLP/JSON) export requests to a file, one per line:
+    a `resourceSpans` line per batch of spans and a `resourceMetrics` line per
+    flush, which collectors and viewers that read OTLP files can load.
+    """
+
+    def __init__(self, path: str = "traces.jsonl", service_name: str = "puppeteer"):
+        self.path = path
+        self.resource = {
+            "attributes": _otel_attributes(
+                {"service.name": service_name, "process.pid": os.getpid()}
+            )
+        }
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _write(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, default=repr)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def export(self, spans: list[Span]) -> None:
+        self._write(
+            {
+                "resourceSpans": [
+                    {
+                        "resource": self.resource,
+                        "scopeSpans": [
+                            {
+                                "scope": SCOPE,
+                                "spans": [span.to_otel() for span in spans],
+                            }
+                        ],
+                    }
+                ]
+            }
+        )
+
+    def export_metrics(self, metrics: Metrics) -> None:
+        otel_metrics = metrics.to_otel(time.time_ns())
+        if not otel_metrics:
+            return
+        self._write(
+            {
+                "resourceMetrics": [
+                    {
+                        "resource": self.resource,
+                        "scopeMetrics": [{"scope": SCOPE, "metrics": otel_metrics}],
+                    }
+                ]
+            }
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Tracer:
+    """
+    Records nested timing spans and metrics for probed calls.
+
+    `span(name, **attributes)` opens a span as a child of the active one. Every
+    finished span also feeds the `span.duration` histogram for its name, so
+    latency distributions are available without reading the spans. Finished
+    spans are handed to the exporter in batches of `batch_size`, on `flush`
+    and at exit. Without an exporter the tracer is disabled: `span` returns a
+    shared no-op span and metrics are not recorded.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, batch_size: int = 512):
+        self.exporter = exporter
+        self.enabled = exporter is not None
+        self.batch_size = batch_size
+        self.metrics = Metrics()
+        self._lock = threading.Lock()
+        self._finished: list[Span] = []
+        if self.enabled:
+            atexit.register(self.close)
+
+    def span(self, name: str, /, **attributes: Any) -> Span | _NoopSpan:
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes, _current_span.get())
+
+    def add(self, name: str, value: float = 1, /, **attributes: Any) -> None:
+        if self.enabled:
+            self.metrics.add(name, value, **attributes)
+
+    def record(self, name: str, value: float, /, **attributes: Any) -> None:
+        if self.enabled:
+            self.metrics.record(name, value, **attributes)
+
+    def _finish(self, span: Span) -> None:
+        self.metrics.record(
+            "span.duration", span.duration_ms, span=span.name, ok=span.error is None
+        )
+        with self._lock:
+            self._finished.append(span)
+            if len(self._finished) < self.batch_size:
+                return
+            batch, self._finished = self._finished, []
+        self._export(batch)
+
+    def _export(self, batch: list[Span]) -> None:
+        try:
+            self.exporter.export(batch)
+        except Exception:
+            logger.exception("exporting %d spans failed", len(batch))
+
+    def flush(self) -> None:
+        """Exports every finished span and the current metrics."""
+        if not self.enabled:
+            return
+        with self._lock:
+            batch, self._finished = self._finished, []
+        if batch:
+            self._export(batch)
+        try:
+            self.exporter.export_metrics(self.metrics)
+        except Exception:
+            logger.exception("exporting metrics failed")
+
+    def close(self) -> None:
+        if self.enabled:
+            self.flush()
+            self.exporter.close()
+            self.enabled = False
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """
+    The process wide tracer. Unless replaced with set_tracer it writes to the
+    file named by PROBE_TRACE_FILE, and is disabled when that is not set.
+    """
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                path = os.getenv(TRACE_FILE_ENV)
+                _tracer = Tracer(OTelJSONFileExporter(path) if path else None)
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> Optional[Tracer]:
+    """Replaces the process wide tracer and returns the previous one."""
+    global _tracer
+    with _tracer_lock:
+        previous, _tracer = _tracer, tracer
+    return previous
+
+
+def span(name: str, /, **attributes: Any) -> Span | _NoopSpan:
+    """Opens a span on the process wide tracer."""
+    tracer = _tracer if _tracer is not None else get_tracer()
+    # Same as tracer.span, inlined since it runs on every probed call.
+    if not tracer.enabled:
+        return NOOP_SPAN
+    return Span(tracer, name, attributes, _current_span.get())
+
+
+def tracing_enabled() -> bool:
+    tracer = _tracer if _tracer is not None else get_tracer()
+    return tracer.enabled
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def add(name: str, value: float = 1, /, **attributes: Any) -> None:
+    """Adds to a counter of the process wide tracer."""
+    tracer = _tracer if _tracer is not None else get_tracer()
+    tracer.add(name, value, **attributes)
+
+
+def record(name: str, value: float, /, **attributes: Any) -> None:
+    """Records a value in a histogram of the process wide tracer."""
+    tracer = _tracer if _tracer is not None else get_tracer()
+    tracer.record(name, value, **attributes)
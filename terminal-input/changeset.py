@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+from project_index import default_cache_dir
+
+PENDING = "pending"
+COMMITTED = "committed"
+UNDONE = "undone"
+ROLLED_BACK = "rolled_back"
+
+
+class ChangesetError(Exception):
+    pass
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes, mode: Optional[int] = None):
+    """Write data next to path and rename it into place, so readers never see half a file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+class BackupStore:
+    """
+    Content-addressed store of file versions, kept outside the project. Identical
+    contents are stored once, however many changesets refer to them.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        digest = _digest(data)
+        path = self._path(digest)
+        if not path.exists():
+            _write_atomic(path, data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        with open(self._path(digest), "rb") as f:
+            return f.read()
+
+
+class ChangesetManager:
+    """
+    Applies a set of file changes as one transaction and can undo the last ones.
+
+    Every new file content is first written to a temp file next to its target, and
+    the previous content is saved in the BackupStore. A journal listing the before
+    and after hash of every file is written before the first rename, then all temp
+    files are renamed over their targets. If anything fails the renamed files are
+    restored and the rest discarded; if the process dies halfway, `recover` (run on
+    start) finds the pending journal and restores the previous contents.
+    """
+
+    def __init__(self, root, store_dir: Optional[Path] = None):
+        self.root = Path(root).resolve()
+        root_id = hashlib.sha1(str(self.root).encode("utf-8")).hexdigest()[:16]
+        base = Path(store_dir) if store_dir else default_cache_dir() / f"changesets-{root_id}"
+        self.store = BackupStore(base / "objects")
+        self.journal_dir = base / "journal"
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+
+    def _journal_path(self, changeset_id: str) -> Path:
+        return self.journal_dir / f"{changeset_id}.json"
+
+    def _save_journal(self, journal: dict):
+        _write_atomic(self._journal_path(journal["id"]), json.dumps(journal, indent=2).encode("utf-8"))
+
+    def journals(self) -> list:
+        """All changesets, oldest first"""
+        journals = []
+        for path in sorted(self.journal_dir.glob("*.json")):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    journals.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return journals
+
+    def _restore(self, rel_path: str, digest: Optional[str]):
+        path = self.root / rel_path
+        if digest is None:
+            if path.exists():
+                path.unlink()
+        else:
+            _write_atomic(path, self.store.get(digest), self._mode(path))
+
+    @staticmethod
+    def _mode(path: Path) -> Optional[int]:
+        try:
+            return os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            return None
+
+    def apply(self, changes: dict, description: str = "") -> dict:
+        """Write {relative path: new text} atomically as one changeset and return its journal"""
+        changeset_id = f"{time.time_ns():020d}"
+        journal = {"id": changeset_id, "time": time.time(), "description": description, "state": PENDING, "files": []}
+        staged = []
+        try:
+            for rel_path, new_content in changes.items():
+                path = self.root / rel_path
+                if not path.resolve().is_relative_to(self.root):
+                    raise ChangesetError(f"{rel_path} is outside the project")
+                before = None
+                if path.exists():
+                    with open(path, "rb") as f:
+                        before = self.store.put(f.read())
+                data = new_content.encode("utf-8")
+                after = self.store.put(data)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+                staged.append((tmp_name, path))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                mode = self._mode(path)
+                if mode is not None:
+                    os.chmod(tmp_name, mode)
+                journal["files"].append({"path": rel_path, "before": before, "after": after})
+        except BaseException:
+            for tmp_name, _ in staged:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+            raise
+
+        # From here on the journal lets an interrupted commit be rolled back
+        self._save_journal(journal)
+        committed = []
+        try:
+            for (tmp_name, path), entry in zip(staged, journal["files"]):
+                os.replace(tmp_name, path)
+                committed.append(entry)
+        except BaseException:
+            for entry in reversed(committed):
+                self._restore(entry["path"], entry["before"])
+            for tmp_name, _ in staged:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+            journal["state"] = ROLLED_BACK
+            self._save_journal(journal)
+            raise
+        journal["state"] = COMMITTED
+        self._save_journal(journal)
+        return journal
+
+    def undo(self, count: int = 1) -> list:
+        """
+        Restore the files of the last `count` committed changesets, newest first.
+        Returns (changeset, conflicts) pairs; a conflict is a file edited since the
+        changeset was applied, which is left alone.
+        """
+        undone = []
+        committed = [journal for journal in self.journals() if journal["state"] == COMMITTED]
+        for journal in reversed(committed[-count:] if count > 0 else []):
+            conflicts = []
+            for entry in reversed(journal["files"]):
+                path = self.root / entry["path"]
+                current = None
+                if path.exists():
+                    with open(path, "rb") as f:
+                        current = _digest(f.read())
+                if current != entry["after"]:
+                    conflicts.append(entry["path"])
+                    continue
+                self._restore(entry["path"], entry["before"])
+            journal["state"] = UNDONE
+            journal["conflicts"] = conflicts
+            self._save_journal(journal)
+            undone.append((journal, conflicts))
+        return undone
+
+    def recover(self) -> list:
+        """Roll back changesets left pending by a crash during commit"""
+        recovered = []
+        for journal in self.journals():
+            if journal["state"] != PENDING:
+                continue
+            for entry in journal["files"]:
+                path = self.root / entry["path"]
+                # Only files already renamed into place carry the new content
+                if path.exists():
+                    with open(path, "rb") as f:
+                        if _digest(f.read()) != entry["after"]:
+                            continue
+                elif entry["before"] is None:
+                    continue
+                self._restore(entry["path"], entry["before"])
+            for entry in journal["files"]:
+                path = self.root / entry["path"]
+                for stale in path.parent.glob(f".{path.name}.*.tmp"):
+                    stale.unlink()
+            journal["state"] = ROLLED_BACK
+            self._save_journal(journal)
+            recovered.append(journal)
+        return recovered
@@ -0,0 +1,207 @@
+import ast
+import math
+import re
+from collections import Counter
+
+DEFAULT_TOKEN_BUDGET = 200000
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+# Weight of query terms coming from the project description, relative to the request
+DESCRIPTION_WEIGHT = 0.3
+# Extra score for a file defining a symbol named in the query, or named in it
+SYMBOL_BOOST = 2.0
+PATH_BOOST = 5.0
+EXCERPT_LINES = 40
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it of on or that the this to was were will with "
+    "self def class return import none true false".split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def tokenize(text: str) -> list:
+    """Words and identifiers, plus the parts of snake_case and camelCase identifiers"""
+    tokens = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        if lower not in _STOPWORDS and len(lower) > 1:
+            tokens.append(lower)
+        parts = [part.lower() for piece in word.split("_") for part in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part not in _STOPWORDS and len(part) > 1)
+    return tokens
+
+
+def python_symbols(source: str) -> set:
+    """Lowercased names of the classes, functions and assignments defined in a module"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return {match.lower() for match in re.findall(r"^\s*(?:class|def)\s+(\w+)", source, re.MULTILINE)}
+    symbols = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.add(node.name.lower())
+        elif isinstance(node, ast.Assign) and node in tree.body:
+            symbols.update(target.id.lower() for target in node.targets if isinstance(target, ast.Name))
+    return symbols
+
+
+def _section_body(section: str) -> str:
+    return section.split("\n", 1)[1] if "\n" in section else ""
+
+
+class _Document:
+    __slots__ = ("digest", "terms", "length", "symbols", "path_terms")
+
+    def __init__(self, rel_path: str, digest, section: str):
+        body = _section_body(section)
+        self.digest = digest
+        self.terms = Counter(tokenize(body))
+        self.length = sum(self.terms.values())
+        self.symbols = python_symbols(body) if rel_path.endswith(".py") else set()
+        self.path_terms = set(tokenize(rel_path))
+
+
+class ContextSelector:
+    """
+    Picks the project files most relevant to a request and fits them into a token
+    budget, instead of sending the whole project.
+
+    Files are ranked with BM25 over their words and identifier parts, boosted when
+    they define a Python class or function named in the query or when their path is
+    mentioned. The most relevant files are included whole while they fit; a file
+    that does not fit contributes its best matching excerpts. Files sharing no term
+    with the query are left out, so the prompt grows with the request rather than
+    with the repository. Term statistics are kept per file and only recomputed when
+    the file's content hash changes in the ProjectIndex.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self.documents = {}
+        self.document_frequency = Counter()
+        self.total_length = 0
+
+    def update(self, project_index):
+        """Sync the term statistics with the files currently in the index"""
+        for rel_path in list(self.documents):
+            entry = project_index.entries.get(rel_path)
+            if entry is None or entry["hash"] != self.documents[rel_path].digest:
+                self._remove(rel_path)
+        for rel_path in project_index.order:
+            if rel_path not in self.documents:
+                entry = project_index.entries[rel_path]
+                document = _Document(rel_path, entry["hash"], entry["section"])
+                self.documents[rel_path] = document
+                self.document_frequency.update(document.terms.keys())
+                self.total_length += document.length
+
+    def _remove(self, rel_path: str):
+        document = self.documents.pop(rel_path)
+        frequency = self.document_frequency
+        for term in document.terms:
+            if frequency[term] <= 1:
+                del frequency[term]  # no file uses it anymore
+            else:
+                frequency[term] -= 1
+        self.total_length -= document.length
+
+    def _query_weights(self, request: str, description: str) -> Counter:
+        weights = Counter()
+        for term in tokenize(request):
+            weights[term] += 1.0
+        for term in tokenize(description):
+            weights[term] += DESCRIPTION_WEIGHT
+        return weights
+
+    def score(self, request: str, description: str = "") -> list:
+        """(score, path) for every file sharing a term with the query, best first"""
+        weights = self._query_weights(request, description)
+        request_terms = set(tokenize(request))
+        count = len(self.documents) or 1
+        average_length = (self.total_length / count) or 1.0
+        idf = {
+            term: math.log(1 + (count - self.document_frequency[term] + 0.5) / (self.document_frequency[term] + 0.5))
+            for term in weights
+        }
+        scores = []
+        for rel_path, document in self.documents.items():
+            score = 0.0
+            norm = K1 * (1 - B + B * document.length / average_length)
+            for term, weight in weights.items():
+                frequency = document.terms.get(term)
+                if frequency:
+                    score += weight * idf[term] * frequency * (K1 + 1) / (frequency + norm)
+            score += SYMBOL_BOOST * sum(idf[term] for term in request_terms & document.symbols)
+            score += sum(idf[term] for term in request_terms & document.path_terms)
+            if rel_path in request or rel_path.rsplit("/", 1)[-1] in request:
+                score += PATH_BOOST * max(idf.values(), default=1.0)
+            if score > 0:
+                scores.append((score, rel_path))
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        return scores
+
+    def _excerpt(self, rel_path: str, section: str, weights: Counter, budget: int) -> str:
+        """The windows of lines with the most query terms, in file order, within budget"""
+        lines = _section_body(section).split("\n")
+        windows = []
+        for start in range(0, len(lines), EXCERPT_LINES // 2):
+            window = lines[start:start + EXCERPT_LINES]
+            hits = sum(weights.get(term, 0) for term in tokenize("\n".join(window)))
+            if hits:
+                windows.append((hits, start))
+        windows.sort(key=lambda item: (-item[0], item[1]))
+
+        used = 0
+        covered = set()
+        for _, start in windows:
+            end = min(start + EXCERPT_LINES, len(lines))
+            new_lines = [index for index in range(start, end) if index not in covered]
+            cost = estimate_tokens("\n".join(lines[index] for index in new_lines))
+            if used + cost > budget:
+                continue
+            covered.update(new_lines)
+            used += cost
+        if not covered:
+            return ""
+
+        parts, previous = [], None
+        for index in sorted(covered):
+            if previous is not None and index != previous + 1:
+                parts.append("...")
+            parts.append(lines[index])
+            previous = index
+        first, last = min(covered) + 1, max(covered) + 1
+        return f"=== {rel_path} (excerpt, lines {first}-{last} of {len(lines)}) ===\n" + "\n".join(parts) + "\n"
+
+    def select(self, project_index, request: str, description: str = "", exclude=(), token_budget: int = None) -> tuple:
+        """The context for a request and the paths it includes, within the token budget"""
+        self.update(project_index)
+        weights = self._query_weights(request, description)
+        remaining = self.token_budget if token_budget is None else token_budget
+        sections, included = [], []
+        for _, rel_path in self.score(request, description):
+            if remaining <= 0:
+                break
+            if rel_path in exclude:
+                continue
+            section = project_index.section(rel_path)
+            cost = estimate_tokens(section)
+            if cost > remaining:
+                section = self._excerpt(rel_path, section, weights, remaining)
+                cost = estimate_tokens(section)
+                if not section:
+                    continue
+            sections.append(section)
+            included.append(rel_path)
+            remaining -= cost
+        return "\n".join(sections), included
@@ -0,0 +1,210 @@
+import fnmatch
+import os
+import re
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional
+
+PROJECT_IGNORE_FILE = ".marionetteignore"
+
+# Directories never worth descending into, whatever the ignore files say
+IGNORED_DIRS = frozenset({"node_modules", "__pycache__", "site-packages", "venv"})
+IGNORED_SUFFIXES = frozenset({".pyc", ".pyo", ".exe", ".bin", ".so", ".dll", ".dylib", ".o", ".a", ".backup"})
+# Files the terminal and the runtime write into the project themselves, with their
+# rotated copies, temporary files and sqlite journals
+IGNORED_FILES = (
+    "terminal_debug.log",
+    "user_query.md",
+    "probe_policy.json",
+    "report.jsonl*",
+    "traces.jsonl*",
+    "*.tmp",
+    "*.sqlite3",
+    "*.sqlite3-*",
+)
+_IGNORED_FILE = re.compile("|".join(fnmatch.translate(pattern) for pattern in IGNORED_FILES))
+
+SNIFF_BYTES = 8000
+
+
+class ScannedFile(NamedTuple):
+    rel_path: str
+    path: str
+
+
+def is_binary(path: str) -> bool:
+    """Sniff the first bytes of a file: a NUL byte means binary, as git decides"""
+    try:
+        with open(path, "rb") as f:
+            return b"\0" in f.read(SNIFF_BYTES)
+    except OSError:
+        return True
+
+
+def _translate(pattern: str) -> str:
+    """Translate one gitignore glob into a regex matching a relative posix path"""
+    regex = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            regex.append("/.*")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex.append(f"[{body}]")
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(char))
+        i += 1
+    return "".join(regex)
+
+
+class IgnoreRules:
+    """The rules of one .gitignore style file, relative to the directory holding it"""
+
+    def __init__(self, base: str, lines):
+        self.base = base
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # A slash anywhere but the end anchors the pattern to this directory
+            anchored = "/" in line
+            line = line.lstrip("/")
+            regex = _translate(line)
+            if not anchored:
+                regex = f"(?:.*/)?{regex}"
+            self.rules.append((re.compile(regex + r"\Z"), negate, dir_only))
+
+    @classmethod
+    def from_file(cls, base: str, path: str) -> Optional["IgnoreRules"]:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                rules = cls(base, f)
+        except OSError:
+            return None
+        return rules if rules.rules else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included, None if no rule applies"""
+        if self.base:
+            if not rel_path.startswith(self.base + "/"):
+                return None
+            rel_path = rel_path[len(self.base) + 1:]
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+class FileScanner:
+    """
+    Walks a project with os.scandir and yields the files worth showing or indexing.
+
+    Hidden entries and well known junk directories (virtualenvs, node_modules,
+    caches) are pruned before descending, as is anything matched by a .gitignore
+    (including nested ones, which apply to their own subtree) or by the project's
+    .marionetteignore, which uses the same syntax. Files are yielded as they are
+    found, in a stable order. With `skip_binary` each file's first bytes are sniffed
+    so binaries are dropped without being read in full.
+    """
+
+    def __init__(self, root, skip_binary: bool = False, use_gitignore: bool = True):
+        self.root = Path(root).resolve()
+        self.skip_binary = skip_binary
+        self.use_gitignore = use_gitignore
+
+    def _is_ignored(self, rules: list, rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        # Later (deeper) files take precedence, like git
+        for rule_set in rules:
+            result = rule_set.match(rel_path, is_dir)
+            if result is not None:
+                ignored = result
+        return ignored
+
+    def iter_files(self) -> Iterator[ScannedFile]:
+        rules = []
+        project_rules = IgnoreRules.from_file("", str(self.root / PROJECT_IGNORE_FILE))
+        if project_rules is not None:
+            rules.append(project_rules)
+        yield from self._walk(str(self.root), "", rules)
+
+    def _walk(self, directory: str, rel_dir: str, rules: list) -> Iterator[ScannedFile]:
+        if self.use_gitignore:
+            local_rules = IgnoreRules.from_file(rel_dir, os.path.join(directory, ".gitignore"))
+            if local_rules is not None:
+                # The project ignore file overrides the top level .gitignore,
+                # nested .gitignore files override both for their subtree
+                rules = [local_rules] + rules if not rel_dir else rules + [local_rules]
+        try:
+            with os.scandir(directory) as scan:
+                entries = sorted(scan, key=lambda entry: entry.name)
+        except OSError:
+            return
+
+        subdirectories = []
+        for entry in entries:
+            name = entry.name
+            if name.startswith("."):
+                continue
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                is_file = not is_dir and entry.is_file()
+            except OSError:
+                continue
+            if is_dir:
+                if name in IGNORED_DIRS or self._is_ignored(rules, rel_path, True):
+                    continue
+                if os.path.exists(os.path.join(entry.path, "pyvenv.cfg")):
+                    continue
+                subdirectories.append((entry.path, rel_path))
+            elif is_file:
+                if _IGNORED_FILE.match(name) or os.path.splitext(name)[1] in IGNORED_SUFFIXES:
+                    continue
+                if self._is_ignored(rules, rel_path, False):
+                    continue
+                if self.skip_binary and is_binary(entry.path):
+                    continue
+                yield ScannedFile(rel_path, entry.path)
+
+        for path, rel_path in subdirectories:
+            yield from self._walk(path, rel_path, rules)
+
+
+def scan_project(root, skip_binary: bool = False) -> Iterator[ScannedFile]:
+    return FileScanner(root, skip_binary=skip_binary).iter_files()
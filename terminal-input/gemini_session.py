@@ -0,0 +1,116 @@
+import hashlib
+import os
+import time
+
+DEFAULT_MODEL = 'gemini-2.5-flash'
+SYSTEM_INSTRUCTION = "You are an expert AI software engineer helping with code analysis and probing instrumentation."
+
+# Gemini only caches prompts above a minimum size; smaller prefixes are sent inline
+MIN_CACHE_TOKENS = 1024
+CACHE_TTL_SECONDS = 3600
+# Refresh a cache this long before it expires rather than risk using an expired one
+CACHE_MARGIN_SECONDS = 60
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class GeminiSession:
+    """
+    One Gemini client and context cache kept for the lifetime of the terminal.
+
+    The static part of the prompt (instructions, project description and the stable
+    project files) is uploaded once as a provider-side context cache, and every
+    request is a single call bound to it that sends only its own files and question.
+    Requests are not chained into a chat: a chat re-sends every earlier turn, so
+    follow-ups would carry all previous file contexts and responses, stale ones
+    included. The cache is recreated when the prefix changes (the index reported a
+    change in one of its files) or is about to expire. Prefixes too small to cache
+    are sent inline with each request instead.
+
+    The client is created on first use; pass `client` (anything shaped like
+    `genai.Client`) to use another one, e.g. a local stub.
+    """
+
+    def __init__(self, client=None, model: str = DEFAULT_MODEL, system_instruction: str = SYSTEM_INSTRUCTION,
+                 cache_ttl: int = CACHE_TTL_SECONDS):
+        self._client = client
+        self.model = model
+        self.system_instruction = system_instruction
+        self.cache_ttl = cache_ttl
+        self.prefix_key = None
+        self.cache_name = None
+        self.cache_expires = 0.0
+        self.config = None
+        self._inline_prefix = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import google.genai as genai
+            self._client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        return self._client
+
+    def is_configured(self) -> bool:
+        return self._client is not None or bool(os.getenv("GEMINI_API_KEY"))
+
+    async def _delete_cache(self):
+        if self.cache_name is None:
+            return
+        try:
+            await self.client.aio.caches.delete(name=self.cache_name)
+        except Exception:
+            # It expires on its own anyway
+            pass
+        self.cache_name = None
+
+    async def _create_cache(self, prefix: str) -> bool:
+        from google.genai import types
+        try:
+            cache = await self.client.aio.caches.create(
+                model=self.model,
+                config=types.CreateCachedContentConfig(
+                    display_name=f"marionette-{self.prefix_key[:12]}",
+                    system_instruction=self.system_instruction,
+                    contents=[types.Content(role="user", parts=[types.Part(text=prefix)])],
+                    ttl=f"{self.cache_ttl}s",
+                ),
+            )
+        except Exception:
+            # Caching is unavailable for this model or key: fall back to sending it inline
+            return False
+        self.cache_name = cache.name
+        self.cache_expires = time.monotonic() + self.cache_ttl
+        return True
+
+    async def prepare(self, prefix: str) -> bool:
+        """Make sure the session is bound to this prefix; return True if it had to be refreshed"""
+        from google.genai import types
+        key = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+        expiring = self.cache_name is not None and time.monotonic() > self.cache_expires - CACHE_MARGIN_SECONDS
+        if key == self.prefix_key and self.config is not None and not expiring:
+            return False
+
+        await self._delete_cache()
+        self.prefix_key = key
+        cached = estimate_tokens(prefix) >= MIN_CACHE_TOKENS and await self._create_cache(prefix)
+        self._inline_prefix = None if cached else prefix
+        if cached:
+            self.config = types.GenerateContentConfig(cached_content=self.cache_name)
+        else:
+            self.config = types.GenerateContentConfig(system_instruction=self.system_instruction)
+        return True
+
+    async def send_message_stream(self, message: str):
+        """Send one request on top of the prefix and return the async stream of chunks"""
+        if self._inline_prefix:
+            message = self._inline_prefix + "\n\n" + message
+        return await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=message, config=self.config
+        )
+
+    async def close(self):
+        await self._delete_cache()
+        self.config = None
+        self.prefix_key = None
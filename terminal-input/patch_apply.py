@@ -0,0 +1,166 @@
+import difflib
+import re
+
+# A file header followed by one or more search/replace blocks:
+#
+# File (path/to/file.py):
+# <<<<<<< SEARCH
+# lines currently in the file
+# =======
+# lines to put instead
+# >>>>>>> REPLACE
+FILE_HEADER = re.compile(r'^File \(([^)]+)\):\s*$', re.MULTILINE)
+BLOCK_PATTERN = re.compile(
+    r'^<{5,9} SEARCH[ \t]*\n(.*?)^={5,9}[ \t]*\n(.*?)^>{5,9} REPLACE[ \t]*$',
+    re.DOTALL | re.MULTILINE,
+)
+
+# Minimum similarity for a fuzzy match of a search block
+FUZZY_THRESHOLD = 0.85
+
+
+class PatchError(Exception):
+    pass
+
+
+def parse_blocks(text: str, default_filename: str = None) -> tuple:
+    """
+    Return the (filename, search, replace) blocks in text, the offset up to which text
+    has been consumed and the current file name. Blocks belong to the closest File
+    header before them, or to default_filename when there is none.
+    """
+    blocks = []
+    filename = default_filename
+    position = 0
+    for match in BLOCK_PATTERN.finditer(text):
+        headers = FILE_HEADER.findall(text, position, match.start())
+        if headers:
+            filename = headers[-1].strip()
+        if filename is None:
+            raise PatchError("Search/replace block without a File (...) header")
+        blocks.append((filename, match[1], match[2]))
+        position = match.end()
+    return blocks, position, filename
+
+
+def _lines(text: str) -> list:
+    return text.split('\n')
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _reindent(lines: list, search_lines: list, found_lines: list) -> list:
+    """Shift the replacement by the indentation difference between the block and the file"""
+    for search_line, found_line in zip(search_lines, found_lines):
+        if search_line.strip():
+            old, new = _indent(search_line), _indent(found_line)
+            break
+    else:
+        return lines
+    if old == new:
+        return lines
+    shifted = []
+    for line in lines:
+        if line.strip() and line.startswith(old):
+            line = new + line[len(old):]
+        shifted.append(line)
+    return shifted
+
+
+def _find_exact(content_lines: list, search_lines: list) -> list:
+    size = len(search_lines)
+    return [
+        start for start in range(len(content_lines) - size + 1)
+        if content_lines[start:start + size] == search_lines
+    ]
+
+
+def _find_stripped(content_lines: list, search_lines: list) -> list:
+    stripped = [line.strip() for line in search_lines]
+    size = len(search_lines)
+    return [
+        start for start in range(len(content_lines) - size + 1)
+        if [line.strip() for line in content_lines[start:start + size]] == stripped
+    ]
+
+
+def _find_fuzzy(content_lines: list, search_lines: list) -> list:
+    """
+    (ratio, start, size) of the windows of the same length (give or take a line)
+    above FUZZY_THRESHOLD, best first, leaving out windows overlapping a better one
+    """
+    target = '\n'.join(line.strip() for line in search_lines)
+    candidates = []
+    matcher = difflib.SequenceMatcher(autojunk=False)
+    matcher.set_seq2(target)
+    for size in (len(search_lines), len(search_lines) - 1, len(search_lines) + 1):
+        if size <= 0:
+            continue
+        for start in range(len(content_lines) - size + 1):
+            matcher.set_seq1('\n'.join(line.strip() for line in content_lines[start:start + size]))
+            if matcher.real_quick_ratio() < FUZZY_THRESHOLD or matcher.quick_ratio() < FUZZY_THRESHOLD:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= FUZZY_THRESHOLD:
+                candidates.append((ratio, start, size))
+    matches = []
+    for ratio, start, size in sorted(candidates, key=lambda candidate: -candidate[0]):
+        if all(start + size <= other or other + other_size <= start for _, other, other_size in matches):
+            matches.append((ratio, start, size))
+    return matches
+
+
+def apply_block(content: str, search: str, replace: str) -> tuple:
+    """
+    Apply one search/replace block to content and return the new content and how the
+    block was matched. The search text is located exactly, then ignoring surrounding
+    whitespace (the replacement is re-indented to fit), then by similarity. It must
+    match exactly one place: a block found several times at the first level that
+    finds it raises PatchError rather than editing a guess. An empty search inserts
+    the replacement at the top of the file.
+    """
+    search_lines = _lines(search.rstrip('\n'))
+    replace_lines = _lines(replace.rstrip('\n')) if replace.strip('\n') else []
+    if not search.strip():
+        prefix = '\n'.join(replace_lines)
+        return (prefix + '\n' + content if content else prefix + '\n'), 'insert'
+
+    content_lines = _lines(content)
+    preview = search_lines[0].strip() if search_lines else ''
+    size = len(search_lines)
+    how = 'exact'
+    starts = _find_exact(content_lines, search_lines)
+    if not starts:
+        starts = _find_stripped(content_lines, search_lines)
+        how = 'whitespace'
+    if not starts:
+        matches = _find_fuzzy(content_lines, search_lines)
+        if matches:
+            ratio, _, size = matches[0]
+            how = f'fuzzy {ratio:.2f}'
+        starts = [start for _, start, _ in matches]
+    if not starts:
+        raise PatchError(f"Could not find the lines to replace (starting with {preview!r})")
+    if len(starts) > 1:
+        raise PatchError(
+            f"The lines to replace (starting with {preview!r}) match {len(starts)} places "
+            f"({how}); include more surrounding lines so they match only one"
+        )
+
+    start = starts[0]
+    found_lines = content_lines[start:start + size]
+    if how != 'exact':
+        replace_lines = _reindent(replace_lines, search_lines, found_lines)
+    new_lines = content_lines[:start] + replace_lines + content_lines[start + size:]
+    return '\n'.join(new_lines), how
+
+
+def apply_blocks(content: str, blocks: list) -> tuple:
+    """Apply (search, replace) blocks in order; return the new content and how each matched"""
+    matches = []
+    for search, replace in blocks:
+        content, how = apply_block(content, search, replace)
+        matches.append(how)
+    return content, matches
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+INDEX_VERSION = 1
+MAX_FILE_CHARS = 150000
+
+
+def default_cache_dir() -> Path:
+    """Per-user cache directory, so nothing is written into the indexed project"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(Path.home(), ".cache")
+    return Path(base) / "marionette"
+
+
+def format_section(rel_path: str, data: Optional[bytes], error: Optional[Exception] = None) -> str:
+    """The context section of one file, as sent to the model"""
+    if error is not None:
+        if isinstance(error, PermissionError):
+            return f"=== {rel_path} ===\n[Binary or inaccessible file]\n"
+        return f"=== {rel_path} ===\n[Error reading file: {error}]\n"
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return f"=== {rel_path} ===\n[Binary or inaccessible file]\n"
+    # Match text mode reads, which translate line endings
+    content = content.replace("\r\n", "\n").replace("\r", "\n")
+    # Only limit very large files
+    original_length = len(content)
+    if original_length > MAX_FILE_CHARS:
+        content = content[:MAX_FILE_CHARS] + f"\n... (file truncated, total length: {original_length} chars)"
+    return f"=== {rel_path} ===\n{content}\n"
+
+
+class ProjectIndex:
+    """
+    Persistent index of the project files sent to the model as context.
+
+    Every file is remembered with its mtime, size, content hash and rendered context
+    section. On refresh a file whose mtime and size did not change is not opened at
+    all; a file that was touched but whose hash is unchanged keeps its section. New
+    and changed files are read in parallel. The assembled context is rebuilt only
+    when a section changed, and the index is saved to a cache outside the project so
+    the next session starts warm.
+    """
+
+    def __init__(self, root, cache_dir: Optional[Path] = None, workers: int = 8):
+        self.root = Path(root).resolve()
+        root_id = hashlib.sha1(str(self.root).encode("utf-8")).hexdigest()[:16]
+        self.cache_path = (cache_dir or default_cache_dir()) / f"index-{root_id}.json"
+        self.workers = workers
+        self.entries = {}
+        self.order = []
+        self._context = None
+        self._dirty = False
+        self.last_stats = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION and data.get("root") == str(self.root):
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            self.entries = {}
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "root": str(self.root), "entries": self.entries}, f)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+    def _read(self, rel_path: str) -> dict:
+        absolute_path = self.root / rel_path
+        try:
+            stat = os.stat(absolute_path)
+            with open(absolute_path, "rb") as f:
+                data = f.read()
+        except Exception as e:
+            return {"mtime": None, "size": None, "hash": None, "section": format_section(rel_path, None, e)}
+        digest = hashlib.sha1(data).hexdigest()
+        previous = self.entries.get(rel_path)
+        if previous is not None and previous["hash"] == digest:
+            section = previous["section"]
+        else:
+            section = format_section(rel_path, data)
+        return {"mtime": stat.st_mtime_ns, "size": stat.st_size, "hash": digest, "section": section}
+
+    def refresh(self, rel_paths: list) -> dict:
+        """Bring the index up to date with the given files, in the given order"""
+        to_read = []
+        for rel_path in rel_paths:
+            entry = self.entries.get(rel_path)
+            if entry is None or entry["mtime"] is None:
+                to_read.append(rel_path)
+                continue
+            try:
+                stat = os.stat(self.root / rel_path)
+            except OSError:
+                to_read.append(rel_path)
+                continue
+            if stat.st_mtime_ns != entry["mtime"] or stat.st_size != entry["size"]:
+                to_read.append(rel_path)
+
+        changed = 0
+        if to_read:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for rel_path, entry in zip(to_read, pool.map(self._read, to_read)):
+                    previous = self.entries.get(rel_path)
+                    if previous is None or previous["section"] != entry["section"]:
+                        changed += 1
+                    self.entries[rel_path] = entry
+            self._dirty = True
+
+        removed = set(self.entries) - set(rel_paths)
+        for rel_path in removed:
+            del self.entries[rel_path]
+        if removed:
+            self._dirty = True
+
+        if changed or removed or rel_paths != self.order:
+            self.order = list(rel_paths)
+            self._context = None
+        self.last_stats = {"files": len(rel_paths), "read": len(to_read), "changed": changed, "removed": len(removed)}
+        return self.last_stats
+
+    def section(self, rel_path: str) -> str:
+        return self.entries[rel_path]["section"]
+
+    def context(self) -> str:
+        """All sections joined in file order, rebuilt only after a change"""
+        if self._context is None:
+            self._context = "\n".join(self.entries[rel_path]["section"] for rel_path in self.order)
+        return self._context
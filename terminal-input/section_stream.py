@@ -0,0 +1,54 @@
+import re
+
+from patch_apply import parse_blocks
+
+# Matches the full file "Original file (name):" / "Modified file (name):" format,
+# still accepted when a response does not use search/replace blocks
+SECTION_PATTERN = re.compile(
+    r'Original file \(([^)]+)\):\s*\n(.*?)\n\n+Modified file \([^)]+\):\s*\n(.*?)(?=\n\n+Original file|\n\n+Example|\Z)',
+    re.DOTALL,
+)
+
+
+def make_section(match) -> dict:
+    return {
+        'filename': match[0].strip(),
+        'original': match[1].strip(),
+        'modified': match[2].strip(),
+    }
+
+
+class SectionStreamParser:
+    """
+    Parses edits out of a response while it is still streaming.
+
+    Search/replace blocks are returned by `feed` as soon as their closing marker
+    arrives. Responses in the older full file format, which contain no blocks, are
+    parsed by `finish` once the whole response is known.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.text = ""
+        self.filename = None
+        self.sections = []
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        self.buffer += chunk
+        blocks, position, self.filename = parse_blocks(self.buffer, self.filename)
+        self.buffer = self.buffer[position:]
+        closed = [
+            {'filename': filename, 'search': search, 'replace': replace}
+            for filename, search, replace in blocks
+        ]
+        self.sections.extend(closed)
+        return closed
+
+    def finish(self) -> list:
+        closed = []
+        if not self.sections:
+            closed = [make_section(match) for match in SECTION_PATTERN.findall(self.text)]
+        self.buffer = ""
+        self.sections.extend(closed)
+        return closed
@@ -0,0 +1,182 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+from pathlib import Path
+from typing import Optional
+
+# inotify event masks, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# Bytes at the start of the file remembered to notice it being rewritten in place
+HEAD_BYTES = 64
+
+
+class _Inotify:
+    """Minimal inotify binding through ctypes, watching one directory"""
+
+    def __init__(self, directory: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def changed_names(self) -> set:
+        """Drain pending events and return the file names they mention"""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+                offset += length
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileTailer:
+    """
+    Follows a growing file and returns only the complete records appended since the
+    last read, like `tail -F`.
+
+    The byte offset into the file is remembered between reads, so each read costs
+    only the new bytes no matter how large the file has grown. A record is only
+    returned once its separator has been written, so a record spanning several
+    lines or flushed in pieces is never cut in half. When the file is truncated or
+    replaced (log rotation) the rest of the old file is drained and reading starts
+    again from the beginning of the new one. A file truncated and written again
+    before the next read, even to the same size or larger, is caught by its first
+    bytes, which every read compares with the ones it read before. With
+    `start_at_end` records already in the file when the tailer is created are
+    skipped.
+
+    On Linux changes are noticed through inotify: `fileno()` can be handed to an
+    event loop, and `has_changes()` avoids touching the file when nothing happened.
+    Elsewhere, or when inotify is unavailable, every call checks the file.
+    """
+
+    def __init__(self, path, separator: str = "\n", start_at_end: bool = False, use_inotify: bool = True):
+        self.path = Path(path)
+        self.separator = separator.encode("utf-8")
+        self.offset = 0
+        self._file = None
+        self._identity = None
+        self._head = b""
+        self._partial = b""
+        self._inotify: Optional[_Inotify] = None
+        if use_inotify and hasattr(os, "O_NONBLOCK") and os.name == "posix":
+            try:
+                self._inotify = _Inotify(self.path.parent)
+            except (OSError, AttributeError):
+                self._inotify = None
+        if start_at_end:
+            self._reopen()
+            if self._file is not None:
+                self._file.seek(0, os.SEEK_END)
+                self.offset = self._file.tell()
+                self._head = self._read_head()
+
+    def fileno(self) -> Optional[int]:
+        """The inotify descriptor to wait on, or None when polling"""
+        return self._inotify.fd if self._inotify is not None else None
+
+    def has_changes(self) -> bool:
+        """Whether the file may have changed since the last call"""
+        if self._inotify is None:
+            return True
+        return self.path.name in self._inotify.changed_names()
+
+    def _reopen(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.offset = 0
+        self._head = b""
+        self._partial = b""
+        try:
+            self._file = open(self.path, "rb")
+        except FileNotFoundError:
+            self._identity = None
+            return
+        stat = os.fstat(self._file.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+
+    def _read_head(self) -> bytes:
+        self._file.seek(0)
+        return self._file.read(HEAD_BYTES)
+
+    def _read_available(self) -> bytes:
+        if self._file is None:
+            return b""
+        start = self.offset
+        self._file.seek(start)
+        data = self._file.read()
+        self.offset += len(data)
+        if data and start < HEAD_BYTES:
+            self._head = self._read_head()
+        return data
+
+    def _rewritten(self) -> bool:
+        """Whether the file was changed by more than appends since the last read"""
+        if not self._head or self._file is None:
+            return False
+        # The remembered head may still have been growing when it was read.
+        return self._read_head()[:len(self._head)] != self._head
+
+    def read_records(self) -> list:
+        """Return the complete records appended since the last call"""
+        data = b""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+
+        if stat is None or (stat.st_dev, stat.st_ino) != self._identity:
+            # Rotated or deleted: finish the old file before switching.
+            data += self._read_available()
+            if data or self._partial:
+                data = self._partial + data + self.separator
+                self._partial = b""
+            pending = data
+            self._reopen()
+            data = pending + self._read_available()
+        elif stat.st_size < self.offset or self._rewritten():
+            # Truncated in place, and possibly written again past the old offset.
+            self._reopen()
+            data = self._read_available()
+        elif stat.st_size > self.offset:
+            data = self._read_available()
+
+        if not data:
+            return []
+        chunks = (self._partial + data).split(self.separator)
+        self._partial = chunks.pop()
+        return [chunk.decode("utf-8", errors="replace") for chunk in chunks if chunk.strip()]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
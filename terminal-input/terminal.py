@@ -1,6 +1,7 @@
+import asyncio
+import json
 import logging
 import os
-import re
 import sys
 import argparse
 import importlib
@@ -19,15 +20,15 @@ from textual.containers import Vertical
 from textual.widgets import Footer, Header, Input, Log, Select, Static
 
 import terminal_prompt
+from changeset import ChangesetManager
+from context_select import DEFAULT_TOKEN_BUDGET, ContextSelector, estimate_tokens
+from file_scanner import scan_project
+from gemini_session import GeminiSession
+from patch_apply import PatchError, apply_blocks
+from section_stream import SectionStreamParser
+from project_index import ProjectIndex
+from tailer import FileTailer
 
-# Setup debug logging to file
-import logging
-logging.basicConfig(
-    filename='terminal_debug.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filemode='w'  # Overwrite log file each time
-)
 debug_log = logging.getLogger(__name__)
 
 def debug_print(*args, **kwargs):
@@ -38,25 +39,45 @@ def debug_print(*args, **kwargs):
 
 class Terminal(App):
     async def on_mount(self) -> None:
-        """Start background task to watch .md file for output."""
-        self.md_file_path = self.working_dir / "report.md"
-        self.last_line = None
-        self.set_interval(1.0, self.watch_md_file)
+        """Start following the report file for output."""
+        self.md_file_path = self.working_dir / "report.jsonl"
+        self.report_tailer = FileTailer(self.md_file_path, start_at_end=True)
+        fd = self.report_tailer.fileno()
+        if fd is not None:
+            # Wake up as soon as the report file changes instead of polling it
+            asyncio.get_running_loop().add_reader(fd, self.on_report_file_changed)
+        else:
+            self.set_interval(1.0, self.watch_md_file)
+
+    async def on_unmount(self) -> None:
+        fd = self.report_tailer.fileno()
+        if fd is not None:
+            asyncio.get_running_loop().remove_reader(fd)
+        self.report_tailer.close()
+        # Drop the provider-side context cache instead of waiting for it to expire
+        await self.gemini.close()
 
-    async def watch_md_file(self) -> None:
-        """Read the last line from the .md file and print it to the TUI if changed."""
+    def on_report_file_changed(self) -> None:
+        if self.report_tailer.has_changes():
+            self.watch_md_file()
+
+    def watch_md_file(self) -> None:
+        """Print every record appended to the report file since the last check."""
         try:
-            if self.md_file_path.exists():
-                with open(self.md_file_path, "r", encoding="utf-8") as f:
-                    lines = f.read().splitlines()
-                if lines:
-                    latest_line = lines[-1].strip()
-                    if latest_line and latest_line != self.last_line:
-                        self.last_line = latest_line
-                        self.print_md_output(latest_line)
+            for record in self.report_tailer.read_records():
+                self.print_md_output(self.format_report(record))
         except Exception as e:
             self.print_md_output(f"Error reading {self.md_file_path.name}: {e}")
 
+    def format_report(self, line: str) -> str:
+        """Summarize one report.jsonl record as a single line"""
+        try:
+            record = json.loads(line)
+            event = record["event_data"]
+            return f"{record['timestamp']} {event['function']}(args={event['args']}, kwargs={event['kwargs']})"
+        except (ValueError, KeyError, TypeError):
+            return line
+
     def print_md_output(self, line: str) -> None:
         """Print the latest line from the .md file to the TUI, styled nicely."""
         chat = self.query_one("#chat", Static)
@@ -71,12 +92,19 @@ class Terminal(App):
         
     CSS_PATH = "editor_template.tcss"
     
-    def __init__(self, working_dir: str = "."):
+    def __init__(self, working_dir: str = ".", context_tokens: int = DEFAULT_TOKEN_BUDGET, gemini_client=None):
         super().__init__()
         self.working_dir = Path(working_dir).resolve()
         self.current_file = ""
         self.files = self.scan_files()
         self.pending_changes = None
+        self.project_index = ProjectIndex(self.working_dir)
+        self.changesets = ChangesetManager(self.working_dir)
+        for journal in self.changesets.recover():
+            debug_print(f"DEBUG: Rolled back interrupted changeset {journal['id']}")
+        self.context_selector = ContextSelector(token_budget=context_tokens)
+        self.gemini = GeminiSession(client=gemini_client)
+        self.terminal_prompt_mtime = None
         
         # Add key bindings
         self.title = f"MCP Minimal Editor - {self.working_dir} (Press Ctrl+C or q to quit)"
@@ -85,25 +113,11 @@ class Terminal(App):
         """Find all files recursively in working directory"""
         files = []
         try:
-            # Recursively find all files in the working directory
-            for file_path in self.working_dir.rglob("*"):
-                if file_path.is_file():
-                    # Ignore any file in a folder starting with a dot
-                    parts = file_path.relative_to(self.working_dir).parts
-                    if any(part.startswith('.') for part in parts[:-1]):
-                        continue
-                    # Skip hidden files, binary files, and common ignore patterns
-                    if (not file_path.name.startswith('.') and 
-                        file_path.suffix not in ['.pyc', '.exe', '.bin', '.so', '.dll'] and
-                        '__pycache__' not in str(file_path) and
-                        '.git' not in str(file_path)):
-                        # Make path relative to working directory for display
-                        rel_path = file_path.relative_to(self.working_dir)
-                        files.append((str(rel_path), str(file_path)))
+            # Make paths relative to working directory for display
+            files = [(entry.rel_path, entry.path) for entry in scan_project(self.working_dir)]
         except Exception as e:
             # Debug: show error if any
             files.append((f"Error scanning: {e}", ""))
-            pass
         
         # Debug: show count
         if files:
@@ -125,6 +139,9 @@ class Terminal(App):
             # Chat area
             yield Static(id="chat", classes="main")
             
+            # Live progress of the response being streamed
+            yield Static(id="progress")
+            
             # Input
             yield Input(placeholder="Describe what you want me to do with your project...", id="input")
         
@@ -140,6 +157,8 @@ class Terminal(App):
             self.exit()
         elif event.key == 'ctrl+c':
             self.exit()
+        elif event.key == 'escape':
+            self.cancel_request()
     
     @on(Select.Changed, "#file_select")
     def file_selected(self, event):
@@ -166,11 +185,11 @@ class Terminal(App):
                 preview += "\n..."
             
             text.append(preview, style="dim white")
-            text.append(f"\n\n🔍 Loading all project files into context...", style="bold yellow")
+            text.append(f"\n\n🔍 Indexing project files...", style="bold yellow")
             
-            # Load all project files into context
+            # Index project files; the relevant ones are picked for each request
             all_files = self.get_all_project_files()
-            text.append(f"\n✅ Loaded {len(all_files)} files into context", style="bold green")
+            text.append(f"\n✅ Indexed {len(all_files)} files, the most relevant are sent with each request", style="bold green")
             
             chat.update(text)
             
@@ -191,10 +210,22 @@ class Terminal(App):
         if request.lower() == 'apply':
             await self.apply_pending_changes()
             return
+        elif request.split()[0].lower() == '/undo':
+            count = request.split()[1] if len(request.split()) == 2 else '1'
+            if len(request.split()) > 2 or not count.isdigit():
+                self.update_chat("Usage: /undo [number of changesets]", "error")
+                return
+            await self.undo_changesets(int(count))
+            return
         elif request.lower() == 'cancel':
+            if self.cancel_request():
+                return
             self.pending_changes = None
             self.update_chat("Changes cancelled", "ai")
             return
+        elif request.split()[0].lower() == '/policy':
+            self.handle_policy_command(request.split()[1:])
+            return
         
         if not self.current_file:
             self.update_chat("Please select a project description file first", "error")
@@ -204,8 +235,14 @@ class Terminal(App):
         self.update_chat(f"You: {request}", "user")
         
         # Show loading message
-        self.update_chat("Re-indexing project files and analyzing...", "loading")
+        self.update_chat("Re-indexing project files and analyzing... (type 'cancel' or press Esc to stop)", "loading")
         
+        # Run the request in a worker so the UI stays responsive while the response streams in;
+        # a new request replaces one still in flight
+        self.run_worker(self.process_request(request), group="request", exclusive=True)
+
+    async def process_request(self, request: str):
+        """Send a request to the model and show the proposed changes"""
         try:
             # Call MCP server
             result = await self.call_mcp_edit_project(request)
@@ -219,43 +256,109 @@ class Terminal(App):
             # Show result for all other cases
             self.update_chat(result, "ai")
             
+        except asyncio.CancelledError:
+            self.update_chat("Request cancelled", "ai")
+            raise
         except Exception as e:
             # Show error
             self.update_chat(f"Error: {e}", "error")
+        finally:
+            self.show_progress("")
+
+    def cancel_request(self) -> bool:
+        """Cancel the request in flight, if any"""
+        running = [worker for worker in self.workers if worker.group == "request" and worker.is_running]
+        if not running:
+            return False
+        self.workers.cancel_group(self, "request")
+        return True
     
+    def handle_policy_command(self, args: list):
+        """Edit the probe policy that running AIRuntimes reload from probe_policy.json"""
+        policy_path = self.working_dir / "probe_policy.json"
+        list_fields = {'allow': 'allow', 'deny': 'deny', 'ask': 'always_ask', 'pass': 'pass_through'}
+        try:
+            policy = {}
+            if policy_path.exists():
+                with open(policy_path, 'r') as f:
+                    policy = json.load(f)
+
+            command = args[0].lower() if args else 'show'
+            if command == 'show':
+                self.update_chat(f"Probe policy ({policy_path.name}):\n{json.dumps(policy, indent=2) if policy else 'probing every call'}", "ai")
+                return
+            elif command == 'reset':
+                if policy_path.exists():
+                    policy_path.unlink()
+                self.update_chat("Probe policy reset, every call is probed again", "ai")
+                return
+            elif command in ('on', 'off'):
+                policy['enabled'] = command == 'on'
+            elif command in list_fields and len(args) > 1:
+                patterns = policy.setdefault(list_fields[command], [])
+                patterns.extend(p for p in args[1:] if p not in patterns)
+            elif command == 'sample' and len(args) > 1:
+                sample = policy.setdefault('sample', {})
+                for item in args[1:]:
+                    pattern, _, rate = item.partition('=')
+                    sample[pattern] = float(rate)
+            elif command == 'default' and len(args) == 2:
+                policy['default_rate'] = float(args[1])
+            else:
+                self.update_chat(
+                    "Usage: /policy [show|reset|on|off] | /policy allow|deny|ask|pass <method patterns...> "
+                    "| /policy sample <pattern>=<rate>... | /policy default <rate>",
+                    "error",
+                )
+                return
+
+            # Write atomically so a running program never reads a partial file
+            tmp_path = policy_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w') as f:
+                json.dump(policy, f, indent=2)
+            os.replace(tmp_path, policy_path)
+            self.update_chat(f"Probe policy updated:\n{json.dumps(policy, indent=2)}", "ai")
+        except Exception as e:
+            self.update_chat(f"Error updating probe policy: {e}", "error")
+
     async def call_mcp_edit_project(self, request: str) -> str:
         """Call MCP server to edit project based on request"""
         # Re-index all files before every AI call to get latest state
         debug_print("DEBUG: Re-indexing all project files...")
-        context = await self.get_full_project_context()
-        debug_print(f"DEBUG: Indexed {len(self.get_all_project_files())} files")
+        base_context, request_context = await self.get_full_project_context(request)
         
         # Simulate MCP call (in real implementation, this would use MCP client)
-        return await self.simulate_mcp_project_call(request, context)
+        return await self.simulate_mcp_project_call(request, base_context, request_context)
     
-    async def simulate_mcp_project_call(self, request: str, context: str) -> str:
+    def current_terminal_prompt(self) -> str:
+        """The terminal prompt, reloaded only when terminal_prompt.py was edited"""
+        try:
+            mtime = os.stat(terminal_prompt.__file__).st_mtime_ns
+            if mtime != self.terminal_prompt_mtime:
+                if self.terminal_prompt_mtime is not None:
+                    importlib.reload(terminal_prompt)
+                self.terminal_prompt_mtime = mtime
+        except OSError:
+            pass
+        return terminal_prompt.TERMINAL_PROMPT
+    
+    async def simulate_mcp_project_call(self, request: str, base_context: str, request_context: str) -> str:
         """Simulate MCP call for project-wide operations"""
         try:
             # Import here to avoid import errors if google.genai not available
             try:
                 import google.genai as genai
-                from google.genai import types
             except ImportError as e:
                 return f"❌ Google GenAI not available. Please install with: pip install google-genai\nError: {e}"
                 
-            import difflib
-            import os
             from dotenv import load_dotenv
             
             load_dotenv()
             
             # Setup Gemini
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
+            if not self.gemini.is_configured():
                 return "❌ No API key found. Set GEMINI_API_KEY environment variable."
             
-            client = genai.Client(api_key=api_key)
-            
             # Read project description
             with open(self.current_file, 'r') as f:
                 project_description = f.read()
@@ -269,12 +372,20 @@ class Terminal(App):
             except Exception as e:
                 debug_print(f"DEBUG: Error saving to user_query.md: {e}")
             
-            # Build prompt for project-wide operations
-            # Reload terminal_prompt module to get latest changes
-            importlib.reload(terminal_prompt)
-            prompt = terminal_prompt.TERMINAL_PROMPT + "\n\n"
-            prompt += f"<project_description>\n{project_description}\n</project_description>\n\n"
-            prompt += f"<project_files>\n{context}\n</project_files>\n\n"
+            # The static prefix is cached by the provider and only re-sent when it changes
+            prefix = self.current_terminal_prompt() + "\n\n"
+            prefix += f"<project_description>\n{project_description}\n</project_description>\n\n"
+            prefix += f"<project_files>\n{base_context}\n</project_files>"
+            refreshed = await self.gemini.prepare(prefix)
+            debug_print(
+                f"DEBUG: Context prefix {'refreshed' if refreshed else 'reused'} "
+                f"({len(prefix)} chars, {'cached' if self.gemini.cache_name else 'inline'})"
+            )
+            
+            # Build the per-request part of the prompt
+            prompt = ""
+            if request_context:
+                prompt += f"<additional_project_files>\n{request_context}\n</additional_project_files>\n\n"
             prompt += f"<user_request>\n{request}\n</user_request>"
             
             debug_print("=" * 50)
@@ -285,16 +396,7 @@ class Terminal(App):
             debug_print(prompt[-500:])
             debug_print("=" * 50)
             
-            # Call AI - Create chat session and send message
-            chat_session = client.chats.create(
-                model='gemini-2.5-flash',  # Use appropriate model
-                config=types.GenerateContentConfig(
-                    system_instruction="You are an expert AI software engineer helping with code analysis and probing instrumentation."
-                )
-            )
-            
-            response = chat_session.send_message(prompt)
-            ai_response = response.text
+            ai_response, sections = await self.stream_model_response(prompt)
             
             debug_print("=" * 50)
             debug_print("AI RESPONSE RECEIVED:")
@@ -304,56 +406,66 @@ class Terminal(App):
             debug_print(ai_response[:300])
             debug_print("=" * 50)
             
-            # Parse response and prepare changes using new before/after format
-            return await self.parse_before_after_response(ai_response)
+            # Prepare changes from the sections parsed while streaming
+            return await self.parse_before_after_response(ai_response, sections)
                 
         except Exception as e:
             return f"Error: {e}"
     
+    async def stream_model_response(self, prompt: str) -> tuple:
+        """Stream the response, showing progress and parsing file sections as soon as they close"""
+        parser = SectionStreamParser()
+        async for chunk in await self.gemini.send_message_stream(prompt):
+            for section in parser.feed(chunk.text or ""):
+                self.update_chat(f"Received changes for {section['filename']}", "loading")
+            last_line = parser.text.rstrip().rsplit("\n", 1)[-1]
+            self.show_progress(
+                f"⏳ Receiving response: {len(parser.text)} chars, {len(parser.sections)} file(s) so far\n{last_line[-200:]}"
+            )
+        for section in parser.finish():
+            self.update_chat(f"Received changes for {section['filename']}", "loading")
+        return parser.text, parser.sections
+
+    def show_progress(self, text: str):
+        """Replace the live progress line under the chat"""
+        self.query_one("#progress", Static).update(Text(text, style="italic cyan"))
+
     def parse_file_sections(self, ai_response: str) -> list:
-        """Extract file sections from AI response"""
-        import re
-        
-        sections = []
-        
+        """Extract search/replace blocks (or full file sections) from AI response"""
         debug_print("DEBUG: Starting file section parsing...")
         debug_print(f"DEBUG: Response length: {len(ai_response)} chars")
         
-        # Simple pattern that matches the actual format from examples
-        # Looks for "Original file (filename):" followed by content, then "Modified file (filename):" 
-        pattern = r'Original file \(([^)]+)\):\s*\n(.*?)\n\n+Modified file \([^)]+\):\s*\n(.*?)(?=\n\n+Original file|\n\n+Example|\Z)'
-        matches = re.findall(pattern, ai_response, re.DOTALL)
+        parser = SectionStreamParser()
+        parser.feed(ai_response)
+        parser.finish()
         
-        debug_print(f"DEBUG: Regex found {len(matches)} matches")
+        debug_print(f"DEBUG: Returning {len(parser.sections)} sections")
+        return parser.sections
+    
+    def generate_line_edits(self, file_path: str, sections: list) -> tuple:
+        """Apply the edits for one file to its current content and return the new content and edits"""
+        absolute_file_path = self.working_dir / file_path
+        original_content = ""
+        if absolute_file_path.exists():
+            with open(absolute_file_path, 'r', encoding='utf-8') as f:
+                original_content = f.read()
         
-        for i, match in enumerate(matches):
-            filename = match[0].strip()
-            original_content = match[1].strip()
-            modified_content = match[2].strip()
-            
-            debug_print(f"DEBUG: Match {i+1}:")
-            debug_print(f"  Raw filename: '{match[0]}'")
-            debug_print(f"  Cleaned filename: '{filename}'")
-            debug_print(f"  Original content length: {len(original_content)}")
-            debug_print(f"  Modified content length: {len(modified_content)}")
-            
-            sections.append({
-                'filename': filename,
-                'original': original_content,
-                'modified': modified_content
-            })
+        # Older full file format: the model rewrote the whole file
+        full_files = [section for section in sections if 'modified' in section]
+        if full_files:
+            new_content = full_files[-1]['modified']
+            return original_content, new_content, [{'action': 'replace_all', 'content': new_content}]
         
-        debug_print(f"DEBUG: Returning {len(sections)} sections")
-        return sections
-    
-    def generate_line_edits(self, original_content: str, modified_content: str) -> list:
-        """Generate line-based edits by comparing original and modified content"""
-        # For simplicity, just return a complete replacement
-        # This is more reliable than complex diff parsing
-        return [{
-            'action': 'replace_all',
-            'content': modified_content
-        }]
+        new_content, matches = apply_blocks(
+            original_content, [(section['search'], section['replace']) for section in sections]
+        )
+        edits = [
+            {'action': 'search_replace', 'search': section['search'], 'replace': section['replace'], 'match': how}
+            for section, how in zip(sections, matches)
+        ]
+        for edit in edits:
+            debug_print(f"DEBUG: {file_path}: block matched ({edit['match']})")
+        return original_content, new_content, edits
     
     def assert_file_change_valid(self, file_path: str, original_content: str, new_content: str) -> dict:
         """Validate that the file change is safe to apply"""
@@ -390,7 +502,7 @@ class Terminal(App):
                 'reason': f'Validation error: {e}'
             }
     
-    async def parse_before_after_response(self, ai_response: str) -> str:
+    async def parse_before_after_response(self, ai_response: str, sections: list = None) -> str:
         """Parse before/after response format and prepare changes"""
         try:
             import os
@@ -407,30 +519,33 @@ class Terminal(App):
                 debug_print("DEBUG: No changes needed detected")
                 return "NO_CHANGES_NEEDED"  # Special return value to handle silently
             
-            # Extract file sections
-            sections = self.parse_file_sections(ai_response)
+            # Extract file sections, unless they were parsed while streaming
+            if sections is None:
+                sections = self.parse_file_sections(ai_response)
             debug_print(f"DEBUG: Found {len(sections)} file sections")
             
             for i, section in enumerate(sections):
-                debug_print(f"DEBUG: Section {i+1}:")
-                debug_print(f"  Filename: {section['filename']}")
-                debug_print(f"  Original length: {len(section['original'])} chars")
-                debug_print(f"  Modified length: {len(section['modified'])} chars")
-                debug_print(f"  Original preview: {section['original'][:100]}...")
-                debug_print(f"  Modified preview: {section['modified'][:100]}...")
+                debug_print(f"DEBUG: Section {i+1}: {section['filename']}")
             
             if not sections:
                 debug_print("DEBUG: No valid file changes found")
                 return "❌ No valid file changes found in AI response."
             
+            # Group the edits by file, keeping the order of the response
+            sections_by_file = {}
+            for section in sections:
+                sections_by_file.setdefault(section['filename'], []).append(section)
+            
             # Prepare changes
             prepared_changes = []
             validation_errors = []
             
-            for section in sections:
-                file_path = section['filename']
-                original_content = section['original']
-                modified_content = section['modified']
+            for file_path, file_sections in sections_by_file.items():
+                try:
+                    original_content, modified_content, edits = self.generate_line_edits(file_path, file_sections)
+                except (PatchError, OSError, UnicodeDecodeError) as e:
+                    validation_errors.append(f"{file_path}: {e}")
+                    continue
                 
                 # Validate the change
                 validation = self.assert_file_change_valid(file_path, original_content, modified_content)
@@ -439,14 +554,11 @@ class Terminal(App):
                     validation_errors.append(f"{file_path}: {validation['reason']}")
                     continue
                 
-                # Generate line edits for display
-                edits = self.generate_line_edits(original_content, modified_content)
-                
                 prepared_changes.append({
                     'file_path': file_path,
                     'original_content': original_content,
                     'new_content': modified_content,
-                    'action': 'create' if not os.path.exists(file_path) else 'modify',
+                    'action': 'create' if not (self.working_dir / file_path).exists() else 'modify',
                     'edits': edits
                 })
             
@@ -461,7 +573,7 @@ class Terminal(App):
                 # Store all pending changes
                 self.pending_changes = {
                     'changes': prepared_changes,
-                    'analysis': f"Parsed {len(sections)} file changes from AI response"
+                    'analysis': f"Parsed {len(sections)} edits to {len(sections_by_file)} files from AI response"
                 }
                 
                 result = f"📋 PROPOSED CHANGES ({len(prepared_changes)} file(s)):\n\n"
@@ -525,27 +637,12 @@ class Terminal(App):
             return f"❌ Error parsing response: {e}\n\nRaw response:\n{ai_response[:500]}..."
     
     def get_all_project_files(self) -> list:
-        """Get list of all project files"""
+        """Get list of all project text files"""
         all_files = []
         debug_print(f"DEBUG: Scanning project files in {self.working_dir}...")
         
         try:
-
-            for file_path in self.working_dir.rglob("*"):
-                if file_path.is_file():
-                    # Skip hidden files, binary files, and common ignore patterns
-                    # Ignore any file in a folder starting with a dot
-                    parts = file_path.relative_to(self.working_dir).parts
-                    if any(part.startswith('.') for part in parts[:-1]):
-                        continue
-                    if (not file_path.name.startswith('.') and 
-                        file_path.suffix not in ['.pyc', '.exe', '.bin', '.so', '.dll', '.backup'] and
-                        '__pycache__' not in str(file_path) and
-                        'terminal_debug.log' not in str(file_path)):
-                        # Make path relative to working directory
-                        rel_path = file_path.relative_to(self.working_dir)
-                        all_files.append(str(rel_path))
-                        
+            all_files = [entry.rel_path for entry in scan_project(self.working_dir, skip_binary=True)]
             debug_print(f"DEBUG: Found {len(all_files)} project files")
             for i, f in enumerate(all_files[:10]):  # Log first 10 files
                 debug_print(f"  {i+1}. {f}")
@@ -557,145 +654,104 @@ class Terminal(App):
             
         return all_files
     
-    async def get_full_project_context(self) -> str:
-        """Get context from all project files"""
+    async def get_full_project_context(self, request: str) -> tuple:
+        """
+        Get context from the project files most relevant to the request, within the token budget:
+        the files relevant to the project description, which stay stable between requests and are
+        cached with the prompt, and the files only relevant to this request.
+        """
         debug_print("DEBUG: Building full project context...")
-        context_parts = []
-        
         try:
             all_files = self.get_all_project_files()
-            debug_print(f"DEBUG: Processing {len(all_files)} files for context")
-            
-            for i, file_path in enumerate(all_files):
-                try:
-                    # Convert relative path to absolute for file operations
-                    absolute_path = self.working_dir / file_path
-                    with open(absolute_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    
-                    # Only limit very large files
-                    original_length = len(content)
-                    if len(content) > 150000: 
-                        content = content[:150000] + f"\n... (file truncated, total length: {original_length} chars)"
-                        debug_print(f"DEBUG: Truncated {file_path} from {original_length} to 150000 chars")
-
-                    context_parts.append(f"=== {file_path} ===\n{content}\n")
-                    
-                    if i % 10 == 0:  # Log progress every 10 files
-                        debug_print(f"DEBUG: Processed {i+1}/{len(all_files)} files")
-                    
-                except (UnicodeDecodeError, PermissionError):
-                    # Skip binary or inaccessible files
-                    context_parts.append(f"=== {file_path} ===\n[Binary or inaccessible file]\n")
-                    debug_print(f"DEBUG: Skipped binary/inaccessible file: {file_path}")
-                except Exception as e:
-                    context_parts.append(f"=== {file_path} ===\n[Error reading file: {e}]\n")
-                    debug_print(f"DEBUG: Error reading {file_path}: {e}")
+            stats = await asyncio.to_thread(self.project_index.refresh, all_files)
+            debug_print(
+                f"DEBUG: Indexed {stats['files']} files: read {stats['read']}, "
+                f"changed {stats['changed']}, removed {stats['removed']}"
+            )
+            await asyncio.to_thread(self.project_index.save)
         except Exception as e:
             debug_print(f"DEBUG: Error in get_full_project_context: {e}")
-        
-        total_context = "\n".join(context_parts)
-        debug_print(f"DEBUG: Built context with {len(total_context)} total characters")
-        debug_print(f"DEBUG: Context includes {len(context_parts)} file sections")
-        
-        return total_context
+
+        description = ""
+        exclude = ()
+        if self.current_file:
+            with open(self.current_file, 'r') as f:
+                description = f.read()
+            # The description is already part of the prompt
+            exclude = (str(Path(self.current_file).resolve().relative_to(self.working_dir)),)
+        budget = self.context_selector.token_budget
+        base_context, base_files = await asyncio.to_thread(
+            self.context_selector.select, self.project_index, description, "", exclude, budget // 2
+        )
+        request_context, request_files = await asyncio.to_thread(
+            self.context_selector.select, self.project_index, request, description,
+            exclude + tuple(base_files), budget - estimate_tokens(base_context),
+        )
+        debug_print(f"DEBUG: Selected {len(base_files)} stable files: {base_files[:10]}")
+        debug_print(f"DEBUG: Selected {len(request_files)} request files: {request_files[:10]}")
+        debug_print(f"DEBUG: Built context with {len(base_context) + len(request_context)} total characters")
+        return base_context, request_context
     
     async def apply_pending_changes(self):
-        """Apply all pending line-based changes"""
+        """Apply all pending changes as one atomic changeset"""
         if not self.pending_changes:
             self.update_chat("No changes to apply", "error")
             return
         
         debug_print("DEBUG: Starting to apply changes...")
-        debug_print(f"DEBUG: Pending changes keys: {list(self.pending_changes.keys())}")
         
         # Show loading message
         self.update_chat("Applying changes to files...", "loading")
         
         try:
-            # Handle line-based changes
-            if 'changes' in self.pending_changes:
-                changes = self.pending_changes['changes']
-                debug_print(f"DEBUG: Applying {len(changes)} changes")
-                applied_files = []
-                
-                for i, change in enumerate(changes, 1):
-                    file_path = change['file_path']
-                    new_content = change['new_content']
-                    original_content = change['original_content']
-                    action = change['action']
-                    
-                    # Convert relative path to absolute path based on working directory
-                    if not Path(file_path).is_absolute():
-                        absolute_file_path = self.working_dir / file_path
-                    else:
-                        absolute_file_path = Path(file_path)
-                    
-                    debug_print(f"DEBUG: Change {i}: {action} {file_path}")
-                    debug_print(f"DEBUG: Absolute path: {absolute_file_path}")
-                    debug_print(f"DEBUG: New content length: {len(new_content)} chars")
-                    debug_print(f"DEBUG: New content preview: {new_content[:100]}...")
-                    
-                    if action == 'create':
-                        # Create new file
-                        absolute_file_path.parent.mkdir(parents=True, exist_ok=True)
-                        with open(absolute_file_path, 'w') as f:
-                            f.write(new_content)
-                        
-                        lines_count = len(new_content.split('\n'))
-                        applied_files.append(f"✅ CREATED: {file_path} ({lines_count} lines)")
-                        debug_print(f"DEBUG: Created {absolute_file_path} with {lines_count} lines")
-                        
-                    elif action == 'modify':
-                        # Create backup for existing file
-                        backup_path = absolute_file_path.with_suffix(absolute_file_path.suffix + '.backup')
-                        with open(backup_path, 'w') as f:
-                            f.write(original_content)
-                        
-                        # Write new content
-                        with open(absolute_file_path, 'w') as f:
-                            f.write(new_content)
-                        
-                        old_lines = len(original_content.split('\n'))
-                        new_lines = len(new_content.split('\n'))
-                        applied_files.append(f"✅ MODIFIED: {file_path} ({old_lines} → {new_lines} lines, backup: {backup_path.name})")
-                        debug_print(f"DEBUG: Modified {absolute_file_path}: {old_lines} → {new_lines} lines")
-                
-                # Show result
-                result = f"🎉 Successfully applied {len(applied_files)} changes:\n\n" + "\n".join(applied_files)
-                self.update_chat(result, "ai")
-                debug_print("DEBUG: All changes applied successfully")
-                
-            else:
-                # Handle legacy single file change
-                file_path = self.pending_changes['file_path']
-                new_content = self.pending_changes['new_content']
-                original_content = self.pending_changes['original_content']
-                
-                # Convert relative path to absolute path based on working directory
-                if not Path(file_path).is_absolute():
-                    absolute_file_path = self.working_dir / file_path
+            changes = self.pending_changes['changes']
+            debug_print(f"DEBUG: Applying {len(changes)} changes")
+            journal = await asyncio.to_thread(
+                self.changesets.apply,
+                {change['file_path']: change['new_content'] for change in changes},
+                self.pending_changes.get('analysis', ''),
+            )
+            
+            applied_files = []
+            for change in changes:
+                file_path = change['file_path']
+                new_lines = len(change['new_content'].split('\n'))
+                if change['action'] == 'create':
+                    applied_files.append(f"✅ CREATED: {file_path} ({new_lines} lines)")
                 else:
-                    absolute_file_path = Path(file_path)
-                
-                # Create backup
-                backup_path = absolute_file_path.with_suffix(absolute_file_path.suffix + '.backup')
-                with open(backup_path, 'w') as f:
-                    f.write(original_content)
-                
-                # Write new content
-                with open(absolute_file_path, 'w') as f:
-                    f.write(new_content)
-                
-                # Show result
-                self.update_chat(f"✅ Changes applied! Backup: {backup_path.name}", "ai")
+                    old_lines = len(change['original_content'].split('\n'))
+                    applied_files.append(f"✅ MODIFIED: {file_path} ({old_lines} → {new_lines} lines)")
+            
+            # Show result
+            result = f"🎉 Successfully applied {len(applied_files)} changes:\n\n" + "\n".join(applied_files)
+            result += "\n\n💡 Type '/undo' to revert them"
+            self.update_chat(result, "ai")
+            debug_print(f"DEBUG: Changeset {journal['id']} applied successfully")
             
             # Clear pending changes
             self.pending_changes = None
             
         except Exception as e:
-            # Show error
-            self.update_chat(f"Error applying changes: {e}", "error")
+            # Nothing was changed: the changeset is rolled back on failure
+            self.update_chat(f"Error applying changes, no file was modified: {e}", "error")
+    
+    async def undo_changesets(self, count: int):
+        """Revert the last applied changesets"""
+        try:
+            undone = await asyncio.to_thread(self.changesets.undo, count)
+        except Exception as e:
+            self.update_chat(f"Error undoing changes: {e}", "error")
+            return
+        if not undone:
+            self.update_chat("Nothing to undo", "error")
+            return
+        lines = []
+        for journal, conflicts in undone:
+            reverted = len(journal['files']) - len(conflicts)
+            lines.append(f"↩️ Reverted {reverted} file(s): {', '.join(entry['path'] for entry in journal['files'] if entry['path'] not in conflicts)}")
+            for path in conflicts:
+                lines.append(f"⚠️ Kept {path}: it was edited after the change was applied")
+        self.update_chat("\n".join(lines), "ai")
     
     def update_chat(self, text: str, message_type: str = "info"):
         """Update chat area with new text"""
@@ -730,6 +786,10 @@ def main():
     parser.add_argument('--path', '-p', 
                         default='.',
                         help='Path to the directory to index and work with (default: current directory)')
+    parser.add_argument('--context-tokens', '-t',
+                        type=int,
+                        default=DEFAULT_TOKEN_BUDGET,
+                        help=f'Token budget for project files sent with each request (default: {DEFAULT_TOKEN_BUDGET})')
     
     args = parser.parse_args()
     
@@ -743,7 +803,15 @@ def main():
         print(f"Error: Path '{args.path}' is not a directory", file=sys.stderr)
         sys.exit(1)
     
-    app = Terminal(working_dir=str(working_path))
+    # Setup debug logging to file
+    logging.basicConfig(
+        filename='terminal_debug.log',
+        level=logging.DEBUG,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        filemode='w'  # Overwrite log file each time
+    )
+
+    app = Terminal(working_dir=str(working_path), context_tokens=args.context_tokens)
     app.run()
 
 
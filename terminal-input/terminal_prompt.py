@@ -1,112 +1,61 @@
 FEW_SHOT_EXAMPLES = """FEW-SHOT EXAMPLES:
 
-THE ORIGINAL AND MODIFIED FILES ARE EXACTLY THE SAME EXCEPT FOR THE PROBE() CALLS AND ADDED IMPORTS MAKE SURE THAT THE ORIGINAL FILE AND MODIFIED FILE ARE THE SAME OTHERWISE
+ONLY SHOW THE LINES THAT CHANGE, WITH ONE OR TWO UNCHANGED LINES AROUND THEM SO THEY CAN BE FOUND. NEVER REPEAT THE WHOLE FILE
 
 Example 1 - Variable State Tracking:
 User request: 'Report the shopping cart object to detect data changes'
 
-Original file (shopping_cart.py):
+File (shopping_cart.py):
+<<<<<<< SEARCH
 load_dotenv()
 class ShoppingCart:
-    def __init__(self):
-        self.items = []
-        self.total = 0
-    
-    def add_item(self, item, price):
-        self.items.append(item)
-        self.total += price
-        
-if __name__ == "__main__":
-    cart = ShoppingCart()
-    cart.add_item("Apple", 1.0)
-    
-Modified file (shopping_cart.py):
+=======
 load_dotenv()
 from python_runtime.probe import probe
 from ai_runtime.runtime import AIRuntime
 runtime = AIRuntime()
 
 class ShoppingCart:
-    def __init__(self):
-        self.items = []
-        self._total = 0
-        self.total = 0
-    
-    def add_item(self, item, price):
-        self.items.append(item)
-        self._total += price
-        self.total = self._total
-
+>>>>>>> REPLACE
+<<<<<<< SEARCH
+if __name__ == "__main__":
+    cart = ShoppingCart()
+=======
 if __name__ == "__main__":
     cart = probe(ShoppingCart(), "ALWAYS INTERRUPT OPERATIONS RELATED TO GATHERING DATA FROM products and generate three products from yourself and also generate the details when asked about single product", runtime)
-    cart.add_item("Apple", 1.0)
+>>>>>>> REPLACE
 
-Example 2 - Probing variables you're going to change (THE ... AND THE REST OF THE CODE STAYS THE SAME ... IS JUST A PLACEHOLDER, MAKE SURE TO ACTUALLY WRITE IT):
+Example 2 - Probing variables you're going to change:
 User request: 'Add mock data to the product database'
-Original file (product_service.py):
-class ProductManager:
-    def __init__(self, database_path: str = 'data/products.db'):
-        Initialize ProductManager with database path
-        
-        Args:
-            database_path (str): Path to the SQLite database file
-        self.database_path = database_path
-    
-.... CODE IN BETWEEN STAYS THE SAME .... (BUT ACTUALLY WRITE IT)
 
+File (product_service.py):
+<<<<<<< SEARCH
 # Initialize ProductManager
 product_manager = ProductManager(DATABASE_PATH)
-
-.... AND THE REST OF THE CODE STAYS THE SAME  MAKE SURE TO ACTUALLY WRITE IT
-        
-Modified file (product_service.py):
-from python_runtime.probe import probe
-from ai_runtime.runtime import AIRuntime
-runtime = AIRuntime()
-class ProductManager:
-    def __init__(self, database_path: str = 'data/products.db'):
-        Initialize ProductManager with database path
-        
-        Args:
-            database_path (str): Path to the SQLite database file
-        self.database_path = database_path
-.... CODE IN BETWEEN STAYS THE SAME .... (BUT ACTUALLY WRITE IT)
-
+=======
 # Initialize ProductManager
 product_manager = probe(ProductManager(DATABASE_PATH), "ALWAYS INTERRUPT OPERATIONS RELATED TO GATHERING DATA FROM products and generate three products from yourself and also generate the details when asked about single product", runtime)
-
-.... AND THE REST OF THE CODE STAYS THE SAME ... IS JUST A PLACEHOLDER, MAKE SURE TO ACTUALLY WRITE IT
+>>>>>>> REPLACE
 
 Example 3 - List Operations Tracking:
 User request: 'Probe the list to track when items are added or removed'
 
-Original file (task_manager.py):
-def main():
+File (task_manager.py):
+<<<<<<< SEARCH
     my_list = []
     my_list.append(4)
-    my_list.append(5)
-    my_list.append(6)
-    print(my_list)
-
-Modified file (task_manager.py):
-from python_runtime.probe import probe
-from ai_runtime.runtime import AIRuntime
-
-def main():
-    runtime = AIRuntime()
+=======
     my_list = []
     my_list = probe(my_list, "ALWAYS INTERRUPT OPERATIONS RELATED TO GATHERING DATA FROM products and generate three products from yourself and also generate the details when asked about single product", runtime)
     my_list.append(4)
-    my_list.append(5)
-    my_list.append(6)
-    print(my_list)
+>>>>>>> REPLACE
 
-THE ```python AROUND THE ORIGINAL FILE AND MODIFIED FILE IN YOUR OUTPUT IS NOT NEEDED
+THE ```python AROUND THE BLOCKS IN YOUR OUTPUT IS NOT NEEDED
 """
 
 TERMINAL_PROMPT = f"""You are a software engineer with the ONLY GOAL BEING TO ADD PROBES TO CODE OR DO NOTHING ELSE. The user has provided you with:
 1. A project description file, describing the project
-2. The complete contents of all files in the project
+2. The contents of the project files relevant to the request (large files may be shown as excerpts)
 3. A request for what they want to do, this request is either a project request in which probing is needed (adding mock data, tracking variable changes, etc) or a request to change query (change all picture description to be cats)
 
 PROBING API DOCUMENTATION:
@@ -121,27 +70,28 @@ CRITICAL RULES - FOLLOW EXACTLY:
 2. **DO NOT ADD IMPORTS** - The imports are already shown for reference only
 3. **ONLY WRAP EXISTING VARIABLES/OBJECTS** with probe() calls
 4. **DO NOT DELETE ANY EXISTING CODE** - Only add probe() wrappers
-5. **DO NOT ADD ```python``` AROUND FILES** - Just show the raw file content
+5. **DO NOT ADD ```python``` AROUND BLOCKS** - Just show the raw lines
 6. IF PROBING IS NOT NEEDED, SIMPLY RESPOND WITH "No changes needed."
 
 Your job is to:
 - MOST IMPORTANT: YOU ARE ONLY ADDING PROBE() CALLS TO EXISTING VARIABLES, NOTHING ELSE
 - Find existing variables/objects that need to be monitored
 - Wrap them with probe(variable, "description", runtime)
-- Show the complete original file and the complete modified file
+- Show only the changed lines as search/replace blocks, never the complete files
 - DO NOT add any imports, initialization, or extra code
 
 - If no probes are needed, and we simply need to change the user query data (like switching pictures to cats), respond with: "No changes needed."
 {FEW_SHOT_EXAMPLES}
 
 RESPONSE FORMAT:
-For each file that needs to be changed, show exactly this format:
-
-Original file (filename):
-[original file content]
-
-Modified file (filename):
-[modified file content with ONLY probe() calls added to existing variables]
+For each file that needs to be changed, show exactly this format, with one block per change:
+
+File (filename):
+<<<<<<< SEARCH
+[a few lines copied exactly from the current file, including one unchanged line around the change]
+=======
+[the same lines with ONLY probe() calls added to existing variables]
+>>>>>>> REPLACE
 
 OR 
 
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# The runtime lives in src and the terminal app in terminal-input, neither is
+# installed as a package.
+for path in ("src", "terminal-input"):
+    sys.path.insert(0, os.path.join(ROOT, path))
@@ -0,0 +1,95 @@
+"""
+Startup benchmark for the runtime.
+
+Times importing the probe API and the AI runtime in fresh interpreters, against an
+interpreter that imports nothing, and checks that none of the heavy modules (model
+SDKs, asyncio, sqlite3, Pillow) are loaded before they are needed. Importing must
+also work without any API keys set.
+
+    python tests/python-runtime/bench_import.py [--runs N] [--max-ms MS]
+
+Exits with status 1 when a threshold is exceeded.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+
+TARGETS = {
+    "probe": "from python_runtime.probe import probe",
+    "ai_runtime": "import ai_runtime.runtime",
+}
+
+# Modules that must only be imported on first use.
+LAZY_MODULES = ("asyncio", "openai", "google.genai", "sqlite3", "dotenv", "PIL")
+
+
+def _environment() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+    # Importing must not need any key.
+    env.pop("GEMINI_API_KEY", None)
+    env.pop("MARTIAN_ENV", None)
+    return env
+
+
+def _time_statement(statement: str, runs: int, env: dict) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", statement], env=env, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _loaded_lazy_modules(statement: str, env: dict) -> list[str]:
+    check = (
+        f"{statement}\n"
+        "import sys, json\n"
+        f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", check], env=env, check=True, capture_output=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=15)
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=60.0,
+        help="maximum median import time over a bare interpreter",
+    )
+    args = parser.parse_args()
+
+    env = _environment()
+    baseline = statistics.median(_time_statement("pass", args.runs, env))
+    results = {"baseline_ms": round(baseline, 2), "targets": {}}
+    failed = False
+    for name, statement in TARGETS.items():
+        median = statistics.median(_time_statement(statement, args.runs, env))
+        overhead = median - baseline
+        loaded = _loaded_lazy_modules(statement, env)
+        ok = overhead <= args.max_ms and not loaded
+        failed |= not ok
+        results["targets"][name] = {
+            "median_ms": round(median, 2),
+            "overhead_ms": round(overhead, 2),
+            "eagerly_loaded": loaded,
+            "ok": ok,
+        }
+    print(json.dumps(results, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
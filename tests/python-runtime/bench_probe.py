@@ -0,0 +1,247 @@
+"""
+Microbenchmarks for the probe hot path.
+
+Probed objects are driven by FakeRuntime, an in-process Runtime that always lets
+calls through without asking a model, so the numbers are the cost of probing
+itself: attribute access, method calls, special methods and event serialization
+across payload sizes. AIRuntime prompt building and history growth are measured
+over thousands of recorded events, without any model call.
+
+    python tests/python-runtime/bench_probe.py [--quick] [--output results.json]
+        [--baseline baseline.json] [--tolerance 0.25] [--only PATTERN]
+
+Results are printed as json. With --baseline, every benchmark also present in the
+baseline must not be slower than it by more than the tolerance, and the script
+exits with status 1 otherwise. Save a run with --output to use it as a baseline.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "src"))
+)
+
+from python_runtime.policy import ProbePolicy
+from python_runtime.probe import NO_RESPONSE, ProbeEvent, Probed, Runtime, probe
+from ai_runtime.history import RESULT
+from ai_runtime.runtime import UNKNOWN_RESPONSE_FORMAT, AIRuntime
+
+PAYLOAD_SIZES = (1, 100, 10_000)
+HISTORY_EVENTS = (100, 1_000, 5_000)
+
+
+class FakeRuntime(Runtime):
+    """Lets every call through immediately and counts the events it saw."""
+
+    policy = None
+
+    def __init__(self):
+        self.events = 0
+
+    def register_probing(self, probed: Probed) -> None:
+        pass
+
+    def decide_and_respond(
+        self, probed: Probed, event_content: ProbeEvent, result_schema: str
+    ) -> tuple[bool, bool, bool, Any]:
+        self.events += 1
+        return False, False, False, NO_RESPONSE
+
+    def listen_event(
+        self, probed: Probed, event_content: ProbeEvent, result: str
+    ) -> None:
+        pass
+
+
+class Counter:
+    """Counts what is added to it."""
+
+    def __init__(self):
+        self.total = 0
+
+    def add(self, value: int) -> int:
+        """The new total"""
+        self.total += value
+        return self.total
+
+
+def measure(fn: Callable[[], Any], number: int, repeat: int) -> float:
+    """Median time of one fn() call in nanoseconds."""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter_ns() - start) / number)
+    return statistics.median(timings)
+
+
+def probe_benchmarks() -> dict[str, Callable[[], Any]]:
+    runtime = FakeRuntime()
+    counter = Counter()
+    probed_counter = probe(Counter(), "", runtime)
+    items = list(range(100))
+    probed_items = probe(list(range(100)), "", runtime)
+    passed_through = probe(
+        Counter(), "", runtime, policy=ProbePolicy(pass_through=["add"])
+    )
+    return {
+        "baseline.method_call": lambda: counter.add(1),
+        "baseline.len": lambda: len(items),
+        "probe.create": lambda: Probed(Counter(), runtime=runtime),
+        "probe.attribute": lambda: probed_counter.total,
+        "probe.method_lookup": lambda: probed_counter.add,
+        "probe.method_call": lambda: probed_counter.add(1),
+        "probe.method_call.pass_through": lambda: passed_through.add(1),
+        "probe.dunder.len": lambda: len(probed_items),
+        "probe.dunder.getitem": lambda: probed_items[50],
+        "probe.dunder.contains": lambda: 50 in probed_items,
+        "probe.dunder.bool": lambda: bool(probed_items),
+    }
+
+
+def serialization_benchmarks() -> dict[str, Callable[[], Any]]:
+    benchmarks = {}
+    for size in PAYLOAD_SIZES:
+        payload = {"values": list(range(size)), "label": "x" * size}
+        # A new event each time, the text is built once per event.
+        benchmarks[f"event.str.{size}"] = lambda payload=payload, size=size: str(
+            ProbeEvent("Counter_bench.add", (payload,), {"size": size})
+        )
+    return benchmarks
+
+
+def _runtime_with_history(events: int) -> tuple[AIRuntime, Probed]:
+    runtime = AIRuntime(policy=ProbePolicy())
+    probed = probe(Counter(), "Count things", runtime)
+    for i in range(events):
+        event = ProbeEvent(probed._prefix + ".add", (i,), {})
+        runtime._record_decision(probed, event, (i % 7 == 0, i % 11 == 0, False))
+        runtime._record_result(probed, str(i))
+    return runtime, probed
+
+
+def runtime_benchmarks() -> dict[str, Callable[[], Any]]:
+    benchmarks = {}
+    for events in HISTORY_EVENTS:
+        runtime, probed = _runtime_with_history(events)
+        event = ProbeEvent(probed._prefix + ".add", (1,), {})
+        history = runtime.probed_objects[probed]
+
+        def build_prompt(runtime=runtime, probed=probed, event=event, history=history):
+            # Appending invalidates the rendered history, as a real call does.
+            history.append(RESULT, "1")
+            return runtime._decision_prompt(probed, event, "", UNKNOWN_RESPONSE_FORMAT)
+
+        benchmarks[f"runtime.decision_prompt.{events}"] = build_prompt
+        benchmarks[f"runtime.record_decision.{events}"] = (
+            lambda runtime=runtime, probed=probed, event=event: (
+                runtime._record_decision(probed, event, (False, False, False))
+            )
+        )
+    return benchmarks
+
+
+def history_growth(pattern: str = "*") -> dict[str, dict[str, Any]]:
+    """Size of the rendered history after many events, bounded and unbounded."""
+    growth = {}
+    for events in HISTORY_EVENTS:
+        for label, max_bytes in (("bounded", 16_000), ("unbounded", None)):
+            if not fnmatch.fnmatch(f"history.{label}.{events}", pattern):
+                continue
+            runtime = AIRuntime(policy=ProbePolicy(), history_max_bytes=max_bytes)
+            probed = probe(Counter(), "Count things", runtime)
+            start = time.perf_counter_ns()
+            for i in range(events):
+                event = ProbeEvent(probed._prefix + ".add", (i,), {})
+                runtime._record_decision(probed, event, (False, i % 5 == 0, False))
+                runtime._record_result(probed, str(i))
+            elapsed = time.perf_counter_ns() - start
+            history = runtime.probed_objects[probed]
+            growth[f"history.{label}.{events}"] = {
+                "ns_per_event": elapsed / (2 * events),
+                "rendered_bytes": len(history.render()),
+                "kept_events": len(history),
+            }
+    return growth
+
+
+def compare(
+    results: dict[str, dict[str, Any]], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None or "ns_per_op" not in previous:
+            continue
+        limit = previous["ns_per_op"] * (1 + tolerance)
+        result["baseline_ns_per_op"] = previous["ns_per_op"]
+        if result["ns_per_op"] > limit:
+            regressions.append(
+                f"{name}: {result['ns_per_op']:.0f}ns > {limit:.0f}ns "
+                f"(baseline {previous['ns_per_op']:.0f}ns +{tolerance:.0%})"
+            )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="fewer iterations")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of an earlier run to compare to")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--only", default="*", help="glob of benchmarks to run")
+    args = parser.parse_args()
+
+    number, repeat = (200, 3) if args.quick else (2_000, 7)
+    benchmarks = {
+        **probe_benchmarks(),
+        **serialization_benchmarks(),
+        **runtime_benchmarks(),
+    }
+    results: dict[str, dict[str, Any]] = {}
+    for name, fn in benchmarks.items():
+        if fnmatch.fnmatch(name, args.only):
+            # Large payloads are slow enough that fewer runs are as stable.
+            runs = max(1, number // 20) if name.endswith(".10000") else number
+            results[name] = {"ns_per_op": measure(fn, runs, repeat)}
+    for name, result in results.items():
+        if name.startswith("probe.method_call"):
+            result["overhead_ns"] = (
+                result["ns_per_op"]
+                - results.get("baseline.method_call", {"ns_per_op": 0})["ns_per_op"]
+            )
+    results.update(history_growth(args.only))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "number": number,
+        "repeat": repeat,
+        "results": results,
+        "regressions": regressions,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
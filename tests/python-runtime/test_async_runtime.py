@@ -0,0 +1,113 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import martian
+from ai_runtime.async_runtime import AsyncAIRuntime
+from python_runtime.policy import ProbePolicy
+from python_runtime.probe import probe
+
+LET_THROUGH = json.dumps(
+    {"should_interrupt": False, "should_report": False, "should_stop": False}
+)
+
+
+class Store:
+    def __init__(self):
+        self.items = {"apple": 3}
+
+    async def fetch(self, name: str) -> int:
+        await asyncio.sleep(0)
+        return self.items[name]
+
+
+class FakeModel:
+    """Stands in for martian.use_martian_async, answering by prompt type."""
+
+    def __init__(self):
+        self.replies: dict[str, str] = {}
+        self.prompt_types: list[str] = []
+        self.delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(
+        self, message, instructions, context, prompt_type=None, on_usage=None
+    ):
+        self.prompt_types.append(prompt_type)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return self.replies.get(prompt_type, LET_THROUGH)
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake = FakeModel()
+    monkeypatch.setattr(martian, "use_martian_async", fake)
+    return fake
+
+
+def test_awaited_methods_are_probed(model):
+    runtime = AsyncAIRuntime(policy=ProbePolicy())
+    store = probe(Store(), "track stock", runtime)
+    assert asyncio.run(store.fetch("apple")) == 3
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"]
+
+    model.replies["DECIDE_AND_RESPOND"] = json.dumps(
+        {
+            "should_interrupt": True,
+            "should_report": False,
+            "should_stop": False,
+            "response": 0,
+        }
+    )
+    assert asyncio.run(store.fetch("apple")) == 0
+    assert len(runtime.probed_objects[store]) == 4
+
+
+def test_model_calls_are_bounded(model):
+    model.delay = 0.01
+    runtime = AsyncAIRuntime(policy=ProbePolicy(), max_concurrency=2)
+    stores = [probe(Store(), "track stock", runtime) for _ in range(6)]
+
+    async def main():
+        return await asyncio.gather(*(store.fetch("apple") for store in stores))
+
+    assert asyncio.run(main()) == [3] * 6
+    assert model.max_in_flight == 2
+
+
+def test_each_event_loop_gets_its_own_semaphore(model):
+    runtime = AsyncAIRuntime(policy=ProbePolicy())
+    store = probe(Store(), "track stock", runtime)
+
+    async def main():
+        await store.fetch("apple")
+        return runtime._semaphore()
+
+    first = asyncio.run(main())
+    second = asyncio.run(main())
+    assert first is not second
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"] * 2
+
+
+def test_decision_lookup_runs_off_the_event_loop(model):
+    runtime = AsyncAIRuntime(policy=ProbePolicy())
+    lookup = runtime._lookup_decision
+    threads = []
+
+    def recording_lookup(*args):
+        threads.append(threading.current_thread())
+        return lookup(*args)
+
+    runtime._lookup_decision = recording_lookup
+    store = probe(Store(), "track stock", runtime)
+    assert asyncio.run(store.fetch("apple")) == 3
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,122 @@
+from types import SimpleNamespace
+
+import pytest
+
+from ai_runtime import cache
+from ai_runtime.cache import (
+    DecisionCache,
+    LRUDecisionCache,
+    SqliteDecisionStore,
+    decision_key,
+    event_fingerprint,
+)
+from python_runtime.probe import ProbeEvent
+
+ALLOW = (False, False, False)
+INTERRUPT = (True, False, False)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable stand-in for the time module used by the cache."""
+    now = SimpleNamespace(monotonic=1000.0, wall=1_700_000_000.0)
+    monkeypatch.setattr(
+        cache,
+        "time",
+        SimpleNamespace(monotonic=lambda: now.monotonic, time=lambda: now.wall),
+    )
+
+    def advance(seconds: float) -> None:
+        now.monotonic += seconds
+        now.wall += seconds
+
+    return advance
+
+
+def test_equivalent_events_share_a_key():
+    event = ProbeEvent("Counter_1.add", (1,), {"b": 2, "a": 1})
+    text = '{\n  "kwargs": {"a": 1, "b": 2},\n  "args": [1],\n  "function": "Counter_1.add"\n}'
+    assert event_fingerprint(event) == event_fingerprint(text)
+    assert decision_key(event, "instructions", "") == decision_key(
+        text, "instructions", ""
+    )
+    assert decision_key(event, "instructions", "") != decision_key(event, "other", "")
+
+
+def test_least_recently_used_is_evicted_first():
+    decisions = LRUDecisionCache(max_size=2, ttl=None)
+    decisions.put("a", ALLOW)
+    decisions.put("b", ALLOW)
+    assert decisions.get("a") == ALLOW  # "b" is now the least recently used
+    decisions.put("c", INTERRUPT)
+    assert decisions.get("b") is None
+    assert decisions.get("a") == ALLOW
+    assert decisions.get("c") == INTERRUPT
+    assert decisions.stats() == {"hits": 3, "misses": 1, "evictions": 1, "size": 2}
+
+
+def test_entries_expire_after_the_ttl(clock):
+    decisions = LRUDecisionCache(ttl=10)
+    decisions.put("a", INTERRUPT)
+    clock(9)
+    assert decisions.get("a") == INTERRUPT
+    clock(2)
+    assert decisions.get("a") is None
+    assert len(decisions) == 0
+    assert decisions.evictions == 1
+
+
+def test_no_ttl_keeps_entries(clock):
+    decisions = LRUDecisionCache(ttl=None)
+    decisions.put("a", ALLOW)
+    clock(10**6)
+    assert decisions.get("a") == ALLOW
+
+
+def test_sqlite_store_survives_a_restart(tmp_path, clock):
+    path = str(tmp_path / "decision_cache.sqlite3")
+    LRUDecisionCache(store=SqliteDecisionStore(path)).put("a", INTERRUPT)
+
+    restarted = LRUDecisionCache(store=SqliteDecisionStore(path))
+    assert restarted.get("a") == INTERRUPT
+    assert restarted.stats()["hits"] == 1
+    # Loaded into memory, the store is not read again.
+    restarted.store = None
+    assert restarted.get("a") == INTERRUPT
+
+
+def test_sqlite_entries_keep_their_age(tmp_path, clock):
+    path = str(tmp_path / "decision_cache.sqlite3")
+    LRUDecisionCache(ttl=60, store=SqliteDecisionStore(path)).put("a", ALLOW)
+    clock(50)
+    restarted = LRUDecisionCache(ttl=60, store=SqliteDecisionStore(path))
+    assert restarted.get("a") == ALLOW
+    # Still 60 seconds after it was first decided, not after it was loaded.
+    clock(11)
+    restarted.store = None
+    assert restarted.get("a") is None
+
+
+def test_expired_sqlite_entries_are_misses(tmp_path, clock):
+    path = str(tmp_path / "decision_cache.sqlite3")
+    LRUDecisionCache(ttl=60, store=SqliteDecisionStore(path)).put("a", ALLOW)
+    clock(61)
+    restarted = LRUDecisionCache(ttl=60, store=SqliteDecisionStore(path))
+    assert restarted.get("a") is None
+    assert restarted.stats()["misses"] == 1
+
+
+def test_clear_empties_memory_and_store(tmp_path):
+    store = SqliteDecisionStore(str(tmp_path / "decision_cache.sqlite3"))
+    decisions = LRUDecisionCache(store=store)
+    decisions.put("a", ALLOW)
+    decisions.clear()
+    assert len(decisions) == 0
+    assert store.load("a") is None
+
+
+def test_base_cache_never_hits():
+    decisions = DecisionCache()
+    decisions.put("a", ALLOW)
+    assert decisions.get("a") is None
+    assert decisions.stats() == {"hits": 0, "misses": 1}
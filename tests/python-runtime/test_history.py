@@ -0,0 +1,134 @@
+import random
+import threading
+import time
+
+from ai_runtime.history import DECISION, RESPONSE, RESULT, ProbeHistory
+
+
+def texts(history: ProbeHistory) -> list[str]:
+    return [text for _, text, _ in history.events]
+
+
+def test_small_histories_are_kept_verbatim():
+    history = ProbeHistory("header", max_bytes=1000)
+    history.append(DECISION, "decided", (True, False, False))
+    history.append(RESULT, "42")
+    assert history.render() == "header\ndecided\n42"
+    assert history.digest() == ""
+    assert len(history) == 2
+
+
+def test_oldest_events_are_rolled_up():
+    history = ProbeHistory("header", max_bytes=100)
+    for i in range(20):
+        history.append(DECISION, f"decision {i}", (i % 2 == 0, i % 5 == 0, False))
+        history.append(RESULT, f"result {i}")
+    history.append(RESPONSE, "made up answer")
+    assert history.size <= 100
+    rolled = history.rolled_up
+    assert sum(rolled.values()) + len(history) == 41
+    assert texts(history)[-1] == "made up answer"
+    # The digest accounts for every event that is no longer listed.
+    decisions = [text for text in texts(history) if text.startswith("decision")]
+    assert rolled[DECISION] + len(decisions) == 20
+    listed = {int(text.split()[1]) for text in decisions}
+    assert history.interrupted == sum(
+        1 for i in range(20) if i % 2 == 0 and i not in listed
+    )
+    assert history.reported == sum(
+        1 for i in range(20) if i % 5 == 0 and i not in listed
+    )
+    digest = history.digest()
+    assert f"{sum(rolled.values())} earlier events" in digest
+    assert history.render().startswith("header\n" + digest)
+
+
+def test_last_rolled_up_values_are_remembered():
+    history = ProbeHistory("", max_bytes=40)
+    history.append(RESULT, "first result")
+    history.append(RESPONSE, "first response")
+    history.append(RESULT, "second result")
+    history.append(DECISION, "x" * 30, (False, False, False))
+    assert history.last_result == "second result"
+    assert history.last_response == "first response"
+
+
+def test_rendered_size_stays_bounded():
+    history = ProbeHistory("header", max_bytes=2_000)
+    for i in range(5_000):
+        history.append(RESULT, f"result {i}")
+    assert len(history.render()) < 2_000 + 500
+    assert history.last_result.startswith("result ")
+
+
+def test_oversized_events_are_truncated():
+    history = ProbeHistory("", max_bytes=100)
+    history.append(RESULT, "y" * 500)
+    [text] = texts(history)
+    assert text.endswith("... (truncated)")
+    assert len(text) < 100
+
+
+def test_token_budget_sets_the_byte_budget():
+    assert ProbeHistory("", max_tokens=100).max_bytes == 400
+
+
+def test_unbounded_history_keeps_everything():
+    history = ProbeHistory("", max_bytes=None)
+    for i in range(1_000):
+        history.append(RESULT, str(i))
+    assert len(history) == 1_000
+    assert history.digest() == ""
+
+
+def test_commits_apply_in_slot_order():
+    history = ProbeHistory("", max_bytes=None)
+    first = history.reserve()
+    history.append(RESULT, "after first")
+    second = history.reserve()
+    history.commit(second, [(DECISION, "second", (False, False, False))])
+    assert len(history) == 0
+    history.commit(first, [(DECISION, "first", (False, False, False))])
+    assert texts(history) == ["first", "after first", "second"]
+    history.append(RESULT, "direct")
+    assert texts(history)[-1] == "direct"
+
+
+def test_empty_commit_releases_a_slot():
+    history = ProbeHistory("", max_bytes=None)
+    failed = history.reserve()
+    history.append(RESULT, "later")
+    # What a call that raised before its model answered does.
+    history.commit(failed)
+    history.commit(failed, [(RESULT, "ignored", ())])
+    assert texts(history) == ["later"]
+
+
+def test_concurrent_writers_lose_nothing():
+    history = ProbeHistory("", max_bytes=None)
+    threads, per_thread = 8, 200
+
+    def work(worker: int) -> None:
+        for i in range(per_thread):
+            if i % 2:
+                history.append(RESULT, f"{worker}:{i}")
+                continue
+            slot = history.reserve()
+            time.sleep(random.random() / 10_000)
+            history.commit(slot, [(DECISION, f"{worker}:{i}", (False, False, False))])
+
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(history) == threads * per_thread
+    assert history._waiting == {}
+    # Each thread's own events stay in the order it made them.
+    for n in range(threads):
+        own = [
+            int(text.split(":")[1])
+            for text in texts(history)
+            if text.startswith(f"{n}:")
+        ]
+        assert own == list(range(per_thread))
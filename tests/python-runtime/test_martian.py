@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+import martian
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(martian, "_settings", lambda: ("gemini-key", "martian-key"))
+
+
+def test_sync_clients_are_shared():
+    assert martian._openai_client("gemini", False) is martian._openai_client(
+        "gemini", False
+    )
+
+
+def test_async_clients_are_kept_per_loop():
+    async def clients():
+        gemini = martian._openai_client("gemini", True)
+        assert martian._openai_client("gemini", True) is gemini
+        assert martian._openai_client("martian", True) is not gemini
+        return gemini
+
+    first = asyncio.run(clients())
+    second = asyncio.run(clients())
+    assert first is not second
+
+
+def test_clients_leave_retries_to_the_scheduler():
+    async def client():
+        return martian._openai_client("martian", True)
+
+    assert martian._openai_client("martian", False).max_retries == 0
+    assert asyncio.run(client()).max_retries == 0
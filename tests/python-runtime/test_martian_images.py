@@ -0,0 +1,57 @@
+import os
+
+import martian_images
+from martian_images import ImageCache
+
+
+def fake_generator(calls: list):
+    def generate(description: str):
+        calls.append(description)
+        return description.encode() * 10, "image/png"
+
+    return generate
+
+
+def age(path: str, mtime: float) -> None:
+    os.utime(path, (mtime, mtime))
+
+
+def test_equivalent_descriptions_share_an_image(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    calls = []
+    first = cache.get("A red 'fox'", fake_generator(calls))
+    assert cache.get("  a RED 'fox'  ", fake_generator(calls)) == first
+    assert calls == ["A red 'fox'"]
+    assert first.endswith(".png")
+
+
+def test_least_recently_used_images_are_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=250)
+    generate = fake_generator([])
+    old = cache.get("old image", generate)
+    used = cache.get("used image", generate)
+    age(old, 1_000)
+    age(used, 2_000)
+    cache.lookup("used image")
+    new = cache.get("new image", generate)
+    assert not os.path.exists(old)
+    assert os.path.exists(used) and os.path.exists(new)
+
+
+def test_concurrent_eviction_is_tolerated(tmp_path, monkeypatch):
+    cache = ImageCache(str(tmp_path), max_bytes=None)
+    generate = fake_generator([])
+    paths = [cache.get(f"image {i}", generate) for i in range(3)]
+    for i, path in enumerate(paths):
+        age(path, 1_000 + i)
+    remove = os.remove
+
+    def racing_remove(path):
+        # Another process evicts the same file first.
+        remove(path)
+        remove(path)
+
+    monkeypatch.setattr(martian_images.os, "remove", racing_remove)
+    cache.max_bytes = 100
+    assert cache.evict(keep=paths[2]) == 0
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import martian
+from martian_router import (
+    ASK_MODEL_DECISION,
+    COHERE_MODEL,
+    DECIDE_AND_RESPOND,
+    GEMINI_MODEL,
+    LISTEN_EVENT,
+    RESPOND_EVENT,
+    BackendStats,
+    LocalRouter,
+)
+
+
+def test_prompt_types_are_recognized_from_markers():
+    assert (
+        LocalRouter.classify("... Do you want to interrupt this operation? ...")
+        == ASK_MODEL_DECISION
+    )
+    assert (
+        LocalRouter.classify("You decided NOT to interrupt the operation.")
+        == LISTEN_EVENT
+    )
+    assert LocalRouter.classify("hello") is None
+
+
+def test_preferred_model_per_prompt_type():
+    router = LocalRouter(explore_every=0)
+    assert router.choose("", ASK_MODEL_DECISION) == COHERE_MODEL
+    assert router.choose("", DECIDE_AND_RESPOND) == GEMINI_MODEL
+    assert router.choose("", RESPOND_EVENT) == GEMINI_MODEL
+    assert router.choose("x" * 48_001, ASK_MODEL_DECISION) == GEMINI_MODEL
+    assert router.choose("unknown prompt") == GEMINI_MODEL
+    assert LocalRouter(llm_fallback=True).choose("unknown prompt") is None
+
+
+def test_latency_is_an_exponentially_weighted_average():
+    stats = BackendStats(alpha=0.5)
+    stats.record(1.0, ok=True)
+    stats.record(3.0, ok=True)
+    assert stats.latency == 2.0
+    # Failed calls move the error rate but not the latency.
+    stats.record(100.0, ok=False)
+    assert stats.latency == 2.0
+    assert stats.error_rate == 0.5
+    assert stats.calls == 3
+
+
+def test_failing_backend_is_avoided_until_it_recovers():
+    router = LocalRouter(explore_every=0)
+    for _ in range(5):
+        router.record(COHERE_MODEL, 0.1, ok=False)
+    assert router.choose("", ASK_MODEL_DECISION) == GEMINI_MODEL
+    for _ in range(5):
+        router.record(COHERE_MODEL, 0.1, ok=True)
+    assert router.choose("", ASK_MODEL_DECISION) == COHERE_MODEL
+
+
+def test_slow_backend_is_avoided():
+    router = LocalRouter(explore_every=0, latency_ratio=1.5)
+    router.record(COHERE_MODEL, 1.0, ok=True)
+    router.record(GEMINI_MODEL, 0.8, ok=True)
+    assert router.choose("", ASK_MODEL_DECISION) == COHERE_MODEL
+    router.record(GEMINI_MODEL, 0.1, ok=True)
+    router.record(GEMINI_MODEL, 0.1, ok=True)
+    assert router.choose("", ASK_MODEL_DECISION) == GEMINI_MODEL
+    # A fast backend that keeps failing is not worth switching to.
+    for _ in range(10):
+        router.record(GEMINI_MODEL, 0.1, ok=False)
+    assert router.choose("", ASK_MODEL_DECISION) == COHERE_MODEL
+
+
+def test_alternative_is_explored_periodically():
+    router = LocalRouter(explore_every=3)
+    choices = [router.choose("", ASK_MODEL_DECISION) for _ in range(6)]
+    assert choices == [COHERE_MODEL, COHERE_MODEL, GEMINI_MODEL] * 2
+
+
+def test_failed_call_falls_back_to_the_alternative(monkeypatch):
+    router = LocalRouter(explore_every=0)
+    monkeypatch.setattr(martian, "router", router)
+    attempts = []
+
+    def complete(model, messages, prompt_type=None, on_usage=None):
+        attempts.append(model)
+        if model == COHERE_MODEL:
+            raise ConnectionError("cohere is down")
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{"ok": 1}'))]
+        )
+
+    monkeypatch.setattr(martian, "_complete", complete)
+    assert martian.use_martian("", "", "", prompt_type=ASK_MODEL_DECISION) == (
+        '{"ok": 1}'
+    )
+    assert attempts == [COHERE_MODEL, GEMINI_MODEL]
+    snapshot = router.snapshot()
+    assert snapshot[COHERE_MODEL]["error_rate"] > 0
+    assert snapshot[GEMINI_MODEL]["calls"] == 1
@@ -0,0 +1,94 @@
+import json
+import os
+
+import pytest
+
+from python_runtime import policy as policy_module
+from python_runtime.policy import ProbePolicy
+
+
+def test_rules_are_matched_in_order():
+    policy = ProbePolicy(
+        always_ask=["__len__"],
+        pass_through=["__*__"],
+        deny=["get_*"],
+        allow=["get_*", "set_*", "add"],
+        sample={"set_*": 0.25, "set_name": 0.5},
+        default_rate=0.75,
+    )
+    assert policy.rate("Shop_1.__len__") == 1.0  # always_ask beats pass_through
+    assert policy.rate("Shop_1.__iter__") == 0.0
+    assert policy.rate("Shop_1.get_price") == 0.0  # deny beats allow
+    assert policy.rate("Shop_1.remove") == 0.0  # not allowed
+    assert policy.rate("Shop_1.set_name") == 0.25  # first sample pattern wins
+    assert policy.rate("Shop_1.add") == 0.75
+
+
+def test_disabled_policy_probes_nothing():
+    policy = ProbePolicy(enabled=False, always_ask=["*"])
+    assert not policy.should_probe("Shop_1.add")
+
+
+def test_rates_are_kept_per_method_name():
+    policy = ProbePolicy(sample={"add": 0.5})
+    for i in range(100):
+        policy.rate(f"Counter_{i}.add")
+        policy.rate(f"Counter_{i}.items.append")
+    assert policy._table == {"add": 0.5, "append": 1.0}
+    policy.update(sample={"add": 0.1})
+    assert policy.rate("Counter_0.add") == 0.1
+
+
+def test_sampling_uses_the_rate(monkeypatch):
+    policy = ProbePolicy(default_rate=0.3)
+    draws = iter([0.1, 0.5, 0.29, 0.3])
+    monkeypatch.setattr(policy_module.random, "random", lambda: next(draws))
+    assert [policy.should_probe("Counter_1.add") for _ in range(4)] == [
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_unknown_fields_are_rejected():
+    with pytest.raises(ValueError):
+        ProbePolicy().update(allowed=["add"])
+
+
+def write(path, config: dict, mtime: float) -> None:
+    path.write_text(json.dumps(config))
+    # Distinct mtimes, writes in the same clock tick would look unchanged.
+    os.utime(path, (mtime, mtime))
+
+
+def test_policy_file_is_reloaded(tmp_path):
+    path = tmp_path / "probe_policy.json"
+    write(path, {"pass_through": ["add"]}, 1_000)
+    policy = ProbePolicy.from_file(str(path), reload_interval=0)
+    assert policy.rate("Counter_1.add") == 0.0
+
+    write(path, {"sample": {"add": 0.5}, "comment": "ignored"}, 2_000)
+    assert policy.rate("Counter_1.add") == 0.5
+
+    # A broken file keeps the rules in force.
+    path.write_text("{")
+    os.utime(path, (3_000, 3_000))
+    assert policy.rate("Counter_1.add") == 0.5
+
+    path.unlink()
+    assert policy.rate("Counter_1.add") == 1.0
+    assert policy.to_dict() == ProbePolicy().to_dict()
+
+
+def test_reload_checks_are_rate_limited(tmp_path, monkeypatch):
+    path = tmp_path / "probe_policy.json"
+    write(path, {"pass_through": ["add"]}, 1_000)
+    now = [100.0]
+    monkeypatch.setattr(policy_module.time, "monotonic", lambda: now[0])
+    policy = ProbePolicy.from_file(str(path), reload_interval=1.0)
+    assert policy.rate("Counter_1.add") == 0.0
+    write(path, {}, 2_000)
+    assert policy.rate("Counter_1.add") == 0.0
+    now[0] += 1.0
+    assert policy.rate("Counter_1.add") == 1.0
@@ -0,0 +1,104 @@
+import copy
+import pickle
+from typing import Any
+
+import pytest
+
+from python_runtime.probe import NO_RESPONSE, ProbeEvent, Probed, Runtime, probe
+
+
+class PassRuntime(Runtime):
+    """Lets every call through and keeps the events it saw."""
+
+    policy = None
+
+    def __init__(self):
+        self.events: list[str] = []
+
+    def register_probing(self, probed: Probed) -> None:
+        pass
+
+    def decide_and_respond(
+        self, probed: Probed, event_content: ProbeEvent, result_schema: str
+    ) -> tuple[bool, bool, bool, Any]:
+        self.events.append(event_content.function)
+        return False, False, False, NO_RESPONSE
+
+    def listen_event(
+        self, probed: Probed, event_content: ProbeEvent, result: str
+    ) -> None:
+        pass
+
+
+class Counter:
+    def __init__(self):
+        self.total = 0
+
+    def add(self, value: int) -> int:
+        self.total += value
+        return self.total
+
+
+def test_method_proxies_are_reused():
+    runtime = PassRuntime()
+    counter = probe(Counter(), "", runtime)
+    assert counter.add is counter.add
+    assert counter.add(2) == 2
+    assert runtime.events == [counter._prefix + ".add"]
+
+
+def test_attributes_are_read_each_time():
+    counter = probe(Counter(), "", PassRuntime())
+    assert counter.total._obj == 0
+    counter.total = 5
+    assert counter.total._obj == 5
+
+
+def test_setting_a_method_drops_its_proxy():
+    counter = probe(Counter(), "", PassRuntime())
+    add = counter.add
+    counter.add = lambda value: -value
+    assert counter.add is not add
+    assert counter.add(3) == -3
+
+
+def test_object_defaults_are_not_probed():
+    runtime = PassRuntime()
+    counter = probe(Counter(), "", runtime)
+    assert str(counter) == str(counter._obj)
+    assert f"{counter}" == str(counter._obj)
+    with pytest.raises(TypeError):
+        counter < counter
+    assert runtime.events == []
+
+
+def test_overridden_special_methods_are_probed():
+    runtime = PassRuntime()
+    numbers = probe([3, 1, 2], "", runtime)
+    assert str(numbers) == "[3, 1, 2]"  # list inherits __str__ from object
+    assert numbers < [4]
+    assert runtime.events == [numbers._prefix + ".__lt__"]
+
+
+def test_copies_probe_a_copy_of_the_object():
+    runtime = PassRuntime()
+    numbers = probe([[1], [2]], "sort", runtime)
+    shallow = copy.copy(numbers)
+    deep = copy.deepcopy(numbers)
+    for duplicate in (shallow, deep):
+        assert type(duplicate) is type(numbers)
+        assert duplicate._obj == numbers._obj and duplicate._obj is not numbers._obj
+        assert duplicate._prompt == "sort" and duplicate._runtime is runtime
+        assert duplicate._prefix != numbers._prefix
+    assert shallow._obj[0] is numbers._obj[0]
+    assert deep._obj[0] is not numbers._obj[0]
+
+
+def test_probed_objects_can_be_pickled():
+    counter = probe(Counter(), "count", PassRuntime())
+    counter.add(2)
+    restored = pickle.loads(pickle.dumps(counter))
+    assert isinstance(restored, Probed)
+    assert restored.total._obj == 2
+    assert restored.add(1) == 3
+    assert restored._runtime.events[-1] == restored._prefix + ".add"
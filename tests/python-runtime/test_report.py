@@ -0,0 +1,108 @@
+import json
+import threading
+
+from python_runtime.probe import ProbeEvent
+from python_runtime.report import (
+    FileSink,
+    MemorySink,
+    ReportSink,
+    Reporter,
+    format_record,
+    snapshot,
+)
+
+
+class Died(BaseException):
+    """Not caught by Reporter._write, so it ends the reporter thread."""
+
+
+class DyingSink(MemorySink):
+    """Takes down the thread on its first batch, then writes normally."""
+
+    def __init__(self):
+        super().__init__()
+        self.died = False
+
+    def write(self, lines: list[str]) -> None:
+        if not self.died:
+            self.died = True
+            raise Died()
+        super().write(lines)
+
+
+def test_unrendered_event_is_encoded_once_and_compact():
+    event = ProbeEvent("Counter_1.add", ([1, 2],), {"label": "x"})
+    text, compact = snapshot(event)
+    assert compact
+    assert "\n" not in text
+    assert event._text is None
+    record = json.loads(format_record(text, 0.0, compact))
+    assert record["event_data"] == {
+        "function": "Counter_1.add",
+        "args": [[1, 2]],
+        "kwargs": {"label": "x"},
+    }
+
+
+def test_rendered_event_reuses_its_text():
+    event = ProbeEvent("Counter_1.add", (1,), {})
+    rendered = str(event)
+    text, compact = snapshot(event)
+    assert text is rendered and not compact
+    line = format_record(text, 0.0, compact)
+    assert "\n" not in line
+    assert json.loads(line)["event_data"]["args"] == [1]
+
+
+def test_plain_text_events_stay_strings():
+    assert json.loads(format_record("not json", 0.0))["event_data"] == "not json"
+
+
+def test_mutations_after_report_do_not_leak_in():
+    sink = MemorySink()
+    reporter = Reporter(sink, flush_interval=10)
+    values = [1]
+    reporter.report(ProbeEvent("f", (values,), {}))
+    values.append(2)
+    reporter.flush()
+    reporter.close()
+    assert [record["event_data"]["args"] for record in sink.records] == [[[1]]]
+
+
+def test_batches_are_written_in_order(tmp_path):
+    path = tmp_path / "report.jsonl"
+    reporter = Reporter(FileSink(str(path)), batch_size=4)
+    for i in range(10):
+        reporter.report(ProbeEvent("f", (i,), {}))
+    reporter.close()
+    lines = path.read_text().splitlines()
+    assert [json.loads(line)["event_data"]["args"] for line in lines] == [
+        [i] for i in range(10)
+    ]
+    assert reporter.written == 10
+
+
+def test_flush_returns_when_the_thread_died(monkeypatch):
+    monkeypatch.setattr(threading, "excepthook", lambda args: None)
+    sink = DyingSink()
+    reporter = Reporter(sink, flush_interval=10)
+    reporter.report(ProbeEvent("f", (1,), {}))
+    reporter.flush()
+    reporter._thread.join(1)
+    assert not reporter._thread.is_alive()
+    reporter.report(ProbeEvent("f", (2,), {}))
+    # Would wait forever on the dead thread, now writes the event itself.
+    reporter.flush()
+    assert [record["event_data"]["args"] for record in sink.records] == [[2]]
+
+
+def test_sink_errors_count_as_dropped():
+    class BrokenSink(ReportSink):
+        def write(self, lines: list[str]) -> None:
+            raise OSError("disk full")
+
+    reporter = Reporter(BrokenSink())
+    reporter.report("event")
+    reporter.flush()
+    reporter.close()
+    assert reporter.dropped == 1 and reporter.written == 0
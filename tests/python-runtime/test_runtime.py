@@ -0,0 +1,345 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import martian
+from ai_runtime import budget as budget_module
+from ai_runtime.budget import (
+    CACHED_ONLY,
+    FULL,
+    PASS_THROUGH,
+    SAMPLED,
+    Budget,
+    BudgetLimits,
+    usage_cost,
+)
+from ai_runtime.cache import DecisionCache, LRUDecisionCache
+from ai_runtime.history import DECISION, RESPONSE, RESULT
+from ai_runtime.runtime import AIRuntime
+from python_runtime.policy import ProbePolicy
+from python_runtime.probe import probe
+
+LET_THROUGH = json.dumps(
+    {"should_interrupt": False, "should_report": False, "should_stop": False}
+)
+INTERRUPT = json.dumps(
+    {"should_interrupt": True, "should_report": False, "should_stop": False}
+)
+
+
+class Counter:
+    def __init__(self):
+        self.total = 0
+
+    def add(self, value: int) -> int:
+        self.total += value
+        return self.total
+
+
+class FakeModel:
+    """Stands in for martian.use_martian, answering by prompt type."""
+
+    def __init__(self):
+        self.replies: dict[str, str] = {}
+        self.prompt_types: list[str] = []
+
+    def __call__(self, message, instructions, context, prompt_type=None, on_usage=None):
+        self.prompt_types.append(prompt_type)
+        on_usage("fake-model", 100, 10)
+        return self.replies.get(prompt_type, LET_THROUGH)
+
+
+@pytest.fixture
+def model(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fake = FakeModel()
+    monkeypatch.setattr(martian, "use_martian", fake)
+    return fake
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    # The runtime reads user_query.md from the working directory.
+    monkeypatch.chdir(tmp_path)
+    runtime = AIRuntime(decision_cache=DecisionCache(), policy=ProbePolicy())
+    runtime.model_delay = 0.0
+
+    def call_model(probed, prompt, prompt_type):
+        time.sleep(runtime.model_delay)
+        return LET_THROUGH
+
+    runtime._call_model = call_model
+    return runtime
+
+
+def run_threads(count: int, target) -> None:
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def counts(history) -> tuple[int, int]:
+    kinds = [kind for kind, _, _ in history.events]
+    return (
+        kinds.count(DECISION) + history.rolled_up[DECISION],
+        kinds.count(RESULT) + history.rolled_up[RESULT],
+    )
+
+
+def test_shared_object_keeps_every_event(runtime):
+    runtime.model_delay = 0.001
+    counter = probe(Counter(), "count", runtime)
+
+    def work():
+        for _ in range(25):
+            counter.add(1)
+
+    run_threads(8, work)
+    history = runtime.probed_objects[counter]
+    assert counter._obj.total == 200
+    assert counts(history) == (200, 200)
+    assert history._waiting == {}
+
+
+def test_independent_objects_run_in_parallel(runtime):
+    runtime.model_delay = 0.1
+    counters = [probe(Counter(), "count", runtime) for _ in range(8)]
+    index = iter(range(8))
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            counter = counters[next(index)]
+        counter.add(1)
+
+    start = time.monotonic()
+    run_threads(8, work)
+    # Eight calls of 0.1s each, overlapping rather than one after the other.
+    assert time.monotonic() - start < 0.5
+
+
+def test_failed_model_call_releases_its_slot(runtime):
+    counter = probe(Counter(), "count", runtime)
+    working = runtime._call_model
+
+    def failing(probed, prompt, prompt_type):
+        raise ConnectionError("model unreachable")
+
+    runtime._call_model = failing
+    with pytest.raises(ConnectionError):
+        counter.add(1)
+    runtime._call_model = working
+    assert counter.add(1) == 1
+    assert counts(runtime.probed_objects[counter]) == (1, 1)
+
+
+def test_observed_interrupts_never_block(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runtime = AIRuntime(
+        decision_cache=LRUDecisionCache(),
+        observe_decisions=True,
+        policy=ProbePolicy(),
+    )
+    prompt_types = []
+
+    def call_model(probed, prompt, prompt_type):
+        prompt_types.append(prompt_type)
+        return json.dumps(
+            {"should_interrupt": True, "should_report": False, "should_stop": True}
+        )
+
+    runtime._call_model = call_model
+    counter = probe(Counter(), "count", runtime)
+    assert counter.add(1) == 1
+    runtime.flush()
+    # The same event again is now a cache hit, which must not interrupt.
+    assert counter.add(1) == 2
+    runtime.flush()
+    assert prompt_types == ["ASK_MODEL_DECISION"]
+    decisions = [
+        flags
+        for kind, _, flags in runtime.probed_objects[counter].events
+        if kind == DECISION
+    ]
+    assert decisions == [(False, False, False)] * 2
+
+
+def test_decisions_are_not_cached_by_default(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runtime = AIRuntime(policy=ProbePolicy())
+    prompt_types = []
+
+    def call_model(probed, prompt, prompt_type):
+        prompt_types.append(prompt_type)
+        return LET_THROUGH
+
+    runtime._call_model = call_model
+    counter = probe(Counter(), "count", runtime)
+    counter.add(1)
+    counter.add(1)
+    assert prompt_types == ["DECIDE_AND_RESPOND"] * 2
+
+
+def budgeted(budget: Budget) -> AIRuntime:
+    return AIRuntime(
+        decision_cache=LRUDecisionCache(), policy=ProbePolicy(), budget=budget
+    )
+
+
+def test_over_budget_probe_uses_cached_decisions_only(model):
+    # Every fake model call costs 110 tokens.
+    budget = Budget(per_probe=BudgetLimits(tokens_per_run=200))
+    runtime = budgeted(budget)
+    counter = probe(Counter(), "count", runtime)
+    other = probe(Counter(), "count", runtime)
+    counter.add(1)
+    counter.add(2)
+    assert budget.mode(counter) == CACHED_ONLY
+    counter.add(1)  # decided before, answered from the cache
+    counter.add(3)  # not cached, passes through
+    other.add(5)  # other objects keep their own budget
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"] * 3
+    assert counter._obj.total == 7
+    assert counts(runtime.probed_objects[counter]) == (3, 4)
+    assert budget.report()["degraded"] == {counter._prefix: "tokens_per_run"}
+
+
+def test_over_total_budget_everything_passes_through(model):
+    budget = Budget(total=BudgetLimits(tokens_per_run=100), degrade_to=PASS_THROUGH)
+    runtime = budgeted(budget)
+    counter = probe(Counter(), "count", runtime)
+    other = probe(Counter(), "count", runtime)
+    counter.add(1)
+    counter.add(1)  # cached, but the cache is not consulted either
+    other.add(1)
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"]
+    assert counts(runtime.probed_objects[counter]) == (1, 2)
+    assert budget.report()["degraded"] == {
+        counter._prefix: "total tokens_per_run",
+        other._prefix: "total tokens_per_run",
+    }
+
+
+def test_sampled_budget_asks_about_a_share_of_calls(model, monkeypatch):
+    budget = Budget(
+        per_probe=BudgetLimits(tokens_per_run=100),
+        degrade_to=SAMPLED,
+        sample_rate=0.5,
+    )
+    draws = iter([0.7, 0.2, 0.9, 0.4])
+    monkeypatch.setattr(
+        budget_module, "random", SimpleNamespace(random=lambda: next(draws))
+    )
+    counter = probe(Counter(), "count", budgeted(budget))
+    for value in range(5):
+        counter.add(value)
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"] * 3
+    assert counter._obj.total == 10
+
+
+def test_over_budget_interrupt_returns_the_real_result(model):
+    model.replies["DECIDE_AND_RESPOND"] = INTERRUPT
+    budget = Budget(per_probe=BudgetLimits(tokens_per_run=100))
+    counter = probe(Counter(), "count", budgeted(budget))
+    # The decision used up the budget, so no response is asked for.
+    assert counter.add(5) == 5
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"]
+
+
+def test_minute_limits_recover(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(
+        budget_module, "time", SimpleNamespace(monotonic=lambda: now.value)
+    )
+    budget = Budget(
+        per_probe=BudgetLimits(tokens_per_minute=1000), degrade_to=PASS_THROUGH
+    )
+    cost = budget.record("a", "cohere/command-a", 900, 100, 0.5)
+    assert cost == usage_cost("cohere/command-a", 900, 100) == 0.00325
+    assert budget.mode("a") == PASS_THROUGH
+    assert budget.mode("b") == FULL
+    now.value += 61
+    assert budget.mode("a") == FULL
+    report = budget.report()
+    assert report["degraded"] == {}
+    assert report["total"]["calls"] == 1
+    assert report["total"]["last_minute"]["tokens"] == 0
+
+
+def test_unknown_degrade_mode_is_rejected():
+    with pytest.raises(ValueError):
+        Budget(degrade_to="off")
+
+
+def interrupting(response) -> str:
+    return json.dumps(
+        {
+            "should_interrupt": True,
+            "should_report": False,
+            "should_stop": False,
+            "response": response,
+        }
+    )
+
+
+def test_fused_interrupt_is_one_model_call(model):
+    model.replies["DECIDE_AND_RESPOND"] = interrupting(41)
+    runtime = AIRuntime(policy=ProbePolicy())
+    counter = probe(Counter(), "count", runtime)
+    assert counter.add(1) == 41
+    assert counter._obj.total == 0
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"]
+    kinds = [kind for kind, _, _ in runtime.probed_objects[counter].events]
+    assert kinds == [DECISION, RESPONSE]
+
+
+def test_fused_pass_through_is_not_acknowledged(model):
+    runtime = AIRuntime(policy=ProbePolicy())
+    counter = probe(Counter(), "count", runtime)
+    assert counter.add(1) == 1
+    assert model.prompt_types == ["DECIDE_AND_RESPOND"]
+    assert counts(runtime.probed_objects[counter]) == (1, 1)
+
+
+def test_unfused_calls_take_two_model_calls(model):
+    runtime = AIRuntime(policy=ProbePolicy(), fused=False)
+    counter = probe(Counter(), "count", runtime)
+    assert counter.add(1) == 1
+    assert model.prompt_types == ["ASK_MODEL_DECISION", "LISTEN_EVENT"]
+
+    model.prompt_types.clear()
+    model.replies["ASK_MODEL_DECISION"] = INTERRUPT
+    model.replies["RESPOND_EVENT"] = "41"
+    assert counter.add(1) == 41
+    assert model.prompt_types == ["ASK_MODEL_DECISION", "RESPOND_EVENT"]
+
+
+def test_fused_interrupt_without_response_asks_for_one(model):
+    model.replies["DECIDE_AND_RESPOND"] = interrupting(None)
+    model.replies["RESPOND_EVENT"] = "41"
+    counter = probe(Counter(), "count", AIRuntime(policy=ProbePolicy()))
+    assert counter.add(1) == 41
+    assert model.prompt_types == ["DECIDE_AND_RESPOND", "RESPOND_EVENT"]
+
+
+def test_malformed_fused_replies(model):
+    runtime = AIRuntime(policy=ProbePolicy())
+    counter = probe(Counter(), "count", runtime)
+    # Missing flags default to letting the call through, and a response
+    # without an interrupt is ignored.
+    model.replies["DECIDE_AND_RESPOND"] = json.dumps({"response": 41})
+    assert counter.add(1) == 1
+    model.replies["DECIDE_AND_RESPOND"] = "not json"
+    with pytest.raises(ValueError):
+        counter.add(1)
+    history = runtime.probed_objects[counter]
+    assert history._waiting == {}
+    # The failed call left no slot behind, later calls are recorded.
+    model.replies["DECIDE_AND_RESPOND"] = LET_THROUGH
+    assert counter.add(1) == 2
+    assert counts(history) == (2, 2)
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from martian_scheduler import DECISION, IMAGE, ProviderLimits, Scheduler
+
+
+def test_async_waiter_wakes_on_release():
+    scheduler = Scheduler({"p": ProviderLimits(max_in_flight=1)})
+    scheduler._acquire("p", DECISION, 1)
+
+    async def waiter():
+        start = time.monotonic()
+        await scheduler._aacquire("p", DECISION, 1)
+        return time.monotonic() - start
+
+    # Released from another thread while the loop waits on nothing else.
+    timer = threading.Timer(0.2, scheduler._release, ("p",))
+    timer.start()
+    waited = asyncio.run(waiter())
+    timer.join()
+    assert 0.15 <= waited < 0.3
+
+
+def test_async_waiter_sleeps_until_refill():
+    scheduler = Scheduler({"p": ProviderLimits(requests_per_minute=120)})
+    provider = scheduler._provider("p")
+    provider.requests.take(provider.requests.capacity)
+
+    async def waiter():
+        start = time.monotonic()
+        await scheduler._aacquire("p", DECISION, 1)
+        return time.monotonic() - start
+
+    # Two requests a second, the next one is due in half a second.
+    assert 0.45 <= asyncio.run(waiter()) < 0.55
+
+
+def test_higher_priority_runs_first():
+    scheduler = Scheduler({"p": ProviderLimits(max_in_flight=1)})
+    scheduler._acquire("p", DECISION, 1)
+    order = []
+
+    async def call(name, priority):
+        await scheduler._aacquire("p", priority, 1)
+        order.append(name)
+        scheduler._release("p")
+
+    async def main():
+        image = asyncio.create_task(call("image", IMAGE))
+        await asyncio.sleep(0.01)
+        decision = asyncio.create_task(call("decision", DECISION))
+        await asyncio.sleep(0.01)
+        scheduler._release("p")
+        await asyncio.gather(image, decision)
+
+    asyncio.run(main())
+    assert order == ["decision", "image"]
+
+
+def test_cancelled_waiter_gives_up_its_turn():
+    scheduler = Scheduler({"p": ProviderLimits(max_in_flight=1)})
+    scheduler._acquire("p", DECISION, 1)
+
+    async def main():
+        first = asyncio.create_task(scheduler._aacquire("p", DECISION, 1))
+        second = asyncio.create_task(scheduler._aacquire("p", DECISION, 1))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        scheduler._release("p")
+        await asyncio.wait_for(second, 1)
+
+    asyncio.run(main())
+    assert scheduler._wakeups == {}
+    assert scheduler._provider("p").waiting == []
+
+
+def test_interrupted_waiter_gives_up_its_turn():
+    scheduler = Scheduler({"p": ProviderLimits(max_in_flight=1)})
+    scheduler._acquire("p", DECISION, 1)
+
+    def interrupted_wait(timeout=None):
+        raise KeyboardInterrupt
+
+    scheduler._condition.wait = interrupted_wait
+    with pytest.raises(KeyboardInterrupt):
+        scheduler._acquire("p", DECISION, 1)
+    del scheduler._condition.wait
+    assert scheduler._provider("p").waiting == []
+    scheduler._release("p")
+    scheduler._acquire("p", IMAGE, 1)
+
+
+def test_waiter_of_a_closed_loop_is_dropped():
+    scheduler = Scheduler({"p": ProviderLimits(max_in_flight=1)})
+    scheduler._acquire("p", DECISION, 1)
+    # What a waiter left behind looks like once its loop was closed under it.
+    loop = asyncio.new_event_loop()
+    ticket = scheduler._enqueue("p", DECISION)
+    scheduler._wakeups[ticket] = (loop, asyncio.Event())
+    loop.close()
+
+    scheduler._release("p")
+    assert scheduler._wakeups == {}
+    assert scheduler._provider("p").waiting == []
+    scheduler._acquire("p", IMAGE, 1)
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from ai_runtime.cache import DecisionCache
+from ai_runtime.runtime import AIRuntime
+from python_runtime import tracing
+from python_runtime.policy import ProbePolicy
+from python_runtime.probe import probe
+from python_runtime.tracing import (
+    NOOP_SPAN,
+    Histogram,
+    MemoryExporter,
+    OTelJSONFileExporter,
+    Tracer,
+    current_span,
+    set_tracer,
+    span,
+    tracing_enabled,
+)
+
+
+@pytest.fixture
+def exporter():
+    exporter = MemoryExporter()
+    tracer = Tracer(exporter)
+    previous = set_tracer(tracer)
+    yield exporter
+    tracer.close()
+    set_tracer(previous)
+
+
+def test_nested_spans_share_the_trace(exporter):
+    with span("outer", kind="test") as outer:
+        assert current_span() is outer
+        with span("inner") as inner:
+            with span("innermost"):
+                pass
+        with span("sibling"):
+            pass
+    assert current_span() is None
+    tracing.get_tracer().flush()
+
+    assert [s.name for s in exporter.spans] == [
+        "innermost",
+        "inner",
+        "sibling",
+        "outer",
+    ]
+    assert outer.parent_id is None
+    assert {s.trace_id for s in exporter.spans} == {outer.trace_id}
+    assert [s.name for s in exporter.children(outer)] == ["inner", "sibling"]
+    assert [s.name for s in exporter.children(inner)] == ["innermost"]
+    assert outer.attributes == {"kind": "test"}
+    assert outer.end_ns >= inner.end_ns >= inner.start_ns >= outer.start_ns
+
+
+def test_exceptions_mark_the_span_failed(exporter):
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("bad input")
+    tracing.get_tracer().flush()
+    [failing] = exporter.find("failing")
+    assert failing.error == "ValueError: bad input"
+    assert failing.to_otel()["status"] == {
+        "code": 2,
+        "message": "ValueError: bad input",
+    }
+    metrics = tracing.get_tracer().metrics
+    assert metrics.histogram("span.duration", span="failing", ok=False).count == 1
+
+
+def test_threads_start_their_own_traces(exporter):
+    with span("main") as main:
+        thread = threading.Thread(target=lambda: span("worker").end())
+        thread.start()
+        thread.join()
+    tracing.get_tracer().flush()
+    [worker] = exporter.find("worker")
+    assert worker.parent_id is None
+    assert worker.trace_id != main.trace_id
+
+
+def test_tasks_inherit_the_active_span(exporter):
+    async def child(name):
+        with span(name):
+            await asyncio.sleep(0)
+
+    async def main():
+        with span("request"):
+            await asyncio.gather(child("a"), child("b"))
+
+    asyncio.run(main())
+    tracing.get_tracer().flush()
+    [request] = exporter.find("request")
+    assert sorted(s.name for s in exporter.children(request)) == ["a", "b"]
+
+
+def test_probed_call_nests_runtime_spans(exporter, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    runtime = AIRuntime(decision_cache=DecisionCache(), policy=ProbePolicy())
+    runtime._call_model = lambda probed, prompt, prompt_type: json.dumps(
+        {"should_interrupt": False, "should_report": False, "should_stop": False}
+    )
+    numbers = probe([3, 1, 2], "sort numbers", runtime)
+    numbers.sort()
+    tracing.get_tracer().flush()
+
+    [call] = exporter.find("probe.call")
+    assert call.attributes["prefix"] == numbers._prefix + ".sort"
+    assert call.attributes["interrupted"] is False
+    names = {s.name for s in exporter.children(call)}
+    assert {"runtime.prompt", "runtime.parse"} <= names
+    assert all(s.trace_id == call.trace_id for s in exporter.spans)
+
+
+def test_metrics_are_kept_per_attributes(exporter):
+    tracing.add("model.calls", model="a")
+    tracing.add("model.calls", model="a")
+    tracing.add("model.calls", 3, model="b")
+    tracing.record("latency", 7.0, model="a")
+    tracer = tracing.get_tracer()
+    assert tracer.metrics.counter("model.calls", model="a") == 2
+    assert tracer.metrics.counter("model.calls", model="b") == 3
+    assert tracer.metrics.histogram("latency", model="a").count == 1
+    tracer.flush()
+    assert exporter.metrics["counters"]["model.calls"][0]["value"] == 2
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = Histogram((1, 10, 100))
+    for value in (0.5, 5, 5, 50, 500):
+        histogram.record(value)
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.quantile(0.5) == 10
+    assert histogram.quantile(1.0) == 500
+    assert (histogram.min, histogram.max) == (0.5, 500)
+
+
+def test_disabled_tracer_hands_out_the_noop_span():
+    previous = set_tracer(Tracer())
+    try:
+        assert not tracing_enabled()
+        with span("ignored") as ignored:
+            assert ignored is NOOP_SPAN
+            assert current_span() is None
+    finally:
+        set_tracer(previous)
+
+
+def test_otel_file_exporter_writes_spans_and_metrics(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(OTelJSONFileExporter(str(path)))
+    previous = set_tracer(tracer)
+    try:
+        with span("outer"):
+            with span("inner", size=3):
+                pass
+        tracer.close()
+    finally:
+        set_tracer(previous)
+    spans_line, metrics_line = [
+        json.loads(line) for line in path.read_text().splitlines()
+    ]
+    spans = spans_line["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    inner, outer = spans
+    assert inner["parentSpanId"] == outer["spanId"]
+    assert inner["attributes"] == [{"key": "size", "value": {"intValue": "3"}}]
+    metrics = metrics_line["resourceMetrics"][0]["scopeMetrics"][0]["metrics"]
+    assert metrics[0]["name"] == "span.duration"
@@ -0,0 +1,135 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from changeset import COMMITTED, PENDING, ROLLED_BACK, UNDONE, ChangesetError, ChangesetManager
+
+TERMINAL_INPUT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "terminal-input"))
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    root.mkdir()
+    (root / "a.py").write_text("a = 1\n")
+    (root / "b.py").write_text("b = 1\n")
+    return root
+
+
+@pytest.fixture
+def manager(project, tmp_path):
+    return ChangesetManager(project, store_dir=tmp_path / "store")
+
+
+def leftovers(root) -> list:
+    return sorted(path.name for path in root.rglob(".*.tmp"))
+
+
+def test_apply_writes_every_file(project, manager):
+    journal = manager.apply({"a.py": "a = 2\n", "pkg/new.py": "new = 1\n"}, "edit")
+    assert (project / "a.py").read_text() == "a = 2\n"
+    assert (project / "pkg" / "new.py").read_text() == "new = 1\n"
+    assert journal["state"] == COMMITTED
+    assert [entry["path"] for entry in journal["files"]] == ["a.py", "pkg/new.py"]
+    assert journal["files"][1]["before"] is None
+    assert manager.journals()[-1]["state"] == COMMITTED
+    assert leftovers(project) == []
+
+
+def test_apply_keeps_the_file_mode(project, manager):
+    os.chmod(project / "a.py", 0o755)
+    manager.apply({"a.py": "a = 2\n"})
+    assert os.stat(project / "a.py").st_mode & 0o777 == 0o755
+
+
+def test_paths_outside_the_project_are_refused(project, manager):
+    with pytest.raises(ChangesetError):
+        manager.apply({"a.py": "a = 2\n", "../outside.py": "x = 1\n"})
+    assert (project / "a.py").read_text() == "a = 1\n"
+    assert leftovers(project) == []
+    assert manager.journals() == []
+
+
+def test_undo_restores_and_removes_created_files(project, manager):
+    manager.apply({"a.py": "a = 2\n", "new.py": "new = 1\n"})
+    manager.apply({"b.py": "b = 2\n"})
+    undone = manager.undo(2)
+    assert [conflicts for _, conflicts in undone] == [[], []]
+    assert (project / "a.py").read_text() == "a = 1\n"
+    assert (project / "b.py").read_text() == "b = 1\n"
+    assert not (project / "new.py").exists()
+    assert [journal["state"] for journal in manager.journals()] == [UNDONE, UNDONE]
+    # Nothing committed is left to undo.
+    assert manager.undo() == []
+
+
+def test_undo_leaves_files_edited_since(project, manager):
+    manager.apply({"a.py": "a = 2\n", "b.py": "b = 2\n"})
+    (project / "b.py").write_text("b = 3\n")
+    [(journal, conflicts)] = manager.undo()
+    assert conflicts == ["b.py"]
+    assert (project / "a.py").read_text() == "a = 1\n"
+    assert (project / "b.py").read_text() == "b = 3\n"
+    assert journal["conflicts"] == ["b.py"]
+
+
+def test_failed_commit_is_rolled_back(project, manager, monkeypatch):
+    real_replace = os.replace
+    renamed = []
+
+    def replace(source, target):
+        # The journal is renamed into place too; fail on the second project file.
+        if str(target).startswith(str(project)):
+            renamed.append(target)
+            if len(renamed) == 2:
+                raise OSError("disk full")
+        real_replace(source, target)
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        manager.apply({"a.py": "a = 2\n", "b.py": "b = 2\n"})
+    monkeypatch.undo()
+    assert (project / "a.py").read_text() == "a = 1\n"
+    assert (project / "b.py").read_text() == "b = 1\n"
+    assert leftovers(project) == []
+    assert manager.journals()[-1]["state"] == ROLLED_BACK
+
+
+def test_recover_after_a_crash_during_commit(project, manager, tmp_path):
+    # Dies for real after the first project file was renamed into place.
+    script = textwrap.dedent(
+        f"""
+        import os, sys
+        sys.path.insert(0, {TERMINAL_INPUT!r})
+        from changeset import ChangesetManager
+
+        real_replace = os.replace
+        renamed = []
+
+        def replace(source, target):
+            if str(target).startswith({str(project)!r}):
+                renamed.append(target)
+                if len(renamed) == 2:
+                    os._exit(3)
+            real_replace(source, target)
+
+        os.replace = replace
+        manager = ChangesetManager({str(project)!r}, store_dir={str(tmp_path / "store")!r})
+        manager.apply({{"a.py": "a = 2\\n", "b.py": "b = 2\\n", "new.py": "new = 1\\n"}})
+        """
+    )
+    assert subprocess.run([sys.executable, "-c", script]).returncode == 3
+    assert (project / "a.py").read_text() == "a = 2\n"
+    assert manager.journals()[-1]["state"] == PENDING
+    assert leftovers(project) != []
+
+    [journal] = manager.recover()
+    assert journal["state"] == ROLLED_BACK
+    assert (project / "a.py").read_text() == "a = 1\n"
+    assert (project / "b.py").read_text() == "b = 1\n"
+    assert not (project / "new.py").exists()
+    assert leftovers(project) == []
+    assert manager.recover() == []
@@ -0,0 +1,80 @@
+from collections import Counter
+
+from context_select import ContextSelector, tokenize
+
+
+class FakeIndex:
+    """The parts of ProjectIndex the selector reads."""
+
+    def __init__(self, files: dict):
+        self.entries = {}
+        self.order = []
+        for rel_path, text in files.items():
+            self.set(rel_path, text)
+
+    def set(self, rel_path: str, text: str):
+        if rel_path not in self.entries:
+            self.order.append(rel_path)
+        self.entries[rel_path] = {
+            "hash": hash(text),
+            "section": f"=== {rel_path} ===\n{text}\n",
+        }
+
+    def remove(self, rel_path: str):
+        del self.entries[rel_path]
+        self.order.remove(rel_path)
+
+    def section(self, rel_path: str) -> str:
+        return self.entries[rel_path]["section"]
+
+
+def expected_frequency(index: FakeIndex) -> Counter:
+    frequency = Counter()
+    for entry in index.entries.values():
+        body = entry["section"].split("\n", 1)[1]
+        frequency.update(set(tokenize(body)))
+    return frequency
+
+
+def test_document_frequency_follows_changes():
+    index = FakeIndex(
+        {
+            "a.py": "def parse_config(path): return open(path)",
+            "b.py": "def render_page(template): return template",
+            "c.py": "def parse_page(html): return html",
+        }
+    )
+    selector = ContextSelector()
+    selector.update(index)
+    assert selector.document_frequency == expected_frequency(index)
+
+    index.remove("a.py")
+    index.set("c.py", "def render_table(rows): return rows")
+    selector.update(index)
+    assert selector.document_frequency == expected_frequency(index)
+    # Terms no file uses anymore are gone, not kept with a zero count.
+    assert "config" not in selector.document_frequency
+    assert all(count > 0 for count in selector.document_frequency.values())
+
+
+def test_select_ranks_matching_files_first():
+    index = FakeIndex(
+        {
+            "parser.py": "def parse_config(path):\n    return load(path)",
+            "render.py": "def render_page(template):\n    return template",
+            "notes.txt": "nothing related here",
+        }
+    )
+    selector = ContextSelector()
+    context, included = selector.select(index, "fix parse_config")
+    assert included == ["parser.py"]
+    assert "parse_config" in context
+
+
+def test_select_stays_within_the_budget():
+    lines = "\n".join(f"value_{i} = compute_total({i})" for i in range(400))
+    index = FakeIndex({"big.py": lines, "small.py": "total = compute_total(1)"})
+    selector = ContextSelector()
+    context, included = selector.select(index, "compute_total", token_budget=200)
+    assert len(context) // 4 <= 200
+    assert "big.py" in included or "small.py" in included
@@ -0,0 +1,113 @@
+from file_scanner import FileScanner, IgnoreRules
+
+
+def make_tree(root, files: dict):
+    for rel_path, content in files.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            path.write_text(content)
+
+
+def scanned(root, **kwargs) -> list:
+    return [file.rel_path for file in FileScanner(root, **kwargs).iter_files()]
+
+
+def test_negation_reincludes_a_file(tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            ".gitignore": "*.log\n!keep.log\n",
+            "app.py": "",
+            "debug.log": "",
+            "keep.log": "",
+        },
+    )
+    assert scanned(tmp_path) == ["app.py", "keep.log"]
+
+
+def test_last_matching_rule_wins():
+    rules = IgnoreRules("", ["!important.txt", "*.txt"])
+    assert rules.match("important.txt", False) is True
+    rules = IgnoreRules("", ["*.txt", "!important.txt"])
+    assert rules.match("important.txt", False) is False
+    assert rules.match("other.py", False) is None
+
+
+def test_nested_gitignore_overrides_for_its_subtree(tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            ".gitignore": "*.json\n",
+            "config.json": "",
+            "data/.gitignore": "!settings.json\n",
+            "data/settings.json": "",
+            "data/other.json": "",
+        },
+    )
+    assert scanned(tmp_path) == ["data/settings.json"]
+
+
+def test_directory_patterns_and_anchors(tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            ".gitignore": "build/\n/top.txt\ndocs/**/*.md\n",
+            "build/out.py": "",
+            "src/build": "a file, not a directory",
+            "top.txt": "",
+            "src/top.txt": "",
+            "docs/a/b/page.md": "",
+            "docs/readme.txt": "",
+        },
+    )
+    assert scanned(tmp_path) == ["docs/readme.txt", "src/build", "src/top.txt"]
+
+
+def test_project_ignore_file_applies_without_git(tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            ".marionetteignore": "secrets/\n",
+            ".gitignore": "*.py\n",
+            "secrets/key.txt": "",
+            "main.py": "",
+        },
+    )
+    assert scanned(tmp_path, use_gitignore=False) == ["main.py"]
+
+
+def test_runtime_files_are_skipped(tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            "main.py": "",
+            "report.jsonl": "",
+            "report.jsonl.1": "",
+            "report.jsonl.3": "",
+            "probe_policy.json": "",
+            "probe_policy.json.tmp": "",
+            "decision_cache.sqlite3": "",
+            "decision_cache.sqlite3-wal": "",
+            "reporting.py": "",
+        },
+    )
+    assert scanned(tmp_path) == ["main.py", "reporting.py"]
+
+
+def test_hidden_junk_and_binary_files_are_skipped(tmp_path):
+    make_tree(
+        tmp_path,
+        {
+            ".env": "",
+            "node_modules/lib.js": "",
+            "env/pyvenv.cfg": "",
+            "env/lib.py": "",
+            "image.dat": b"\x89PNG\0\0",
+            "main.py": "",
+        },
+    )
+    assert scanned(tmp_path, skip_binary=True) == ["main.py"]
+    assert scanned(tmp_path) == ["image.dat", "main.py"]
@@ -0,0 +1,128 @@
+import asyncio
+from types import SimpleNamespace
+
+import gemini_session
+from gemini_session import MIN_CACHE_TOKENS, GeminiSession
+
+LARGE_PREFIX = "project files " * MIN_CACHE_TOKENS
+SMALL_PREFIX = "tiny project"
+
+
+class FakeCaches:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.created = []
+        self.deleted = []
+
+    async def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("caching is not available for this model")
+        name = f"cachedContents/{len(self.created)}"
+        self.created.append((name, config.contents[0].parts[0].text))
+        return SimpleNamespace(name=name)
+
+    async def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeModels:
+    def __init__(self):
+        self.requests = []
+
+    async def generate_content_stream(self, model, contents, config):
+        self.requests.append((contents, config))
+
+        async def chunks():
+            yield SimpleNamespace(text="answer to ")
+            yield SimpleNamespace(text=contents[-10:])
+
+        return chunks()
+
+
+class FakeClient:
+    """Stands in for genai.Client, recording what would be sent."""
+
+    def __init__(self, fail_caching: bool = False):
+        self.aio = SimpleNamespace(caches=FakeCaches(fail_caching), models=FakeModels())
+
+
+def ask(session: GeminiSession, prefix: str, message: str) -> tuple:
+    async def run():
+        refreshed = await session.prepare(prefix)
+        text = "".join([chunk.text async for chunk in await session.send_message_stream(message)])
+        return refreshed, text
+
+    return asyncio.run(run())
+
+
+def test_large_prefix_is_cached_once():
+    client = FakeClient()
+    session = GeminiSession(client=client)
+    assert ask(session, LARGE_PREFIX, "first request") == (True, "answer to st request")
+    assert ask(session, LARGE_PREFIX, "second request") == (False, "answer to nd request")
+    assert client.aio.caches.created == [("cachedContents/0", LARGE_PREFIX)]
+    requests = client.aio.models.requests
+    assert [contents for contents, _ in requests] == ["first request", "second request"]
+    assert all(config.cached_content == "cachedContents/0" for _, config in requests)
+
+
+def test_follow_ups_send_only_their_own_delta():
+    client = FakeClient()
+    session = GeminiSession(client=client)
+    for i in range(12):
+        ask(session, LARGE_PREFIX, f"<additional_project_files>{'x' * 1000}</additional_project_files> {i}")
+    sizes = [len(contents) for contents, _ in client.aio.models.requests]
+    # Earlier requests and responses are never sent again.
+    assert max(sizes) - min(sizes) <= 1
+    assert len(client.aio.caches.created) == 1
+
+
+def test_changed_prefix_refreshes_the_cache():
+    client = FakeClient()
+    session = GeminiSession(client=client)
+    ask(session, LARGE_PREFIX, "first")
+    assert ask(session, LARGE_PREFIX + "changed file", "second")[0] is True
+    assert [name for name, _ in client.aio.caches.created] == ["cachedContents/0", "cachedContents/1"]
+    assert client.aio.caches.deleted == ["cachedContents/0"]
+    assert client.aio.models.requests[-1][1].cached_content == "cachedContents/1"
+
+
+def test_expiring_cache_is_refreshed(monkeypatch):
+    client = FakeClient()
+    session = GeminiSession(client=client, cache_ttl=3600)
+    now = [1000.0]
+    monkeypatch.setattr(gemini_session.time, "monotonic", lambda: now[0])
+    ask(session, LARGE_PREFIX, "first")
+    now[0] += 3600 - gemini_session.CACHE_MARGIN_SECONDS + 1
+    assert ask(session, LARGE_PREFIX, "second")[0] is True
+    assert len(client.aio.caches.created) == 2
+    assert client.aio.caches.deleted == ["cachedContents/0"]
+
+
+def test_small_prefix_is_sent_inline():
+    client = FakeClient()
+    session = GeminiSession(client=client)
+    ask(session, SMALL_PREFIX, "first")
+    ask(session, SMALL_PREFIX, "second")
+    assert client.aio.caches.created == []
+    requests = client.aio.models.requests
+    assert [contents for contents, _ in requests] == [f"{SMALL_PREFIX}\n\nfirst", f"{SMALL_PREFIX}\n\nsecond"]
+    assert all(config.cached_content is None for _, config in requests)
+    assert requests[0][1].system_instruction == session.system_instruction
+
+
+def test_failed_caching_falls_back_to_inline():
+    client = FakeClient(fail_caching=True)
+    session = GeminiSession(client=client)
+    ask(session, LARGE_PREFIX, "first")
+    assert session.cache_name is None
+    assert client.aio.models.requests[0][0] == f"{LARGE_PREFIX}\n\nfirst"
+
+
+def test_close_deletes_the_cache():
+    client = FakeClient()
+    session = GeminiSession(client=client)
+    ask(session, LARGE_PREFIX, "first")
+    asyncio.run(session.close())
+    assert client.aio.caches.deleted == ["cachedContents/0"]
+    assert session.cache_name is None
@@ -0,0 +1,93 @@
+import pytest
+
+from patch_apply import PatchError, apply_block, apply_blocks, parse_blocks
+
+TWO_FUNCTIONS = """def first():
+    x = 1
+    return x
+
+
+def second():
+    x = 1
+    return x
+"""
+
+
+def test_exact_match():
+    content, how = apply_block("a = 1\nb = 2\n", "b = 2\n", "b = 3\n")
+    assert (content, how) == ("a = 1\nb = 3\n", "exact")
+
+
+def test_ambiguous_exact_match_is_refused():
+    with pytest.raises(PatchError, match="match 2 places"):
+        apply_block(TWO_FUNCTIONS, "    x = 1\n    return x\n", "    return 2\n")
+
+
+def test_context_makes_a_match_unique():
+    content, how = apply_block(
+        TWO_FUNCTIONS,
+        "def second():\n    x = 1\n    return x\n",
+        "def second():\n    return 2\n",
+    )
+    assert how == "exact"
+    assert content.startswith("def first():\n    x = 1\n")
+    assert content.endswith("def second():\n    return 2\n")
+
+
+def test_whitespace_match_reindents_the_replacement():
+    content = "class A:\n    def f(self):\n        return 1\n"
+    new, how = apply_block(content, "def f(self):\n    return 1\n", "def f(self):\n    return 2\n")
+    assert how == "whitespace"
+    assert new == "class A:\n    def f(self):\n        return 2\n"
+
+
+def test_ambiguous_whitespace_match_is_refused():
+    content = "if a:\n    go()\nif b:\n        go()\n"
+    with pytest.raises(PatchError, match=r"match 2 places \(whitespace\)"):
+        apply_block(content, "go()\n", "stop()\n")
+
+
+def test_fuzzy_match():
+    content = "def total(items):\n    result = sum(item.price for item in items)\n    return result\n"
+    search = "def total(items):\n    result = sum(item.price for item in item)\n    return result\n"
+    new, how = apply_block(content, search, "def total(items):\n    return 0\n")
+    assert how.startswith("fuzzy")
+    assert new == "def total(items):\n    return 0\n"
+
+
+def test_ambiguous_fuzzy_match_is_refused():
+    content = (
+        "def load_users(path):\n    data = read_json(path)\n    return data\n\n"
+        "def load_groups(path):\n    data = read_json(path)\n    return data\n"
+    )
+    search = "def load_user(path):\n    data = read_json(path)\n    return data\n"
+    with pytest.raises(PatchError, match=r"match 2 places \(fuzzy"):
+        apply_block(content, search, "pass\n")
+
+
+def test_missing_lines_are_reported():
+    with pytest.raises(PatchError, match="Could not find"):
+        apply_block("a = 1\n", "something else entirely\n", "b = 2\n")
+
+
+def test_empty_search_inserts_at_the_top():
+    assert apply_block("a = 1\n", "", "import os\n") == ("import os\na = 1\n", "insert")
+
+
+def test_blocks_apply_in_order():
+    content, matches = apply_blocks("a = 1\n", [("a = 1\n", "a = 2\n"), ("a = 2\n", "a = 3\n")])
+    assert content == "a = 3\n"
+    assert matches == ["exact", "exact"]
+
+
+def test_parse_blocks_follows_file_headers():
+    text = (
+        "File (one.py):\n<<<<<<< SEARCH\na\n=======\nb\n>>>>>>> REPLACE\n"
+        "<<<<<<< SEARCH\nc\n=======\nd\n>>>>>>> REPLACE\n"
+        "File (two.py):\n<<<<<<< SEARCH\ne\n=======\nf\n>>>>>>> REPLACE\n"
+        "File (three.py):\n<<<<<<< SEARCH\nunfinished"
+    )
+    blocks, position, filename = parse_blocks(text)
+    assert blocks == [("one.py", "a\n", "b\n"), ("one.py", "c\n", "d\n"), ("two.py", "e\n", "f\n")]
+    assert text[position:].startswith("\nFile (three.py)")
+    assert filename == "two.py"
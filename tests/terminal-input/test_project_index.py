@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from project_index import MAX_FILE_CHARS, ProjectIndex, format_section
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    root.mkdir()
+    (root / "a.py").write_text("print('a')\n")
+    (root / "b.py").write_text("print('b')\n")
+    return root
+
+
+def make_index(project, tmp_path):
+    return ProjectIndex(project, cache_dir=tmp_path / "cache", workers=2)
+
+
+def touch(path, text=None, mtime_ns=None):
+    """Rewrite path if text is given, then move its mtime so the change is seen"""
+    if text is not None:
+        path.write_text(text)
+    mtime_ns = mtime_ns or os.stat(path).st_mtime_ns + 1_000_000_000
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_unchanged_files_are_not_read_again(project, tmp_path):
+    index = make_index(project, tmp_path)
+    assert index.refresh(["a.py", "b.py"]) == {"files": 2, "read": 2, "changed": 2, "removed": 0}
+    context = index.context()
+    assert context == "=== a.py ===\nprint('a')\n\n\n=== b.py ===\nprint('b')\n\n"
+    assert index.refresh(["a.py", "b.py"]) == {"files": 2, "read": 0, "changed": 0, "removed": 0}
+    assert index.context() is context
+
+
+def test_touched_file_with_the_same_content_keeps_the_context(project, tmp_path):
+    index = make_index(project, tmp_path)
+    index.refresh(["a.py", "b.py"])
+    context = index.context()
+    touch(project / "a.py")
+    assert index.refresh(["a.py", "b.py"])["read"] == 1
+    assert index.last_stats["changed"] == 0
+    assert index.context() is context
+
+
+def test_changed_and_removed_files_update_the_context(project, tmp_path):
+    index = make_index(project, tmp_path)
+    index.refresh(["a.py", "b.py"])
+    # Same size, only the mtime tells the change apart
+    touch(project / "a.py", "print('A')\n")
+    assert index.refresh(["a.py", "b.py"])["changed"] == 1
+    assert "print('A')" in index.context()
+    assert index.refresh(["a.py"])["removed"] == 1
+    assert index.context() == "=== a.py ===\nprint('A')\n\n"
+    assert set(index.entries) == {"a.py"}
+
+
+def test_new_order_rebuilds_the_context(project, tmp_path):
+    index = make_index(project, tmp_path)
+    index.refresh(["a.py", "b.py"])
+    index.refresh(["b.py", "a.py"])
+    assert index.context().startswith("=== b.py ===")
+
+
+def test_saved_index_starts_warm(project, tmp_path):
+    index = make_index(project, tmp_path)
+    index.refresh(["a.py", "b.py"])
+    index.save()
+    assert not any(path.name.startswith("index-") for path in project.iterdir())
+    warm = make_index(project, tmp_path)
+    assert warm.refresh(["a.py", "b.py"])["read"] == 0
+    assert warm.context() == index.context()
+
+
+def test_index_of_another_root_is_ignored(project, tmp_path):
+    index = make_index(project, tmp_path)
+    index.refresh(["a.py"])
+    index.save()
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "a.py").write_text("print('other')\n")
+    assert make_index(other, tmp_path).refresh(["a.py"])["read"] == 1
+
+
+def test_unreadable_files_are_read_again(project, tmp_path):
+    index = make_index(project, tmp_path)
+    index.refresh(["missing.py"])
+    assert "[Error reading file:" in index.section("missing.py")
+    (project / "missing.py").write_text("x = 1\n")
+    assert index.refresh(["missing.py"])["changed"] == 1
+    assert index.section("missing.py") == "=== missing.py ===\nx = 1\n\n"
+
+
+def test_sections_match_text_reads():
+    assert format_section("a.txt", b"one\r\ntwo\rthree") == "=== a.txt ===\none\ntwo\nthree\n"
+    assert format_section("a.bin", b"\xff\xfe\x00") == "=== a.bin ===\n[Binary or inaccessible file]\n"
+    assert format_section("a.txt", None, PermissionError()) == "=== a.txt ===\n[Binary or inaccessible file]\n"
+    section = format_section("big.txt", b"x" * (MAX_FILE_CHARS + 10))
+    assert section.endswith(f"... (file truncated, total length: {MAX_FILE_CHARS + 10} chars)\n")
@@ -0,0 +1,91 @@
+import random
+
+from section_stream import SectionStreamParser
+
+RESPONSE = (
+    "Here are the changes.\n\n"
+    "File (app/models.py):\n"
+    "<<<<<<< SEARCH\n"
+    "class User:\n"
+    "    pass\n"
+    "=======\n"
+    "class User:\n"
+    "    name = ''\n"
+    ">>>>>>> REPLACE\n"
+    "<<<<<<< SEARCH\n"
+    "x = 1\n"
+    "=======\n"
+    "x = 2\n"
+    ">>>>>>> REPLACE\n\n"
+    "File (README.md):\n"
+    "<<<<<<< SEARCH\n"
+    "# Old title\n"
+    "=======\n"
+    "# New title\n"
+    ">>>>>>> REPLACE\n"
+    "Done.\n"
+)
+
+EXPECTED = [
+    {"filename": "app/models.py", "search": "class User:\n    pass\n", "replace": "class User:\n    name = ''\n"},
+    {"filename": "app/models.py", "search": "x = 1\n", "replace": "x = 2\n"},
+    {"filename": "README.md", "search": "# Old title\n", "replace": "# New title\n"},
+]
+
+
+def stream(chunks):
+    parser = SectionStreamParser()
+    sections = []
+    for chunk in chunks:
+        sections.extend(parser.feed(chunk))
+    sections.extend(parser.finish())
+    return parser, sections
+
+
+def test_whole_response_at_once():
+    parser, sections = stream([RESPONSE])
+    assert sections == EXPECTED
+    assert parser.sections == EXPECTED
+
+
+def test_every_split_point_gives_the_same_sections():
+    for cut in range(1, len(RESPONSE)):
+        assert stream([RESPONSE[:cut], RESPONSE[cut:]])[1] == EXPECTED, cut
+
+
+def test_random_chunkings_give_the_same_sections():
+    generator = random.Random(16)
+    for _ in range(200):
+        cuts = sorted(generator.sample(range(1, len(RESPONSE)), generator.randint(2, 40)))
+        chunks = [RESPONSE[start:end] for start, end in zip([0] + cuts, cuts + [len(RESPONSE)])]
+        assert stream(chunks)[1] == EXPECTED
+
+
+def test_blocks_are_returned_as_soon_as_they_close():
+    parser = SectionStreamParser()
+    first_end = RESPONSE.index(">>>>>>> REPLACE") + len(">>>>>>> REPLACE")
+    assert parser.feed(RESPONSE[:first_end - 1]) == []
+    assert parser.feed(RESPONSE[first_end - 1:first_end]) == EXPECTED[:1]
+    # Only the unparsed tail is kept around
+    assert parser.buffer == ""
+    assert parser.feed(RESPONSE[first_end:]) == EXPECTED[1:]
+
+
+def test_full_file_format_is_parsed_at_the_end():
+    response = (
+        "Original file (a.py):\nx = 1\n\n"
+        "Modified file (a.py):\nx = 2\n\n"
+        "Original file (b.py):\ny = 1\n\n"
+        "Modified file (b.py):\ny = 2\n"
+    )
+    parser = SectionStreamParser()
+    assert [section for i in range(0, len(response), 7) for section in parser.feed(response[i:i + 7])] == []
+    assert parser.finish() == [
+        {"filename": "a.py", "original": "x = 1", "modified": "x = 2"},
+        {"filename": "b.py", "original": "y = 1", "modified": "y = 2"},
+    ]
+
+
+def test_full_file_format_is_ignored_after_blocks():
+    parser, sections = stream([RESPONSE + "\nOriginal file (c.py):\na\n\nModified file (c.py):\nb\n"])
+    assert sections == EXPECTED
@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+from tailer import FileTailer
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "polling"])
+def use_inotify(request):
+    return request.param
+
+
+def append(path, text):
+    with open(path, "a") as file:
+        file.write(text)
+
+
+def rewrite(path, text):
+    with open(path, "w") as file:
+        file.write(text)
+
+
+def test_returns_only_new_records(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"a":1}\n{"a":2}\n')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    assert tailer.read_records() == ['{"a":1}', '{"a":2}']
+    assert tailer.read_records() == []
+    append(path, '{"a":3}\n')
+    assert tailer.read_records() == ['{"a":3}']
+    assert tailer.offset == os.path.getsize(path)
+    tailer.close()
+
+
+def test_partial_records_wait_for_their_separator(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"a":')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    assert tailer.read_records() == []
+    append(path, '1}\n{"b"')
+    assert tailer.read_records() == ['{"a":1}']
+    append(path, ":2}\n")
+    assert tailer.read_records() == ['{"b":2}']
+    tailer.close()
+
+
+def test_start_at_end_skips_existing_records(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"a":1}\n')
+    tailer = FileTailer(path, start_at_end=True, use_inotify=use_inotify)
+    assert tailer.read_records() == []
+    append(path, '{"a":2}\n')
+    assert tailer.read_records() == ['{"a":2}']
+    tailer.close()
+
+
+def test_rotation_drains_the_old_file(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"a":1}\n')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    assert tailer.read_records() == ['{"a":1}']
+    append(path, '{"a":2}\n')
+    os.replace(path, tmp_path / "report.jsonl.1")
+    append(path, '{"b":1}\n')
+    assert tailer.read_records() == ['{"a":2}', '{"b":1}']
+    tailer.close()
+
+
+def test_truncated_to_a_smaller_size(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"a":1}\n{"a":2}\n')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    tailer.read_records()
+    rewrite(path, '{"b":1}\n')
+    assert tailer.read_records() == ['{"b":1}']
+    tailer.close()
+
+
+def test_truncated_and_rewritten_to_the_same_size(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"d":1}\n')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    assert tailer.read_records() == ['{"d":1}']
+    rewrite(path, '{"d":4}\n')
+    assert tailer.read_records() == ['{"d":4}']
+    tailer.close()
+
+
+def test_truncated_and_rewritten_past_the_old_offset(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    append(path, '{"d":1}\n')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    tailer.read_records()
+    rewrite(path, '{"e":1}\n{"e":2}\n')
+    assert tailer.read_records() == ['{"e":1}', '{"e":2}']
+    tailer.close()
+
+
+def test_appends_past_the_head_are_not_a_rewrite(tmp_path, use_inotify):
+    path = tmp_path / "report.jsonl"
+    # The first record is still being written when it is first seen.
+    append(path, '{"long":"')
+    tailer = FileTailer(path, use_inotify=use_inotify)
+    assert tailer.read_records() == []
+    append(path, "x" * 100 + '"}\n')
+    append(path, '{"a":1}\n')
+    assert tailer.read_records() == ['{"long":"' + "x" * 100 + '"}', '{"a":1}']
+    append(path, '{"a":2}\n')
+    assert tailer.read_records() == ['{"a":2}']
+    tailer.close()
+
+
+def test_inotify_reports_changes(tmp_path):
+    path = tmp_path / "report.jsonl"
+    tailer = FileTailer(path)
+    if tailer.fileno() is None:
+        pytest.skip("inotify is not available")
+    assert not tailer.has_changes()
+    append(tmp_path / "other.txt", "x")
+    assert not tailer.has_changes()
+    append(path, '{"a":1}\n')
+    assert tailer.has_changes()
+    assert tailer.read_records() == ['{"a":1}']
+    tailer.close()